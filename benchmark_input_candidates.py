@@ -0,0 +1,88 @@
+"""
+Micro-benchmark of the candidates preparation for vacancy search on a synthetic sheet.
+Compares the former per-cell implementation (applymap / apply(axis=1)) with
+prepare_candidates_for_vacancy_search and checks that both give the same DataFrame.
+
+    python benchmark_input_candidates.py [rows ...]
+"""
+import random
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.candidate_matching.candidates_processing.input_candidates import VACANCY_SEARCH_COLUMNS, \
+    clean_and_extract_first_word, extract_currency, extract_numeric_value, prepare_candidates_for_vacancy_search
+
+
+def make_synthetic_sheet(rows: int, seed: int = 0) -> pd.DataFrame:
+    generator = random.Random(seed)
+    names = ["Anna", "Bohdan", "Chris-Jan", "Dmytro", "Ewa", "Ferhat", "Ołena", ""]
+    technologies = ["Python - 5", "Django - 3", "React", "AWS - 2", "Kubernetes", "PostgreSQL - 4", "Go"]
+    rates = ["$25", "€30,5", "32", "", "$18.75", "n/a"]
+    columns = {column: [""] * rows for column in VACANCY_SEARCH_COLUMNS}
+    for index in range(rows):
+        columns['First Name'][index] = generator.choice(names)
+        columns['Last Name'][index] = generator.choice(names) + " Jr."
+        columns['LVL of engagement'][index] = generator.choice(["🔓Ready to work with", "💬In Talks", ""])
+        columns['Seniority'][index] = generator.choice(["Junior", "Middle", "Senior"])
+        columns['Main Roles'][index] = generator.choice(["Backend Developer", "Data Scientist", ""])
+        columns['Stack'][index] = "\n".join(generator.sample(technologies, generator.randint(0, 4)))
+        columns['Languages'][index] = generator.choice(["English B2", "English C1, Ukrainian C2", ""])
+        columns['Location'][index] = generator.choice(["🇺🇦Ukraine", "🇵🇱Poland", ""])
+        columns['Entry wage rate (EWR)'][index] = generator.choice(rates)
+        columns['Sell rate'][index] = generator.choice(rates)
+    df = pd.DataFrame(columns)
+    df['Row in Spreadsheets'] = np.arange(2, rows + 2)
+    return df
+
+
+def legacy_prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The preparation as get_df_for_vacancy_search did it before, without the engagement filter.
+    """
+    df = df.copy()
+    df['Full Name'] = df.apply(lambda row: f"{clean_and_extract_first_word(row['First Name'])} {clean_and_extract_first_word(row['Last Name'])}", axis=1)
+    df['Role'] = df['Main Roles']
+    df.drop(columns=['Main Roles', 'Additional Roles'], inplace=True)
+    df['sell_rate_numeric'] = df['Sell rate'].apply(extract_numeric_value)
+    df['ewr_numeric'] = df['Entry wage rate (EWR)'].apply(extract_numeric_value)
+    df['ewr_currency'] = df['Entry wage rate (EWR)'].apply(extract_currency)
+    df['margin_numeric'] = (df['sell_rate_numeric'] - df['ewr_numeric']).round(2)
+    df['margin'] = df.apply(
+        lambda row: f"≈{row['ewr_currency']}{row['margin_numeric']:.2f}/hr"
+        if pd.notnull(row['margin_numeric']) and pd.notnull(row['ewr_currency']) else "_",
+        axis=1
+    )
+    df = df.drop(['sell_rate_numeric', 'ewr_numeric', 'ewr_currency', 'margin_numeric'], axis=1)
+    df = df[~((df['Role'] == '') & (df['Stack'] == ''))]
+    df = df[~((df['First Name'] == '') | (df['Last Name'] == ''))]
+    df['Stack'] = df['Stack'].apply(lambda x: re.sub(r'\s*-\s*\d+', '', str(x)) if pd.notnull(x) else x)
+    df = df.map(lambda x: '_' if isinstance(x, str) and x == '' else x)
+    df = df.map(lambda x: x.replace('\n', ', ') if isinstance(x, str) else x)
+    return df
+
+
+def best_time(function, df: pd.DataFrame, repeat: int = 3) -> float:
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function(df)
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def main(sizes):
+    for rows in sizes:
+        df = make_synthetic_sheet(rows)
+        pd.testing.assert_frame_equal(legacy_prepare(df), prepare_candidates_for_vacancy_search(df))
+        legacy_time = best_time(legacy_prepare, df)
+        vectorized_time = best_time(prepare_candidates_for_vacancy_search, df)
+        print(f"{rows:>7} rows: per-cell {legacy_time * 1000:8.1f} ms, vectorized {vectorized_time * 1000:7.1f} ms, "
+              f"x{legacy_time / vectorized_time:.1f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [5_000, 50_000])
@@ -20,6 +20,7 @@ warnings.simplefilter(action='ignore', category=RuntimeWarning)
 
 # from src.bot.bot import application
 from src.schedule import setup_scheduler
+from src.google_services.write_queue import sheet_write_queue
 
 async def shutdown(application, auth_manager, scheduler=None):
     print('Shutting down gracefully...')
@@ -33,6 +34,8 @@ async def shutdown(application, auth_manager, scheduler=None):
     finally:
         if scheduler is not None:
             scheduler.shutdown()
+        # Rows that cannot be written now stay in the journal for the next start
+        await asyncio.to_thread(sheet_write_queue.flush)
         await application.shutdown()
         print('Shutdown complete')
 
@@ -56,9 +56,9 @@ class UserAuthorizationManager:
 
     async def add_user(self, user, password, update):
         if password and password.lower() in self.passwords:
-            # with self.lock:
             chat_id = update.effective_chat.id
-            self.authorized_users[user] = chat_id
+            with self.lock:
+                self.authorized_users[user] = chat_id
             print("chat_id = ", self.authorized_users[user])
             await update.message.reply_text("Hey! Glad you're here!")
             # return True
@@ -67,34 +67,35 @@ class UserAuthorizationManager:
     async def remove_user(self, user, word, update):
         if word.lower().strip() == "logout":
             with self.lock:
-                if user in self.authorized_users:
-                    chat_id = self.authorized_users.pop(user)
-                    await update.message.reply_text("Bye bye! See you soon!")
+                chat_id = self.authorized_users.pop(user, None)
+            if chat_id is not None:
+                await update.message.reply_text("Bye bye! See you soon!")
             return True
         return False
 
     async def is_user_authorized(self, user, text, update):
+        # Updates are handled concurrently, so the lock only guards the dict and is never held across an await
         with self.lock:
-            if user in self.authorized_users:
-                print(f"authorized {user} have send: ({text})")
-                if text and text.lower() in self.passwords:
-                    await update.message.reply_text("You are already authorized")
-                    return False
-                return True
-            else:
-                print(f"NOT authorized {user} have send: ({text})")
-                if text and text.lower() in self.passwords:
-                    return await self.add_user(user, text, update)
+            is_authorized = user in self.authorized_users
+        if is_authorized:
+            print(f"authorized {user} have send: ({text})")
+            if text and text.lower() in self.passwords:
+                await update.message.reply_text("You are already authorized")
                 return False
+            return True
+        else:
+            print(f"NOT authorized {user} have send: ({text})")
+            if text and text.lower() in self.passwords:
+                return await self.add_user(user, text, update)
+            return False
 
 
     async def reset_authorized_users(self):
         with self.lock:
-            users_to_notify = self.authorized_users.copy()
-            for user in users_to_notify:
-                if user != 'irina_199':
-                    chat_id = self.authorized_users.pop(user)
-                    await self.send_logout_message(user, chat_id)
+            users_to_notify = {user: self.authorized_users.pop(user)
+                               for user in list(self.authorized_users) if user != 'irina_199'}
+        for user, chat_id in users_to_notify.items():
+            await self.send_logout_message(user, chat_id)
 
 
 
@@ -3,8 +3,9 @@ from datetime import datetime
 
 from tzlocal import get_localzone
 
-from src.bot.classifier import classify_text
+from src.bot.classifier import classify_text_async
 from src.candidate_matching.matcher import process_vacancy
+from src.cv_parsing.bulk_ingestion import process_bulk_cvs
 from src.cv_parsing.cv_parser import process_cv
 from src.database_search.candidates_search import process_names
 from src.leadgen.tg_external_bots.RDNKLeadBot import find_lead_pattern, parse_lead_text, process_lead
@@ -14,7 +15,7 @@ from src.google_services.drive import extract_text_from_google_file, extract_tex
 from src.google_services.drive_authorization import start_google_drive_auth, handle_oauth_callback
 
 from src.logger import logger
-from src.data_processing.nlp.llm_handler import LLMHandler
+from src.data_processing.nlp.llm_handler import AsyncLLMHandler, close_async_openai_clients
 from src.bot.authorization import auth_manager
 from src.leadgen.leadgen_reminder import leadgen_reminder
 
@@ -31,6 +32,9 @@ import logging
 
 logging.getLogger("pdfminer.pdffont").setLevel(logging.ERROR)
 
+# One handler for all updates: requests share the pooled async OpenAI client of the bot event loop
+llm_handler = AsyncLLMHandler()
+
 
 async def extract_text_from_document(document):
     try:
@@ -82,7 +86,6 @@ async def process_user_request(update: Update, context: ContextTypes.DEFAULT_TYP
                     return
 
         if await auth_manager.is_user_authorized(user_name, text, update):
-            llm_handler = LLMHandler()
             if update.message.document is not None:
                 text, file_path = await extract_text_from_document(update.message.document)
                 text = text if message is None else f"Additional message from user: {message}\n\n {text}"
@@ -92,13 +95,14 @@ async def process_user_request(update: Update, context: ContextTypes.DEFAULT_TYP
                 await update.message.reply_text("The message contains '#available'.")
                 return
             elif "/folders/" in text :
-                await send_answer_message(update, "You have sent a link to a folder.")
+                # A folder link is a bench of CVs, they are parsed and added to the staff sheet in bulk
+                await process_bulk_cvs(update, text.strip())
                 return
             elif ("docs.google.com" in text) or ("drive.google.com" in text):
                 text, file_path = extract_text_from_google_file(text)
                 input_type = "CV"
             else:
-                classification_result = classify_text(text, llm_handler, model="gpt-4.1-nano")
+                classification_result = await classify_text_async(text, llm_handler, model="gpt-4.1-nano")
                 input_type = classification_result["input_type"]
 
             if input_type == "vacancy":
@@ -121,12 +125,36 @@ async def process_user_request(update: Update, context: ContextTypes.DEFAULT_TYP
         if file_path is not None and os.path.exists(file_path):
             os.remove(file_path)
 
-application = ApplicationBuilder().token(os.getenv("TELEGRAM_BOT_TOKEN")).build()
+async def process_bulk_cv_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/bulk_cv <Google Drive folder link>: parses all CVs of the folder."""
+    user = update.effective_user
+    user_name = user.username if user.username else user.first_name
+    source = " ".join(context.args or []).strip()
+    try:
+        if not await auth_manager.is_user_authorized(user_name, source, update):
+            return
+        if "/folders/" not in source:
+            await send_answer_message(update, "Please send the command with a Google Drive folder link: /bulk_cv <link>")
+            return
+        await process_bulk_cvs(update, source)
+    except Exception as e:
+        logger.error(f"{str(e)}\n{traceback.format_exc()}")
+        await update.message.reply_text(f"Please forward this message to @irina_199: {str(e)}")
+
+application = (
+    ApplicationBuilder()
+    .token(os.getenv("TELEGRAM_BOT_TOKEN"))
+    .concurrent_updates(True)
+    .post_shutdown(close_async_openai_clients)
+    .build()
+)
 
 # Adding handlers for text messages and files
 application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, process_user_request))
 application.add_handler(MessageHandler(filters.Document.ALL, process_user_request))
 
+application.add_handler(CommandHandler("bulk_cv", process_bulk_cv_command))
+
 # Adding handlers for google
 application.add_handler(CommandHandler("disk", start_google_drive_auth))
 application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_oauth_callback))
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Union, Literal, List, Dict, Any
 
-from src.data_processing.nlp.llm_handler import LLMHandler
+from src.data_processing.nlp.llm_handler import LLMHandler, AsyncLLMHandler
 
 
 class VacancyClassification(BaseModel):
@@ -49,18 +49,11 @@ def parse_llm_classification(response: Dict[str, Any]) -> Dict[str, Any]:
     return result
 
 
-def classify_text(text: str, llm_handler: LLMHandler, model: str) -> ClassifierResponse:
+def build_classifier_prompt(text: str) -> List[Dict[str, str]]:
     """
-    Classifies the input text as a vacancy, names, or unknown using LLM.
-    Args:
-        text (str): Input text to classify.
-        llm_handler (LLMHandler): Handler for LLM interaction.
-        model (str): Model name to use for classification.
-    Returns:
-        ClassifierResponse: Structured classification result.
+    Builds the classification prompt for the input text.
     """
-    # Define the prompt for the LLM
-    prompt = [
+    return [
         {
             "role": "system",
             "content": (
@@ -79,17 +72,47 @@ def classify_text(text: str, llm_handler: LLMHandler, model: str) -> ClassifierR
             )
         }
     ]
+
+
+def classify_text(text: str, llm_handler: LLMHandler, model: str) -> ClassifierResponse:
+    """
+    Classifies the input text as a vacancy, names, or unknown using LLM.
+    Args:
+        text (str): Input text to classify.
+        llm_handler (LLMHandler): Handler for LLM interaction.
+        model (str): Model name to use for classification.
+    Returns:
+        ClassifierResponse: Structured classification result.
+    """
+    # Define the prompt for the LLM
+    prompt = build_classifier_prompt(text)
     # Send the prompt to the LLM and parse the response
     response = llm_handler.get_answer(
         prompt,
         model=model,
         max_tokens=1000,
-        response_format=ClassifierResponse
+        response_format=ClassifierResponse,
+        hedge="classify_text"
     )
     # Parse the LLM response
     classification_result = parse_llm_classification(response)
     return classification_result
 
+
+async def classify_text_async(text: str, llm_handler: AsyncLLMHandler, model: str) -> Dict[str, Any]:
+    """
+    Awaitable version of classify_text, the request is awaited on the event loop instead of blocking it.
+    """
+    prompt = build_classifier_prompt(text)
+    response = await llm_handler.get_answer(
+        prompt,
+        model=model,
+        max_tokens=1000,
+        response_format=ClassifierResponse,
+        hedge="classify_text"
+    )
+    return parse_llm_classification(response)
+
 # Пример использования:
 # response_example = {
 #     "parsed": {
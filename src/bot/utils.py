@@ -1,6 +1,8 @@
 import asyncio
+import time
+
 from telegram import Update
-from telegram.error import NetworkError
+from telegram.error import BadRequest, NetworkError
 
 from src.bot.locks import send_lock
 from src.logger import logger
@@ -51,3 +53,75 @@ async def send_answer_message(update: Update, message: str):
             start = last_newline + 1
 
 
+# Telegram allows about one edit per second for a message, intermediate texts are skipped in between
+PROGRESS_EDIT_INTERVAL = 1.5
+
+
+def _cut_at_line(text: str, max_length: int = 4096) -> str:
+    if len(text) <= max_length:
+        return text
+    cut = text.rfind('\n', 0, max_length - 2)
+    return text[:cut if cut > 0 else max_length - 2] + "\n…"
+
+
+class ProgressMessage:
+    """
+    A message that is sent once and then edited in place while a long request runs.
+    show() can be called as often as needed, finish() replaces the message with the final answer
+    (or sends the answer with send_answer_message if it does not fit into one message).
+    """
+
+    def __init__(self, update: Update, header: str = ""):
+        self.update = update
+        self.header = header
+        self.message = None
+        self.text = None
+        self.finished = False
+        self._last_edit = 0
+        self._lock = asyncio.Lock()
+
+    async def show(self, text: str, force: bool = False):
+        # Progress reported from worker threads may arrive after the answer
+        if self.finished and not force:
+            return
+        if self.header:
+            text = f"{self.header}\n{text}"
+        await self._write(text, force)
+
+    async def _write(self, text: str, force: bool = False):
+        text = _cut_at_line(text)
+        async with self._lock:
+            if text == self.text:
+                return
+            if not force and self.message is not None and time.monotonic() - self._last_edit < PROGRESS_EDIT_INTERVAL:
+                return
+            try:
+                if self.message is None:
+                    async with send_lock:
+                        self.message = await self.update.message.reply_text(text, parse_mode='HTML')
+                else:
+                    await self.message.edit_text(text, parse_mode='HTML')
+                self.text = text
+                self._last_edit = time.monotonic()
+            except BadRequest as e:
+                logger.warning(f"Progress message was not updated: {e}")
+            except Exception as e:
+                logger.error(f"Exception: {e}")
+
+    def show_threadsafe(self, text: str, loop: asyncio.AbstractEventLoop):
+        """
+        show() for code running in worker threads.
+        """
+        asyncio.run_coroutine_threadsafe(self.show(text), loop)
+
+    async def finish(self, text: str, note: str = "<b>✅ Search finished, the answer is below</b>"):
+        text = str(text)
+        self.finished = True
+        if self.message is not None and len(text) <= 4096:
+            await self._write(text, force=True)
+            if self.text == text:
+                return
+        if self.message is not None:
+            await self.show(note, force=True)
+        await send_answer_message(self.update, text)
+
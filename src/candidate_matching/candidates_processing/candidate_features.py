@@ -0,0 +1,262 @@
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.candidate_matching.candidates_processing.filtering_by_rate import convert_to_usd
+from src.data_processing.nlp.emoji_processing import extract_emoji, remove_emojis
+from src.data_processing.nlp.languages_info import language_codes
+from src.data_processing.nlp.tokenization import get_tokens
+from src.logger import logger
+
+# Typed columns parsed once per candidates snapshot and used by the vacancy filters
+CANDIDATE_FEATURE_COLUMNS = ['_Countries', '_Language Entries', '_Rate USD', '_Roles', '_Stack Tokens',
+                             '_Stack Technologies']
+
+# Engagement and availability columns used by filter_candidates_by_engagement
+ENGAGEMENT_FEATURE_COLUMNS = ['_Engagement Class', '_Available From']
+
+LANGUAGE_LEVEL_PATTERN = re.compile(r'(\w+)\s+([A-Za-z0-9]+)')
+
+RED_ENGAGEMENT_LEVELS = {
+    # "➕Added",
+    # "📡Pending Connection",
+    # "🔗 In Connections",
+    # "🚀 Actively Applying",
+    # "⏳Pending Responsе",
+    # "💬In Talks",
+    # "🔓Ready to work with",
+    # "🙋Eager Applicant",
+    # "🤝Interviewed",
+    # "✅English checked",
+    # "📄Proposed",
+    # "🔄WorkING",
+    # "🏁WorkED",
+    "💔 Refused Further Work",
+    "🚧On hold",
+    "📵 Candidate unreachable",
+    "❌ Checked: fake detected",
+    "🚨 Suspected fake",
+    "💸Too expensive"
+}
+GREEN_ENGAGEMENT_LEVELS = {
+    "🚀 Actively Applying",
+    "🔓Ready to work with",
+    "🙋Eager Applicant",
+    "🤝Interviewed",
+    "✅English checked",
+    "📄Proposed",
+    "🔄WorkING",
+    "🏁WorkED"
+}
+YELLOW_ENGAGEMENT_LEVELS = {
+    "➕Added",
+    "📡Pending Connection",
+    "🔗 In Connections",
+    "⏳Pending Responsе",
+    "💬In Talks"
+}
+
+# Bits of '_Engagement Class': the colours of the emojis found in 'LVL of engagement'
+ENGAGEMENT_RED, ENGAGEMENT_YELLOW, ENGAGEMENT_GREEN = 1, 2, 4
+
+
+def _emoji_characters(levels) -> frozenset:
+    return frozenset("".join(extract_emoji(level) or "" for level in levels))
+
+
+ENGAGEMENT_EMOJI_CLASSES = [
+    (ENGAGEMENT_RED, _emoji_characters(RED_ENGAGEMENT_LEVELS)),
+    (ENGAGEMENT_YELLOW, _emoji_characters(YELLOW_ENGAGEMENT_LEVELS)),
+    (ENGAGEMENT_GREEN, _emoji_characters(GREEN_ENGAGEMENT_LEVELS)),
+]
+
+
+def _as_search_text(series: pd.Series) -> pd.Series:
+    """
+    Applies the same cell cleaning as get_df_for_vacancy_search: '' -> '_' and '\n' -> ', '.
+    """
+    series = series.fillna('').astype(str)
+    return series.where(series != '', '_').str.replace('\n', ', ', regex=False)
+
+
+def _split_list(text: str) -> tuple:
+    return tuple(item.strip() for item in text.split(',') if item.strip())
+
+
+def parse_countries(locations_str: str) -> tuple:
+    """
+    Returns the country names of a 'Location' cell without emoji flags.
+    """
+    return tuple(remove_emojis(country) for country in _split_list(locations_str))
+
+
+def parse_language_entries(languages_str: str) -> tuple:
+    """
+    Parses a 'Languages' cell like "English B2, Ukrainian C1".
+    Returns:
+        tuple: (language, level, code, has_english_level) per entry, e.g. ("English", "B2", "EN-B2", True).
+    """
+    entries = []
+    for lang_level in (item.strip() for item in languages_str.split(',')):
+        if not lang_level:
+            continue
+        match = LANGUAGE_LEVEL_PATTERN.search(lang_level)
+        level = match.group(2).upper() if match else ''
+        code = LANGUAGE_LEVEL_PATTERN.sub(
+            lambda m: f"{language_codes.get(m.group(1), m.group(1))}-{m.group(2).upper()}", lang_level)
+        entries.append((lang_level.split()[0], level, code, lang_level.startswith("English ")))
+    return tuple(entries)
+
+
+def engagement_class(level: str) -> int:
+    """
+    Returns the ENGAGEMENT_* bits of the emoji colours in a 'LVL of engagement' cell.
+    """
+    emojis = set(extract_emoji(level) or "")
+    return sum(bit for bit, class_emojis in ENGAGEMENT_EMOJI_CLASSES if emojis & class_emojis)
+
+
+def build_engagement_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parses 'LVL of engagement' and 'Available From' into ENGAGEMENT_FEATURE_COLUMNS, indexed like df.
+    '_Available From' is the first YYYY-MM-DD date of the cell, NaT if there is none.
+    """
+    levels = df['LVL of engagement'].fillna('').astype(str)
+    # A few distinct levels are shared by all candidates, each is classified once
+    classes = {level: engagement_class(level) for level in levels.unique()}
+    # The same date as date_parser.parse_date_only finds
+    dates = df['Available From'].fillna('').astype(str).str.extract(r'(\d{4}-\d{2}-\d{2})', expand=False)
+    return pd.DataFrame({
+        '_Engagement Class': levels.map(classes).astype(np.int8),
+        '_Available From': pd.to_datetime(dates, format='%Y-%m-%d', errors='coerce'),
+    }, index=df.index)
+
+
+def build_candidate_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parses the string columns used by the vacancy filters into typed columns, indexed like df.
+    Args:
+        df (pd.DataFrame): Candidates with 'Location', 'Languages', 'Entry wage rate (EWR)', 'Stack'
+            and 'Role' or 'Main Roles' columns.
+    Returns:
+        pd.DataFrame: CANDIDATE_FEATURE_COLUMNS.
+    """
+    roles = df['Role'] if 'Role' in df.columns else df['Main Roles']
+    stack = _as_search_text(df['Stack']).str.replace(r'\s*-\s*\d+', '', regex=True)
+    return pd.DataFrame({
+        '_Countries': _as_search_text(df['Location']).map(parse_countries),
+        '_Language Entries': _as_search_text(df['Languages']).map(parse_language_entries),
+        '_Rate USD': pd.to_numeric(_as_search_text(df['Entry wage rate (EWR)']).map(convert_to_usd),
+                                   errors='coerce'),
+        '_Roles': _as_search_text(roles).map(_split_list),
+        '_Stack Tokens': stack.map(lambda text: frozenset(get_tokens(text))),
+        '_Stack Technologies': stack.map(_split_list),
+    }, index=df.index)
+
+
+def add_candidate_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds the feature columns to df if they are not there yet (e.g. df was not built by get_df_for_vacancy_search).
+    """
+    if all(column in df.columns for column in CANDIDATE_FEATURE_COLUMNS):
+        return df
+    return df.drop(columns=CANDIDATE_FEATURE_COLUMNS, errors='ignore').join(build_candidate_features(df))
+
+
+def rows_with_any(series: pd.Series, values) -> pd.Series:
+    """
+    Boolean mask of the rows whose tuple/set cell contains at least one of values.
+    """
+    exploded = series.explode()
+    matched_index = exploded.index[exploded.isin(values).to_numpy()]
+    return pd.Series(series.index.isin(matched_index), index=series.index)
+
+
+def rows_with_other_than(series: pd.Series, values) -> pd.Series:
+    """
+    Boolean mask of the rows whose tuple/set cell contains at least one item not in values.
+    """
+    exploded = series.explode().dropna()
+    matched_index = exploded.index[~exploded.isin(values).to_numpy()]
+    return pd.Series(series.index.isin(matched_index), index=series.index)
+
+
+def explode_language_entries(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per candidate language, indexed by the candidate index.
+    """
+    entries = df['_Language Entries'].explode().dropna()
+    return pd.DataFrame(entries.tolist(), index=entries.index,
+                        columns=['language', 'level', 'code', 'has_english_level'])
+
+
+class StackIndex:
+    """
+    Inverted index over the 'Stack' tokens: token -> sorted positions of the candidates having it.
+    Coverage of a vacancy for all candidates is computed from the postings of the vacancy tokens only.
+    """
+
+    def __init__(self, stack_tokens: pd.Series):
+        self.index = stack_tokens.index
+        exploded = stack_tokens.explode().dropna()
+        positions = pd.Series(self.index.get_indexer(exploded.index), index=exploded.to_numpy())
+        self.postings = {token: np.sort(group.to_numpy()) for token, group in positions.groupby(level=0)}
+
+    def coverage(self, labels: pd.Index, vacancy_set: set):
+        """
+        Returns covered_percentage(vacancy_set, candidate tokens) for the candidates with the given index labels,
+        or None if some of them are not in the index.
+        """
+        positions = self.index.get_indexer(labels)
+        if (positions < 0).any():
+            return None
+        if not vacancy_set:
+            return np.zeros(len(labels))
+        counts = np.zeros(len(self.index), dtype=np.int32)
+        for token in vacancy_set:
+            postings = self.postings.get(token)
+            if postings is not None:
+                counts[postings] += 1
+        return counts[positions] / len(vacancy_set) * 100
+
+
+_features_lock = threading.Lock()
+_features_cache = {}
+_stack_indexes = {}
+
+
+def get_candidate_features(snapshot) -> pd.DataFrame:
+    """
+    Returns the features of all rows of a candidates snapshot, building them once per snapshot version.
+    """
+    features = _features_cache.get(snapshot.version)
+    if features is not None:
+        return features
+    with _features_lock:
+        features = _features_cache.get(snapshot.version)
+        if features is None:
+            start_time = time.time()
+            features = build_candidate_features(snapshot.df).join(build_engagement_features(snapshot.df))
+            stack_index = StackIndex(features['_Stack Tokens'])
+            # Only the latest snapshot is searched, older features are dropped
+            _features_cache.clear()
+            _stack_indexes.clear()
+            _stack_indexes[snapshot.version] = stack_index
+            _features_cache[snapshot.version] = features
+            logger.info(f"Candidate features for snapshot v{snapshot.version} built "
+                        f"in {time.time() - start_time:.1f} sec")
+    return features
+
+
+def get_stack_index(df: pd.DataFrame) -> StackIndex:
+    """
+    Returns the stack index of the snapshot df was taken from (df.attrs['snapshot_version']),
+    or builds one over df itself if that snapshot is not the current one.
+    """
+    stack_index = _stack_indexes.get(df.attrs.get('snapshot_version'))
+    if stack_index is None or (stack_index.index.get_indexer(df.index) < 0).any():
+        stack_index = StackIndex(add_candidate_features(df)['_Stack Tokens'])
+    return stack_index
@@ -1,12 +1,24 @@
-import re
+import os
 import traceback
-from typing import Dict
+import concurrent.futures
+from typing import Callable, List
 import pandas as pd
+from dotenv import load_dotenv
+from pydantic import BaseModel, Field
 
-from src.data_processing.nlp.jaccard_similarity import calculate_jaccard_similarity, find_most_similar_row
-from src.data_processing.json_conversion import df_to_json
+from src.candidate_matching.candidates_processing.candidates_prompt_encoder import encode_candidates_for_prompt, \
+    candidate_fingerprints
 from src.logger import logger
-from src.data_processing.nlp.llm_handler import LLMHandler, extract_and_parse_token_section
+from src.data_processing.nlp.llm_handler import LLMHandler
+
+load_dotenv()
+
+# Candidates per LLM call in sharded mode, 0 switches back to the sequential "first 10 of the rest" mode
+CANDIDATES_LLM_SHARD_SIZE = int(os.getenv("CANDIDATES_LLM_SHARD_SIZE", 10))
+CANDIDATES_LLM_MAX_PARALLEL_SHARDS = int(os.getenv("CANDIDATES_LLM_MAX_PARALLEL_SHARDS", 8))
+# Selected candidates scored again together in one call so that scores from different shards are comparable,
+# 0 disables the re-rank
+CANDIDATES_LLM_RERANK_TOP_K = int(os.getenv("CANDIDATES_LLM_RERANK_TOP_K", 0))
 
 
 def check_value(dictionary , key):
@@ -30,28 +42,177 @@ def format_vacancy_parameter_string(vacancy_info, parameter):
         seniority = check_value(vacancy_info , "Extracted Seniority")
         return f"- **Vacancy Role**:\n{seniority} {value}\n" if value else ""
 
-def parse_llm_process_candidates_response(response: str, add_tokens_info:bool=False) -> Dict[str, str]:
-    response, token_data = extract_and_parse_token_section(response=response,
-                                                           additional_key_text=" candidates_selection",
-                                                           add_tokens_info=add_tokens_info)
-    extracted_data = {}
-    # Split the remaining response into sections
-    sections = response.split("## ")[1:]
-    for section in sections:
-        # Split each section into section_name and section_content
-        lines = section.split("\n")
-        section_name = lines[0].strip()
-        print(section_name)
-        section_content = "\n".join(lines[1:]).strip()
-        # Replace commas with new lines for specific sections
-        if section_name in ["Extracted Technologies", "Selected Candidates"]:
-            # Replace commas with new lines
-            extracted_data[section_name] = section_content.replace(", ", "\n")
-        else:
-            extracted_data[section_name] = section_content
-    extracted_data.update(token_data)
-    return extracted_data
+class CandidateAssessment(BaseModel):
+    """Assessment of one candidate against the vacancy."""
+    row_in_spreadsheets: int = Field(description="Value of 'Row in Spreadsheets' of the assessed candidate.")
+    reasoning: str = Field(description="Why the candidate was selected or rejected, starting with 'was selected' or "
+                                       "'was rejected', without repeating the candidate's name.")
+    suitability_score: float = Field(ge=0, le=1, description="Suitability score from 0 to 1, where 1 is a perfect match.")
+    selected: bool = Field(description="True if the candidate is one of the best matches for the vacancy.")
+
+
+class CandidatesSelectionResponse(BaseModel):
+    """Structured response for candidates selection."""
+    candidates: List[CandidateAssessment] = Field(description="One assessment per analyzed candidate, in input order.")
+
+
+def format_vacancy_parameters(vacancy_info):
+    return "".join(
+        format_vacancy_parameter_string(vacancy_info, parameter)
+        for parameter in ['Programming Languages', 'Technologies', 'Role', 'Industries',
+                          'Expertise', 'Location', 'Rate', 'Languages']
+    )
+
+
+def build_candidates_selection_prompt(vacancy: str, vacancy_parameters: str, candidates_table: str,
+                                      candidates_to_analyze: str = "ten candidates",
+                                      candidates_instruction: str = "the first 10 candidates provided"):
+    prompt = [
+        {"role": "system", "content": "You are an expert in matching candidates to job descriptions."},
+        {"role": "user", "content": (
+            f"Your task is to process the provided input, which contains a job description and a list of candidates. Based on the input, you must:\n\n"
+            f"1. Analyze {candidates_to_analyze} in order. Ensure that each candidate is evaluated against the job description and technologies required.\n"
+            f"2. Select candidates who are the best match for the role and justify why they were selected. If multiple candidates are suitable, all of them should be selected. Ensure that no candidate is overlooked.\n"
+            f"3. Provide a suitability score for each candidate, ranging from 0 to 1, where 1 is a perfect match.\n"
+            f"4. Identify each candidate by the 'Row' value (row_in_spreadsheets), do not repeat the candidate's name.\n"
+            f"\n"
+            f"# Here is an example:\n\n"
+            f"# Example Input:\n"
+            f"## Job Description:\n"
+            f"We are looking for a Senior Machine Learning Engineer with expertise in Deep Learning (DL), Computer Vision (CV), and Python. The ideal candidate should have experience in the healthcare industry and be proficient in English at B2 level or above. Location: EU (preferably Poland, Warsaw).\n"
+            f"## Candidates:\n"
+            f"```tsv\n"
+            f"Seniority: J=Junior, M=Middle, S=Senior, P=Principal\n"
+            f"Row\tName\tSeniority\tRole\tStack\tIndustries\tExpertise\tHours\tLanguages\tLocation\tRate\n"
+            f"16\tAlice Smith\tS\tMachine Learning Engineer\tDeep Learning, Computer Vision, Python\tmedicine\tHealthcare\t\tEN-C1\tPoland\t$37\n"
+            f"34\tCharlie Brown\tS\tAI Engineer\tComputer Vision, Python\tmedicine\tHealthcare\t\tEN-C1\tBelarus\t$30\n"
+            f"28\tBob Johnson\tM\tData Scientist\tDeep Learning, NLP, Python\tFinance\tData Analysis\t\tEN-B2\tSerbia\t$26\n"
+            f"```\n\n"
+            f"# Example Output:\n"
+            f"```json\n"
+            f"{{\"candidates\": [\n"
+            f" {{\"row_in_spreadsheets\": 16, \"reasoning\": \"was selected as the top candidate because she is a Senior Machine Learning Engineer with all the required skills, including Deep Learning (DL), Computer Vision (CV), and Python. Her experience in the healthcare industry and excellent English proficiency (C1) make her an ideal match. Her location in Poland fits the requirement of being in the EU and is preferred.\", \"suitability_score\": 0.85, \"selected\": true}},\n"
+            f" {{\"row_in_spreadsheets\": 34, \"reasoning\": \"was rejected because, although he has expertise in Computer Vision (CV) and Python and significant experience in the healthcare industry, his location in Belarus does not fit the requirement of being in the EU.\", \"suitability_score\": 0.25, \"selected\": false}},\n"
+            f" {{\"row_in_spreadsheets\": 28, \"reasoning\": \"was rejected because, although he has experience with Deep Learning (DL) and Python, his expertise lies in the finance industry, and he does not have experience in Computer Vision (CV), which is a key requirement.\", \"suitability_score\": 0.65, \"selected\": false}}\n"
+            f"]}}\n"
+            f"```\n\n"
+            f"# Here is the input:\n\n"
+            f"## Job Description:\n"
+            f"{vacancy}\"\n"
+            f"Here is the extracted information from the job description:\n"
+            f"{vacancy_parameters}"
+            f"```\n\n"
+            f"## Candidates:\n"
+            f"```tsv\n"
+            f"{candidates_table}\n"
+            f"Analyze {candidates_instruction}.```\n"
+        )}
+    ]
+    return prompt
+
+
+def apply_candidates_selection(selection: CandidatesSelectionResponse, filtered_df: pd.DataFrame, vacancy_info: dict,
+                               llm_selected_indices: List, selected_rows: List[pd.DataFrame], error_logs: List[str]):
+    """
+    Applies one LLM answer to filtered_df: writes 'Reasoning' and 'Suitability Score' of the assessed candidates
+    and appends the selected candidates to llm_selected_indices and selected_rows.
+    Candidates are found by 'Row in Spreadsheets' with a dict lookup.
+
+    Returns:
+    - list: Indices of the assessed candidates.
+    """
+    index_by_row = dict(zip(filtered_df['Row in Spreadsheets'], filtered_df.index))
+    reasoning_candidate_indices = []
+    reasoning_lines = []
+    selected_candidates_lines = []
+    for assessment in selection.candidates:
+        index = index_by_row.get(assessment.row_in_spreadsheets)
+        if index is None:
+            # Log the missing row
+            error_logs.append(f"NO SUCH ROW IN FILTERED CANDIDATES for candidate: {assessment}")
+            continue
+        full_name = filtered_df.at[index, 'Full Name']
+        reasoning_for_candidate = f"**{full_name}** {assessment.reasoning.strip()}"
+        filtered_df.at[index, 'Reasoning'] = reasoning_for_candidate
+        filtered_df.at[index, 'Suitability Score'] = assessment.suitability_score
+        reasoning_candidate_indices.append(index)
+        reasoning_lines.append(f"{len(reasoning_lines) + 1}. {reasoning_for_candidate}")
+        if assessment.selected:
+            llm_selected_indices.append(index)
+            selected_rows.append(filtered_df.loc[[index]])
+            selected_candidates_lines.append(f"{full_name} in spreadsheet row number {assessment.row_in_spreadsheets}")
+
+    reasoning = "\n".join(reasoning_lines)
+    vacancy_info['Reasoning'] = f"{vacancy_info['Reasoning']}\n{reasoning}"
+    selected_candidates = "\n".join(selected_candidates_lines) or "No candidates are selected"
+    vacancy_info['Selected Candidates'] = f"{vacancy_info['Selected Candidates']}\n{selected_candidates}"
+    return reasoning_candidate_indices
+
+
+def request_candidates_selection(vacancy, vacancy_parameters, candidates_df, vacancy_info, llm_handler, model,
+                                 **prompt_kwargs) -> CandidatesSelectionResponse:
+    """
+    Sends candidates_df to the LLM and returns its structured answer, the cost is added to vacancy_info.
+    """
+    candidates_table = encode_candidates_for_prompt(candidates_df, model=model)
+    prompt = build_candidates_selection_prompt(vacancy, vacancy_parameters, candidates_table, **prompt_kwargs)
+    # Send the prompt to the LLM handler and get the response
+    approximate_tokens = len(candidates_df) * 200 + 200
+    response = llm_handler.get_answer(prompt, model=model, max_tokens=approximate_tokens,
+                                      response_format=CandidatesSelectionResponse)
+    selection = response['parsed']
+    logger.info(selection)
+
+    cost = float(response['cost']['total_cost'])
+    vacancy_info['Cost candidates_selection'] = cost + vacancy_info['Cost candidates_selection']
+    return selection
+
+
+def apply_cached_assessments(filtered_df, vacancy_info, cached_assessments, llm_selected_indices, selected_rows,
+                             error_logs):
+    """
+    Applies earlier LLM assessments of the same vacancy to the candidates that did not change since then
+    (same candidate_fingerprints), as if the LLM had answered them again.
+
+    Returns:
+    - tuple: The candidates left for the LLM and the DataFrame of the assessed, not selected candidates.
+    """
+    fingerprints = candidate_fingerprints(filtered_df)
+    known = fingerprints.isin(cached_assessments.keys())
+    if not known.any():
+        return filtered_df, filtered_df.iloc[0:0]
+    known_df = filtered_df[known].copy()
+    selection = CandidatesSelectionResponse(candidates=[
+        CandidateAssessment(row_in_spreadsheets=row_number, **cached_assessments[fingerprint])
+        for row_number, fingerprint in zip(known_df['Row in Spreadsheets'], fingerprints[known])
+    ])
+    reasoning_candidate_indices = apply_candidates_selection(selection, known_df, vacancy_info,
+                                                             llm_selected_indices, selected_rows, error_logs)
+    lesser_fit_indices = [idx for idx in reasoning_candidate_indices if idx not in llm_selected_indices]
+    logger.info(f"Cached assessments reused for {len(known_df)} of {len(filtered_df)} candidates")
+    return filtered_df[~known], known_df.loc[lesser_fit_indices]
+
+
+def init_candidates_selection(filtered_df, vacancy_info, model):
+    # Add 'Reasoning' column to filtered_df
+    filtered_df['Reasoning'] = ''
+    filtered_df['Suitability Score'] = 0.0
+    vacancy_info['Reasoning'] = ''
+    vacancy_info['Selected Candidates'] = ''
+    vacancy_info['Model Used candidates_selection'] = model
+    vacancy_info['Cost candidates_selection'] = 0
+
+
+def finish_candidates_selection(better_fit_df, lesser_fit_df, vacancy_info, error_logs):
+    # Sort DataFrames by 'Suitability Score' in descending order
+    better_fit_df = better_fit_df.sort_values(by='Suitability Score', ascending=False)
+    lesser_fit_df = lesser_fit_df.sort_values(by='Suitability Score', ascending=False)
+
+    # Add error logs to the extracted data
+    vacancy_info['error_logs'] = '\n'.join(error_logs)
+    logger.info(f"vacancy_info['error_logs']; {vacancy_info['error_logs']}")
 
+    return better_fit_df, lesser_fit_df, vacancy_info
 
 
 def process_candidates_with_llm(
@@ -59,244 +220,59 @@ def process_candidates_with_llm(
         filtered_df,   # - filtered_df (pd.DataFrame): DataFrame containing filtered candidate data.
         vacancy_info: dict,   # - vacancy_info (dict): Dictionary containing extracted information from the vacancy.
         llm_handler: LLMHandler,
-        model="gpt-4o-mini" #
+        model="gpt-4o-mini", #
+        shard_size: int = CANDIDATES_LLM_SHARD_SIZE,
+        rerank_top_k: int = CANDIDATES_LLM_RERANK_TOP_K,
+        cached_assessments: dict = None,
+        on_progress: Callable = None
 ):
     """
     Processes the candidates using the language model (LLM) to select the best matches.
+    With shard_size > 0 the candidates are ranked in parallel shards (see process_candidates_in_shards),
+    otherwise the whole list is sent repeatedly and the LLM analyzes the next 10 candidates each time.
+    cached_assessments (candidate fingerprint -> assessment fields, see collect_assessments) are reused
+    for unchanged candidates, only the others are sent to the LLM.
+    on_progress(selected_df, assessed_count, total_count) is called from the worker thread whenever
+    LLM answers come back, with the candidates selected so far.
 
     Returns:
     - tuple: A tuple containing the DataFrame of LLM selected candidates and the extracted data from LLM.
     """
+    if shard_size and shard_size > 0:
+        return process_candidates_in_shards(vacancy, filtered_df, vacancy_info, llm_handler, model,
+                                            shard_size, rerank_top_k, cached_assessments, on_progress)
+
     # Initialize a list to collect error logs
     error_logs = []
 
     # Initialize lists to store selected and rejected candidates
     llm_selected_indices = []
+    selected_rows = []
 
-    # Add 'Reasoning' column to filtered_df
-    filtered_df['Reasoning'] = ''
-    filtered_df['Suitability Score'] = 0.0
-    vacancy_info['Reasoning'] = ''
-    vacancy_info['Selected Candidates'] = ''
-    vacancy_info['Model Used candidates_selection'] = model
-    vacancy_info['Cost candidates_selection'] = 0
-
-    prog_lang = format_vacancy_parameter_string(vacancy_info, 'Programming Languages')
-    technologies = format_vacancy_parameter_string(vacancy_info, 'Technologies')
-    role = format_vacancy_parameter_string(vacancy_info, 'Role')
-    industries = format_vacancy_parameter_string(vacancy_info, 'Industries')
-    expertise = format_vacancy_parameter_string(vacancy_info, 'Expertise')
-    location = format_vacancy_parameter_string(vacancy_info, 'Location')
-    rate = format_vacancy_parameter_string(vacancy_info, 'Rate')
-    languages = format_vacancy_parameter_string(vacancy_info, 'Languages')
+    init_candidates_selection(filtered_df, vacancy_info, model)
+    vacancy_parameters = format_vacancy_parameters(vacancy_info)
 
     try_time = 1
 
     # Initialize DataFrames to store better and lesser fit candidates
     better_fit_df = pd.DataFrame(columns=filtered_df.columns)
     lesser_fit_df = pd.DataFrame(columns=filtered_df.columns)
+    total_count = len(filtered_df)
+    if cached_assessments:
+        filtered_df, cached_lesser_fit_df = apply_cached_assessments(
+            filtered_df, vacancy_info, cached_assessments, llm_selected_indices, selected_rows, error_logs)
+        lesser_fit_df = pd.concat([lesser_fit_df, cached_lesser_fit_df])
     max_try_time = len(filtered_df)//10 + 1
 
     # Process candidates in batches
     while len(filtered_df) and try_time<=max_try_time:
         try:
-            # Convert the filtered DataFrame to JSON format
-            columns_to_json = [
-                'Full Name', 'Seniority', 'Role',
-                'Stack', 'Industries', 'Expertise', 'Work hrs/mnth',
-                'Languages', 'Location', 'Sell rate', 'Row in Spreadsheets'
-            ]
-            logger.info(filtered_df.columns)
-            candidates_json = df_to_json(filtered_df[columns_to_json])
-
-            # Prepare the prompt for the LLM
-            prompt = [
-                {"role": "system", "content": "You are an expert in matching candidates to job descriptions."},
-                {"role": "user", "content": (
-                    f"Your task is to process the provided input, which contains a job description and a list of candidates. Based on the input, you must:\n\n"
-                    f"1. Analyze ten candidates in order. Ensure that each candidate is evaluated against the job description and technologies required.\n"
-                    f"2. Select candidates who are the best match for the role and justify why they were selected. If multiple candidates are suitable, all of them should be listed. Ensure that no candidate is overlooked.\n"
-                    f"3. Provide a suitability score for each candidate, ranging from 0 to 1, where 1 is a perfect match.\n"
-                    f"4. Format the selected candidates in the format: 'Full Name iin spreadsheet row number X' (e.g., 'John Doe in spreadsheet row number 17'), each on a new line.\n"
-                    f"\n"
-                    f"The output should be formatted in Markdown with the following sections:\n"
-                    f"- **Reasoning**: An explanation or justification for why certain candidates were selected. If no reasoning can be provided, return the reason why. Ensure that the reasoning covers all selected candidates, each candidate should be reasoned about in a separate line.\n"
-                    f"- **Suitability Scores**: A list of suitability scores for each candidate, formatted as 'Full Name: score', each on a new line.\n"
-                    f"- **Selected Candidates**: A list of candidates selected by the language model as the most suitable, each on a new line and formatted as 'Full Name in spreadsheet row number X'. If no candidates are selected, return 'No candidates are selected'.\n"
-                    f"\n"
-                    f"# Here is an example:\n\n"
-                    f"# Example Input:\n"
-                    f"## Job Description:\n"
-                    f"We are looking for a Senior Machine Learning Engineer with expertise in Deep Learning (DL), Computer Vision (CV), and Python. The ideal candidate should have experience in the healthcare industry and be proficient in English at B2 level or above. Location: EU (preferably Poland, Warsaw).\n" # Rate: $30.\n"
-                    f"## Candidates:\n"
-                    f"```json\n"
-                    f"    {{\n"
-                    f"      \"Full Name\": \"Alice Smith\",\n"
-                    f"      \"Seniority\": \"Senior\",\n"
-                    f"      \"Role\": \"Machine Learning Engineer\",\n"
-                    f"      \"Stack\": \"Deep Learning, Computer Vision, Python\",\n"
-                    f"      \"Industries\": \"medicine\",\n"
-                    f"      \"Expertise\": \"Healthcare\",\n"
-                    f"      \"Languages\": \"English C1\",\n"
-                    f"      \"Location\": \"Poland\",\n"
-                    f"      \"Sell rate\": \"\\\$37\",\n"
-                    f"      \"Row in Spreadsheets\": 16\n"
-                    f"    }},\n"
-                    f"    {{\n"
-                    f"      \"Full Name\": \"Charlie Brown\",\n"
-                    f"      \"Seniority\": \"Senior\",\n"
-                    f"      \"Role\": \"AI Engineer\",\n"
-                    f"      \"Stack\": \"Computer Vision, Python\",\n"
-                    f"      \"Industries\": \"medicine\",\n"
-                    f"      \"Expertise\": \"Healthcare\",\n"
-                    f"      \"Languages\": \"English C1\",\n"
-                    f"      \"Location\": \"Belarus\",\n"
-                    f"      \"Sell rate\": \"\\\$30\",\n"
-                    f"      \"Row in Spreadsheets\": 34\n"
-                    f"    }},\n"
-                    f"    {{\n"
-                    f"      \"Full Name\": \"Bob Johnson\",\n"
-                    f"      \"Seniority\": \"Middle\",\n"
-                    f"      \"Role\": \"Data Scientist\",\n"
-                    f"      \"Stack\": \"Deep Learning, NLP, Python\",\n"
-                    f"      \"Industries\": \"Finance\",\n"
-                    f"      \"Expertise\": \"Data Analysis\",\n"
-                    f"      \"Languages\": \"English B2\",\n"
-                    f"      \"Location\": \"Serbia\",\n"
-                    f"      \"Sell rate\": \"\\\$26\",\n"
-                    f"      \"Row in Spreadsheets\": 28\n"
-                    f"    }}\n"
-                    f"  ]\n"
-                    f"}}\n"
-                    f"```\n\n"
-                    f"# Example Output:\n"
-                    f"## Reasoning\n"
-                    f"1. **Alice Smith** was selected as the top candidate because she is a Senior Machine Learning Engineer with all the required skills, including Deep Learning (DL), Computer Vision (CV), and Python. Her experience in the healthcare industry and excellent English proficiency (C1) make her an ideal match for the job description. Additionally, Additionally, her location in Poland fits the requirement of being in the EU and is preferred. \n"# However, her rate of $37 is above the specified rate of $30.\n"
-                    f"2. **Charlie Brown** was rejected because, although he has expertise in Computer Vision (CV) and Python, and he has significant experience in the healthcare industry, his location in Belarus does not fit the requirement of being in the EU. \n" #His rate of $30 is competitive but the location is a decisive factor.\n"
-                    f"3. **Bob Johnson** was rejected because, although he has experience with Deep Learning (DL) and Python, his expertise lies in the finance industry, and he does not have experience in Computer Vision (CV), which is a key requirement. His location in Serbia fits the requirement of being in the EU. \n\n" #His rate of $26 is competitive but his expertise does not fully match the job requirements.\n\n"
-                    f"## Suitability Scores\n"
-                    f"Alice Smith: 0.85\n"
-                    f"Charlie Brown: 0.25\n"
-                    f"Bob Johnson: 0.65\n"
-                    f"## Selected Candidates\n"
-                    f"Alice Smith in spreadsheet row number 16\n"
-                    f"\n"
-                    f"# Here is the input:\n\n"
-                    f"## Job Description:\n"
-                    f"{vacancy}\"\n"
-                    f"Here is the extracted information from the job description:\n"
-                    f"{prog_lang}"
-                    f"{technologies}"
-                    f"{role}"
-                    f"{industries}"
-                    f"{expertise}"
-                    f"{location}"
-                    f"{rate}"
-                    f"{languages}"
-                    f"```\n\n"
-                    f"## Candidates:\n"
-                    f"```json\n"
-                    f"{candidates_json}\n"
-                    f"Analyze the first 10 candidates provided.```\n"
-                )}
-            ]
-
-            # Send the prompt to the LLM handler and get the response
-            approximate_tokens = len(filtered_df) * 200 + 200
-            response = llm_handler.get_answer(prompt, model=model, max_tokens=approximate_tokens)
-
             logger.info(f"try_time {try_time}")
-            logger.info(response)
             try_time += 1
-
-            # Parse the response from the LLM
-            extracted_data = parse_llm_process_candidates_response(response)
-            cost = float(extracted_data['Cost candidates_selection'])
-            vacancy_info['Cost candidates_selection'] = cost + vacancy_info['Cost candidates_selection']
-
-            # Extract reasoning and find candidates mentioned in reasoning
-            reasoning = extracted_data.get("Reasoning", "")
-            vacancy_info['Reasoning'] = f"{vacancy_info['Reasoning']}\n{reasoning}"
-            reasoning_list = reasoning.split("\n")
-            reasoning_candidate_indices = []
-
-            # Update 'Reasoning' column for candidates mentioned in reasoning
-            for reasoning_for_candidate in reasoning_list:
-                candidate_match = re.findall(r'\*\*(.*?)\*\*', reasoning_for_candidate)
-                if len(candidate_match)==1:
-                    candidate_name = candidate_match[0].strip()
-                    if candidate_name:
-                        candidate_row = filtered_df[filtered_df['Full Name'].apply(lambda x: calculate_jaccard_similarity(set(candidate_name), set(x)) >= 0.9)]
-                        if not candidate_row.empty:
-                            # Save the index to be able to delete the candidate row from filtered_df in the end of while loop
-                            reasoning_candidate_indices.extend(candidate_row.index.tolist())
-                            # Remove the number and dot at the beginning of the line
-                            reasoning_for_candidate = re.sub(r'^\d+\.\s*', '', reasoning_for_candidate)
-                            # Update candidate reasoning in filtered_df
-                            filtered_df.loc[candidate_row.index, 'Reasoning'] = reasoning_for_candidate
-
-            # Extract suitability scores
-            suitability_scores = extracted_data.get("Suitability Scores", "")
-            if suitability_scores:
-                scores_list = suitability_scores.split("\n")
-                for score in scores_list:
-                    if score:
-                        parts = score.split(":")
-                        if len(parts) == 2:
-                            name = parts[0].strip()
-                            score_value = float(parts[1].strip())
-                            # Update candidate suitability score in filtered_df
-                            candidate_row = filtered_df[filtered_df['Full Name'].apply(
-                                lambda x: calculate_jaccard_similarity(set(name), set(x)) >= 0.9)]
-                            if not candidate_row.empty:
-                                filtered_df.loc[candidate_row.index, 'Suitability Score'] = score_value
-
-            # Extract the list of selected candidates
-            selected_candidates = extracted_data.get("Selected Candidates", "")
-            vacancy_info['Selected Candidates'] = f"{vacancy_info['Selected Candidates']}\n{selected_candidates}"
-            if selected_candidates.startswith('No'):
-                selected_candidates_list = []
-            else:
-                selected_candidates_list = selected_candidates.split("\n")
-
-            # Filter the DataFrame to include only the selected candidates
-            selected_candidate_was_not_found = False
-            for candidate in selected_candidates_list:
-                if candidate:
-                    parts = candidate.split(" in spreadsheet row number")
-                    if len(parts) == 2:
-                        name = parts[0].strip()
-                        row_number = int(parts[1].strip())
-                    else:
-                         raise Exception(f"Wrong format in 'Selected Candidates' section: {candidate}")
-                    set_name = set(name)
-
-                    # Check if the row number exists in the filtered DataFrame
-                    row_data = filtered_df[filtered_df['Row in Spreadsheets'] == row_number]
-                    if not row_data.empty:
-                        # Check if the name matches
-                        full_name_df = row_data.iloc[0]['Full Name']
-                        if calculate_jaccard_similarity(set_name, set(full_name_df)) >= 0.9:
-                            llm_selected_indices.append(row_data.index[0])
-                            better_fit_df = pd.concat([better_fit_df, row_data])
-                        else:
-                            selected_candidate_was_not_found = True
-                            # Log the mismatch
-                            error_logs.append(f"Mismatch for candidate: {candidate}, Data: {row_data.to_dict(orient='records')}")
-                    else:
-                        selected_candidate_was_not_found = True
-                        # Log the missing row
-                        error_logs.append(f"NO SUCH ROW IN FILTERED CANDIDATES for candidate: {candidate}")
-
-                    # Search for matches by 'First Name' and 'Last Name' if not already matched
-                    if selected_candidate_was_not_found:
-                        # Use find_most_similar_row to find the most similar candidate
-                        most_similar_row = find_most_similar_row(filtered_df['Full Name'], name)
-                        if most_similar_row:
-                            index, similar_name = most_similar_row
-                            llm_selected_indices.append(index)
-                            better_fit_df = pd.concat([better_fit_df, filtered_df.loc[[index]]])
-                            selected_candidate_was_not_found = False
+            selection = request_candidates_selection(vacancy, vacancy_parameters, filtered_df, vacancy_info,
+                                                          llm_handler, model)
+            reasoning_candidate_indices = apply_candidates_selection(selection, filtered_df, vacancy_info,
+                                                                     llm_selected_indices, selected_rows, error_logs)
 
             # Form lesser_fit_df using indices from reasoning_candidate_indices not in llm_selected_indices
             lesser_fit_indices = [idx for idx in reasoning_candidate_indices if idx not in llm_selected_indices]
@@ -306,6 +282,7 @@ def process_candidates_with_llm(
             logger.info(f"reasoning_candidate_indices {reasoning_candidate_indices}")
             filtered_df = filtered_df[~filtered_df.index.isin(reasoning_candidate_indices)]
             logger.info(f"len(filtered_df) { len(filtered_df)}")
+            report_progress(on_progress, selected_rows, total_count - len(filtered_df), total_count)
 
         except Exception as e:
             error_message = f"{str(e)}\n{traceback.format_exc()}"
@@ -313,12 +290,146 @@ def process_candidates_with_llm(
             error_logs.append(error_message)
             continue
 
-    # Sort DataFrames by 'Suitability Score' in descending order
-    better_fit_df = better_fit_df.sort_values(by='Suitability Score', ascending=False)
-    lesser_fit_df = lesser_fit_df.sort_values(by='Suitability Score', ascending=False)
+    better_fit_df = pd.concat([better_fit_df] + selected_rows)
+    return finish_candidates_selection(better_fit_df, lesser_fit_df, vacancy_info, error_logs)
 
-    # Add error logs to the extracted data
-    vacancy_info['error_logs'] = '\n'.join(error_logs)
-    logger.info(f"vacancy_info['error_logs']; {vacancy_info['error_logs']}")
 
-    return better_fit_df, lesser_fit_df, vacancy_info
+def report_progress(on_progress, selected_rows, assessed_count, total_count):
+    if on_progress is None:
+        return
+    try:
+        selected_df = pd.concat(selected_rows) if selected_rows else pd.DataFrame(
+            columns=['Full Name', 'Suitability Score'])
+        on_progress(selected_df, assessed_count, total_count)
+    except Exception as e:
+        logger.error(f"Candidates selection progress callback failed: {e}")
+
+
+def process_candidates_in_shards(vacancy, filtered_df, vacancy_info, llm_handler, model, shard_size, rerank_top_k=0,
+                                 cached_assessments=None, on_progress=None):
+    """
+    Ranks the candidates in fixed-size shards sent to the LLM concurrently, each prompt containing only
+    its shard, and merges the scores of all shards. Candidates an answer did not mention (or whose shard
+    failed) get one more round. The best rerank_top_k selected candidates can be scored again in one call.
+    Candidates with cached_assessments are merged in without LLM calls.
+    """
+    error_logs = []
+    llm_selected_indices = []
+    selected_rows = []
+    lesser_fit_rows = []
+
+    init_candidates_selection(filtered_df, vacancy_info, model)
+    vacancy_parameters = format_vacancy_parameters(vacancy_info)
+    shard_prompt = dict(candidates_to_analyze="all candidates",
+                        candidates_instruction="all candidates provided")
+
+    remaining_df = filtered_df
+    if cached_assessments:
+        remaining_df, cached_lesser_fit_df = apply_cached_assessments(
+            filtered_df, vacancy_info, cached_assessments, llm_selected_indices, selected_rows, error_logs)
+        lesser_fit_rows.append(cached_lesser_fit_df)
+    assessed_count = len(filtered_df) - len(remaining_df)
+    report_progress(on_progress, selected_rows, assessed_count, len(filtered_df))
+    for round_number in range(2):
+        if remaining_df.empty:
+            break
+        shards = [remaining_df.iloc[start:start + shard_size].copy()
+                  for start in range(0, len(remaining_df), shard_size)]
+        logger.info(f"Candidates selection round {round_number + 1}: {len(remaining_df)} candidates "
+                    f"in {len(shards)} shards")
+        # Each shard gets its own vacancy_info for the cost, summed up below in shard order
+        shard_infos = [{'Cost candidates_selection': 0} for _ in shards]
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(len(shards), CANDIDATES_LLM_MAX_PARALLEL_SHARDS)) as executor:
+            futures = [
+                executor.submit(request_candidates_selection, vacancy, vacancy_parameters, shard, shard_info,
+                                llm_handler, model, **shard_prompt)
+                for shard, shard_info in zip(shards, shard_infos)
+            ]
+            if on_progress is not None:
+                # Answers are shown as they come, they are merged below in shard order
+                shard_by_future = dict(zip(futures, shards))
+                progress_rows = list(selected_rows)
+                for future in concurrent.futures.as_completed(futures):
+                    if future.exception() is not None:
+                        continue
+                    shard = shard_by_future[future]
+                    assessments = future.result().candidates
+                    assessed_count += len(assessments)
+                    scores = {assessment.row_in_spreadsheets: assessment.suitability_score
+                              for assessment in assessments if assessment.selected}
+                    shard_selected = shard[shard['Row in Spreadsheets'].isin(scores.keys())]
+                    progress_rows.append(pd.DataFrame({
+                        'Full Name': shard_selected['Full Name'],
+                        'Suitability Score': shard_selected['Row in Spreadsheets'].map(scores),
+                    }))
+                    report_progress(on_progress, progress_rows, assessed_count, len(filtered_df))
+
+        processed_indices = []
+        for shard, shard_info, future in zip(shards, shard_infos, futures):
+            vacancy_info['Cost candidates_selection'] += shard_info['Cost candidates_selection']
+            try:
+                reasoning_candidate_indices = apply_candidates_selection(
+                    future.result(), shard, vacancy_info, llm_selected_indices, selected_rows, error_logs)
+            except Exception as e:
+                error_message = f"{str(e)}\n{traceback.format_exc()}"
+                logger.error(error_message)
+                error_logs.append(error_message)
+                continue
+            lesser_fit_indices = [idx for idx in reasoning_candidate_indices if idx not in llm_selected_indices]
+            lesser_fit_rows.append(shard.loc[lesser_fit_indices])
+            processed_indices.extend(reasoning_candidate_indices)
+            processed_indices.extend(idx for idx in llm_selected_indices if idx in shard.index)
+
+        remaining_df = remaining_df[~remaining_df.index.isin(processed_indices)]
+
+    better_fit_df = pd.concat([pd.DataFrame(columns=filtered_df.columns)] + selected_rows)
+    lesser_fit_df = pd.concat([pd.DataFrame(columns=filtered_df.columns)] + lesser_fit_rows)
+
+    if rerank_top_k and len(better_fit_df) > 1:
+        better_fit_df = rerank_selected_candidates(vacancy, vacancy_parameters, better_fit_df, vacancy_info,
+                                                   llm_handler, model, rerank_top_k, error_logs)
+
+    return finish_candidates_selection(better_fit_df, lesser_fit_df, vacancy_info, error_logs)
+
+
+def rerank_selected_candidates(vacancy, vacancy_parameters, better_fit_df, vacancy_info, llm_handler, model,
+                               top_k, error_logs):
+    """
+    Scores the top_k selected candidates again in a single call so that their scores are comparable.
+    Only 'Suitability Score' and 'Reasoning' are updated, the selection itself is kept.
+    """
+    better_fit_df = better_fit_df[~better_fit_df.index.duplicated()]
+    top_df = better_fit_df.sort_values(by='Suitability Score', ascending=False).head(top_k).copy()
+    rerank_info = {'Cost candidates_selection': 0, 'Reasoning': '', 'Selected Candidates': ''}
+    try:
+        selection = request_candidates_selection(vacancy, vacancy_parameters, top_df, rerank_info,
+                                                      llm_handler, model,
+                                                      candidates_to_analyze="all candidates",
+                                                      candidates_instruction="all candidates provided")
+        apply_candidates_selection(selection, top_df, rerank_info, [], [], error_logs)
+        better_fit_df.loc[top_df.index, ['Reasoning', 'Suitability Score']] = \
+            top_df[['Reasoning', 'Suitability Score']]
+    except Exception as e:
+        error_message = f"Re-rank of the selected candidates failed: {str(e)}\n{traceback.format_exc()}"
+        logger.error(error_message)
+        error_logs.append(error_message)
+    vacancy_info['Cost candidates_selection'] += rerank_info['Cost candidates_selection']
+    return better_fit_df
+
+
+def collect_assessments(better_fit_df, lesser_fit_df) -> dict:
+    """
+    Returns the assessments of a finished selection by candidate fingerprint, to be passed as
+    cached_assessments to process_candidates_with_llm for the same vacancy.
+    """
+    assessments = {}
+    for df, selected in ((lesser_fit_df, False), (better_fit_df, True)):
+        if df.empty:
+            continue
+        for fingerprint, full_name, reasoning, score in zip(candidate_fingerprints(df), df['Full Name'],
+                                                            df['Reasoning'], df['Suitability Score']):
+            reasoning = str(reasoning).removeprefix(f"**{full_name}** ")
+            assessments[fingerprint] = {'reasoning': reasoning, 'suitability_score': float(score),
+                                        'selected': selected}
+    return assessments
@@ -0,0 +1,120 @@
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from src.candidate_matching.candidates_processing.filtering_by_languages import convert_language_levels
+from src.data_processing.nlp.tokenization import count_llm_tokens
+from src.logger import logger
+
+# Prompt column name for every candidates column sent to the LLM, in table order
+CANDIDATES_PROMPT_COLUMNS = {
+    'Row in Spreadsheets': 'Row',
+    'Full Name': 'Name',
+    'Seniority': 'Seniority',
+    'Role': 'Role',
+    'Stack': 'Stack',
+    'Industries': 'Industries',
+    'Expertise': 'Expertise',
+    'Work hrs/mnth': 'Hours',
+    'Languages': 'Languages',
+    'Location': 'Location',
+    'Sell rate': 'Rate',
+}
+
+SENIORITY_ABBREVIATIONS = {'Junior': 'J', 'Middle': 'M', 'Senior': 'S', 'Principal': 'P'}
+
+# Maximum characters per cell, long lists are cut to the items relevant for the vacancy first
+CANDIDATES_PROMPT_FIELD_LIMITS = {
+    'Stack': 300,
+    'Industries': 150,
+    'Expertise': 200,
+    'Role': 120,
+}
+
+EMPTY_VALUES = {'', '_'}
+
+
+def truncate_items(text: str, max_chars: int, priority_items: Optional[List[str]] = None) -> str:
+    """
+    Cuts a comma separated list to max_chars, keeping priority_items first, and tells how many items were left out.
+    """
+    if len(text) <= max_chars:
+        return text
+    items = [item.strip() for item in text.split(',') if item.strip()]
+    # Stack items carry years of experience ("Python - 5"), priority items are compared without them
+    priority_names = set(priority_items or [])
+    is_priority = [re.sub(r'\s*-\s*\d+', '', item) in priority_names for item in items]
+    ordered_items = ([item for item, priority in zip(items, is_priority) if priority] +
+                     [item for item, priority in zip(items, is_priority) if not priority])
+    kept_items = []
+    length = 0
+    for item in ordered_items:
+        if kept_items and length + len(item) + 2 > max_chars:
+            break
+        kept_items.append(item)
+        length += len(item) + 2
+    left_out = len(ordered_items) - len(kept_items)
+    return ", ".join(kept_items) + (f" +{left_out} more" if left_out else "")
+
+
+def _clean_cell(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ''
+    text = str(value).strip()
+    if text in EMPTY_VALUES:
+        return ''
+    # Tabs and line breaks would break the table
+    return re.sub(r'\s*[\t\r\n]+\s*', '; ', text)
+
+
+def encode_candidate(row: pd.Series, field_limits: Dict[str, int]) -> List[str]:
+    cells = []
+    for column in CANDIDATES_PROMPT_COLUMNS:
+        value = _clean_cell(row.get(column))
+        if column == 'Seniority':
+            value = SENIORITY_ABBREVIATIONS.get(value, value)
+        elif column == 'Languages' and value:
+            value = convert_language_levels(value)
+        elif column == 'Stack' and value:
+            relevant_stack = _clean_cell(row.get('_Stack'))
+            priority_items = [item.strip() for item in relevant_stack.split(',')] if relevant_stack else None
+            value = truncate_items(value, field_limits['Stack'], priority_items)
+        elif column in field_limits and value:
+            value = truncate_items(value, field_limits[column])
+        cells.append(value)
+    return cells
+
+
+def encode_candidates_for_prompt(df: pd.DataFrame, field_limits: Optional[Dict[str, int]] = None,
+                                 model: str = "gpt-4o-mini") -> str:
+    """
+    Encodes candidates as a tab separated table for LLM prompts: column names once in the header,
+    empty and '_' cells left blank, seniority abbreviated, languages as codes ("EN-B2")
+    and long lists cut to the vacancy-relevant items of '_Stack'.
+
+    Returns:
+    - str: The legend line followed by the table.
+    """
+    field_limits = {**CANDIDATES_PROMPT_FIELD_LIMITS, **(field_limits or {})}
+    lines = ["\t".join(CANDIDATES_PROMPT_COLUMNS.values())]
+    for _, row in df.iterrows():
+        lines.append("\t".join(encode_candidate(row, field_limits)))
+    legend = "Seniority: " + ", ".join(f"{abbr}={name}" for name, abbr in SENIORITY_ABBREVIATIONS.items())
+    encoded = f"{legend}\n" + "\n".join(lines)
+    logger.info(f"Candidates prompt table: {len(df)} candidates, "
+                f"about {count_llm_tokens(encoded, model)} tokens")
+    return encoded
+
+
+def candidate_fingerprints(df: pd.DataFrame) -> pd.Series:
+    """
+    Hash of everything the LLM sees about each candidate except the row number,
+    an assessment of a candidate stays valid while the fingerprint is the same.
+    """
+    columns = [column for column in CANDIDATES_PROMPT_COLUMNS if column != 'Row in Spreadsheets']
+    values = df.reindex(columns=columns).fillna('').astype(str)
+    return pd.Series(
+        ["\t".join(row).encode("utf-8") for row in values.itertuples(index=False, name=None)], index=df.index
+    ).map(lambda text: hashlib.sha1(text).hexdigest())
@@ -2,6 +2,7 @@
 import pandas as pd
 from lxml.doctestcompare import strip
 
+from src.candidate_matching.candidates_processing.candidate_features import add_candidate_features
 from src.candidate_matching.candidates_processing.filtering_by_languages import filter_candidates_by_languages
 from src.candidate_matching.candidates_processing.filtering_by_location import filter_candidates_by_location
 from src.candidate_matching.candidates_processing.filtering_by_rate import filter_candidates_by_rate
@@ -49,22 +50,19 @@ def filter_candidates_by_roles(df, required_roles_list):
     Returns:
         DataFrame: Filtered DataFrame.
     """
-    # Create 'Matched Roles' column by filtering roles from 'Role' column
-    df['Matched Roles'] = df['Role'].apply(
-        lambda roles: [
-            role.strip()
-            for role in roles.split(',')
-            if role.strip() in required_roles_list
-        ]
-    )
-    # Handle the case where 'No Role is specified' is the only role
-    df['Matched Roles'] = df['Matched Roles'].apply(lambda matched_roles: matched_roles if matched_roles else [])
+    # Create 'Matched Roles' column by filtering the roles parsed once per snapshot
+    df = add_candidate_features(df)
+    roles = df['_Roles'].explode()
+    matched_roles = roles[roles.isin(required_roles_list).to_numpy()]
+    matched_roles_by_candidate = matched_roles.groupby(level=0).agg(list).to_dict()
+    # Candidates without matching roles get an empty list
+    df['Matched Roles'] = [matched_roles_by_candidate.get(index, []) for index in df.index]
 
     if len(required_roles_list) == 1 and required_roles_list[0].startswith("No "):
         return df
 
     # Filter candidates: keep only those with at least one matching role
-    mask = df['Matched Roles'].apply(lambda matched_roles: len(matched_roles) > 0)
+    mask = df.index.isin(matched_roles.index)
     # Apply the mask to filter the DataFrame
     filtered_df = df.loc[mask, :].copy()
     return filtered_df
@@ -104,6 +102,8 @@ def primary_filtering_by_vacancy(vacancy_info, df):
     """
     min_candidates_threshold_to_analize = 9
     filter_history = []
+    # Typed filter columns, already there when df comes from get_df_for_vacancy_search
+    df = add_candidate_features(df)
 
     # Step 1: Filter by location
     location = vacancy_info.get("Extracted Location", "Any location")
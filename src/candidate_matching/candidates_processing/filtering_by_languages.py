@@ -1,7 +1,10 @@
 import re
+import numpy as np
 import pandas as pd
 from typing import List, Optional
 
+from src.candidate_matching.candidates_processing.candidate_features import add_candidate_features, \
+    explode_language_entries
 from src.data_processing.nlp.languages_info import language_codes
 
 def has_language(candidate_languages: str, language: str) -> bool:
@@ -39,6 +42,47 @@ def is_match(candidate_languages: str, requirement_type: str, required_languages
         return False
 
 
+def languages_match_mask(candidate_languages: pd.Series, requirement_type: str,
+                         required_languages: List[str]) -> pd.Series:
+    """
+    Vectorized is_match over the languages column: a language is known if its name is in the string.
+    """
+    def has_language_mask(language: str) -> np.ndarray:
+        if language == "English":
+            return np.ones(len(candidate_languages), dtype=bool)
+        return candidate_languages.fillna("").str.contains(language, regex=False).to_numpy(dtype=bool)
+
+    if requirement_type == "No language requirements":
+        mask = np.ones(len(candidate_languages), dtype=bool)
+    elif requirement_type == "Single language required":
+        mask = has_language_mask(required_languages[0])
+    elif requirement_type == "All listed languages are required":
+        mask = np.logical_and.reduce([has_language_mask(lang) for lang in required_languages] +
+                                     [np.ones(len(candidate_languages), dtype=bool)])
+    elif requirement_type == "Any of the listed languages is required":
+        mask = np.logical_or.reduce([has_language_mask(lang) for lang in required_languages] +
+                                    [np.zeros(len(candidate_languages), dtype=bool)])
+    else:
+        mask = np.zeros(len(candidate_languages), dtype=bool)
+    return pd.Series(mask, index=candidate_languages.index)
+
+
+def relevant_language_codes(index: pd.Index, entries: pd.DataFrame, requirement_type: str,
+                            required_languages: List[str]) -> pd.Series:
+    """
+    Vectorized filter_languages: English and the required languages in language code format (e.g. "EN-B2, UK-C1").
+    """
+    entries = entries[entries.index.isin(index)]
+    if requirement_type == "No language requirements":
+        # Keep only English, default to "EN-B1" if not specified
+        english = entries[entries['has_english_level'].to_numpy()]
+        codes = english.groupby(level=0)['code'].first()
+        return codes.reindex(index, fill_value="EN-B1")
+    relevant = entries[(entries['language'].isin(["English"] + list(required_languages))).to_numpy()]
+    codes = relevant.groupby(level=0)['code'].agg(", ".join)
+    return codes.reindex(index, fill_value="")
+
+
 def convert_language_levels(language_string: str) -> str:
     """
     Converts a string of languages and their levels to a string of language codes and levels.
@@ -131,17 +175,13 @@ def filter_candidates_by_languages(
     if len(df) == 0:
         return df, updated_vacancy_languages
 
-    # Apply filtering
-    df["Matches"] = df[languages_col].apply(
-        lambda x: is_match(x, requirement_type, required_languages)
-    )
-    filtered_df = df[df["Matches"]].copy()
-    # Apply language filtering to the relevant candidates
-    filtered_df[languages_col] = filtered_df[languages_col].apply(
-        lambda x: filter_languages(x, requirement_type, required_languages)
-    )
-    # Drop the temporary column
-    filtered_df.drop(columns=["Matches"], inplace=True, errors="ignore")
+    # Apply filtering on the languages parsed once per snapshot
+    df = add_candidate_features(df)
+    entries = explode_language_entries(df)
+    filtered_df = df[languages_match_mask(df[languages_col], requirement_type, required_languages)].copy()
+    # Keep only the relevant languages in language code format
+    filtered_df[languages_col] = relevant_language_codes(filtered_df.index, entries, requirement_type,
+                                                         required_languages)
 
     return filtered_df, updated_vacancy_languages
 
@@ -1,5 +1,7 @@
 import pandas as pd
 from typing import List
+from src.candidate_matching.candidates_processing.candidate_features import add_candidate_features, rows_with_any, \
+    rows_with_other_than
 from src.data_processing.nlp.countries_info import EU_COUNTRIES
 from src.data_processing.nlp.emoji_processing import remove_emojis
 
@@ -59,6 +61,7 @@ def filter_candidates_by_location(df: pd.DataFrame, location_requirements: List[
     Returns:
         pd.DataFrame: Filtered DataFrame based on location requirements.
     """
+    df = add_candidate_features(df)
     # Get the list of excluded countries (with 'NOT' prefix)
     excluded_countries = [
         country.replace('NOT ', '') for country in location_requirements
@@ -66,7 +69,7 @@ def filter_candidates_by_location(df: pd.DataFrame, location_requirements: List[
     ]
     # If there are excluded countries, filter candidates who only have those locations
     if excluded_countries:
-        df = df[~df['Location'].apply(lambda x: has_only_excluded_locations(x, excluded_countries))]
+        df = df[rows_with_other_than(df['_Countries'], excluded_countries)]
         return df
 
     # If 'Remote' is in the requirements, return the original DataFrame
@@ -82,7 +85,7 @@ def filter_candidates_by_location(df: pd.DataFrame, location_requirements: List[
     if 'European Union' in location_requirements:
         valid_locations.extend(EU_COUNTRIES)
     if valid_locations:
-        df = df[df['Location'].apply(lambda x: has_valid_location(x, valid_locations))]
+        df = df[rows_with_any(df['_Countries'], valid_locations)]
 
     return df
 
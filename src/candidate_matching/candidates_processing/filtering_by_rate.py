@@ -67,15 +67,16 @@ def filter_candidates_by_rate(df, vacancy_rate_str: str, rate_tolerance:int=5):
 
     # Calculate maximum allowed rate
     max_allowed_rate = vacancy_value_usd + rate_tolerance
-    # Apply conversion to candidate rates
-    df['Rate USD'] = df['Entry wage rate (EWR)'].apply(convert_to_usd)
+    # Candidate rates are converted to USD once per snapshot ('_Rate USD')
+    if '_Rate USD' in df.columns:
+        rate_usd = df['_Rate USD']
+    else:
+        rate_usd = pd.to_numeric(df['Entry wage rate (EWR)'].apply(convert_to_usd), errors='coerce')
     # Filter candidates:
     # 1. Keep candidates with no rate specified
     # 2. Keep candidates with rate <= max_allowed_rate
     filtered_df = df[
-        (df['Rate USD'].isna()) |
-        (df['Rate USD'] <= max_allowed_rate)
+        (rate_usd.isna()) |
+        (rate_usd <= max_allowed_rate)
     ]
-    # Drop temporary column
-    filtered_df = filtered_df.drop(columns=['Rate USD'])
     return filtered_df
@@ -1,9 +1,11 @@
 from typing import List
 
+import numpy as np
 import pandas as pd
 
+from src.candidate_matching.candidates_processing.candidate_features import add_candidate_features, get_stack_index
 from src.logger import logger
-from src.data_processing.nlp.tokenization import get_tokens, create_tokens_set
+from src.data_processing.nlp.tokenization import create_tokens_set
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -89,6 +91,43 @@ def get_names(df):
     return names_string
 
 
+def technologies_matching_vacancy_tokens(technologies: pd.Series, vacancy_tokens: set) -> pd.Series:
+    """
+    Vectorized filter_technologies_by_vacancy_tokens over the '_Stack Technologies' tuples:
+    each distinct technology is checked against the vacancy tokens once.
+    """
+    exploded = technologies.explode().dropna()
+    lowered_tokens = [token.lower() for token in vacancy_tokens]
+    matching = {tech for tech in exploded.unique()
+                if any(token in tech.lower() for token in lowered_tokens)}
+    matched = exploded[exploded.isin(matching).to_numpy()]
+    return matched.groupby(level=0).agg(', '.join).reindex(technologies.index, fill_value='')
+
+def select_by_coverage(df: pd.DataFrame, coverage: np.ndarray, thresholds: List[int], min_count: int,
+                       title: str, filter_history: List[str]):
+    """
+    Picks the highest threshold keeping at least min_count candidates (or the last one) with a single
+    histogram lookup and logs the candidates of every checked threshold.
+    Returns:
+        tuple: (candidates with coverage >= selected threshold, True if min_count was reached)
+    """
+    sorted_coverage = np.sort(coverage)
+    counts = len(coverage) - np.searchsorted(sorted_coverage, thresholds, side='left')
+    reached = np.flatnonzero(counts >= min_count)
+    selected = reached[0] if len(reached) else len(thresholds) - 1
+    names = df['Full Name'].astype(str).to_numpy()
+    for threshold, candidates_count in zip(thresholds[:selected + 1], counts[:selected + 1]):
+        mask = coverage >= threshold
+        candidates_names = ', '.join(names[mask])
+        covered = coverage[mask]
+        if len(covered):
+            candidates_names = f"{candidates_names}\nCoverage: {covered.min()}-{covered.max()}\n"
+        else:
+            candidates_names = f"{candidates_names}\nCoverage: nan-nan\n"
+        filter_history.append(f"{title} coverage >= {threshold}%: {candidates_count} candidates ({candidates_names})")
+        logger.info(filter_history[-1])
+    return df[coverage >= thresholds[selected]], bool(len(reached))
+
 def filter_candidates_by_technologies(df, vacancy_info, min_candidates_threshold_to_analize):
     """
     Filters candidates based on programming languages and technologies mentioned in the vacancy information.
@@ -106,43 +145,33 @@ def filter_candidates_by_technologies(df, vacancy_info, min_candidates_threshold
     vacancy_technologies = mitigate_cloud_technologies_impact(vacancy_info.get("Extracted Technologies", []))
     vacancy_technologies_set = create_tokens_set(vacancy_technologies)
 
+    df = add_candidate_features(df)
     pl_thresholds = [90, 60, 30]
     tech_thresholds = [40, 30, 20, 10, 5]
     filter_history = []
 
+    # Coverage is computed from the inverted index of the 'Stack' tokens
+    stack_index = get_stack_index(df)
+
     # Step 5: Get candidates with fully covered programming languages
     if vacancy_programming_set and len(df) > min_candidates_threshold_to_analize:
-        df['Coverage'] = df['Stack'].apply(
-            lambda x: covered_percentage(vacancy_programming_set, get_tokens(x))
-        )
-        partial_pl_coverage_df = pd.DataFrame()
-        for threshold in pl_thresholds:
-            partial_pl_coverage_df = df[df['Coverage'] >= threshold]
-            candidates_count = len(partial_pl_coverage_df)
-            candidates_names = get_names(partial_pl_coverage_df)
-            filter_history.append(f"Programming languages coverage >= {threshold}%: {candidates_count} candidates ({candidates_names})")
-            logger.info(filter_history[-1])
-            if candidates_count >= min_candidates_threshold_to_analize:
-                break
+        coverage = stack_index.coverage(df.index, vacancy_programming_set)
+        df['Coverage'] = coverage
+        partial_pl_coverage_df, _ = select_by_coverage(df, coverage, pl_thresholds,
+                                                       min_candidates_threshold_to_analize,
+                                                       "Programming languages", filter_history)
     else:
         partial_pl_coverage_df = df
         filter_history.append(f"It is less then {min_candidates_threshold_to_analize} candidates or NO  programming languages specified in vacancy.")
 
     # Step 6: Get candidates with coverage of other technologies
     if vacancy_technologies_set and len(partial_pl_coverage_df) > min_candidates_threshold_to_analize:
-        partial_pl_coverage_df['Coverage'] = partial_pl_coverage_df['Stack'].apply(
-            lambda x: covered_percentage(vacancy_technologies_set, get_tokens(x))
-        )
-        partial_tech_coverage_df = pd.DataFrame()
-        for threshold in tech_thresholds:
-            partial_tech_coverage_df = partial_pl_coverage_df[partial_pl_coverage_df['Coverage'] >= threshold]
-            candidates_count = len(partial_tech_coverage_df)
-            candidates_names = get_names(partial_tech_coverage_df)
-            filter_history.append(f"Technologies coverage >= {threshold}%: {candidates_count} candidates ({candidates_names})")
-            logger.info(filter_history[-1])
-            if candidates_count >= min_candidates_threshold_to_analize:
-                break
-        else:
+        coverage = stack_index.coverage(partial_pl_coverage_df.index, vacancy_technologies_set)
+        partial_pl_coverage_df['Coverage'] = coverage
+        partial_tech_coverage_df, reached = select_by_coverage(partial_pl_coverage_df, coverage, tech_thresholds,
+                                                               min_candidates_threshold_to_analize,
+                                                               "Technologies", filter_history)
+        if not reached:
             if len(partial_tech_coverage_df) < min_candidates_threshold_to_analize:
                 partial_tech_coverage_df = partial_pl_coverage_df
                 candidates_count = len(partial_tech_coverage_df)
@@ -158,7 +187,8 @@ def filter_candidates_by_technologies(df, vacancy_info, min_candidates_threshold
                          vacancy_info.get("Nice to have Programming Languages", []) +
                          vacancy_info.get("Nice to have Technologies", []))
     all_vacancy_tokens_set = create_tokens_set(all_vacancy_techs)
-    partial_tech_coverage_df['_Stack'] = partial_tech_coverage_df['Stack'].apply(lambda stack: filter_technologies_by_vacancy_tokens(stack, all_vacancy_tokens_set))
+    partial_tech_coverage_df['_Stack'] = technologies_matching_vacancy_tokens(
+        partial_tech_coverage_df['_Stack Technologies'], all_vacancy_tokens_set)
 
     return partial_tech_coverage_df, filter_history_str
 
@@ -1,6 +1,9 @@
 import re
+from html import escape
 from typing import List
 
+import pandas as pd
+
 from src.data_processing.nlp.emoji_processing import extract_emoji
 from src.data_processing.nlp.tokenization import create_tokens_set
 from dotenv import load_dotenv
@@ -123,6 +126,34 @@ def generate_candidates_summary(better_fit_df, lesser_fit_df, extracted_technolo
     return better_fit_df, lesser_fit_df
 
 
+def format_shortlist_message(filtered_df, max_candidates: int = 30):
+    """
+    Progress message shown after filtering: the candidates that go to the LLM ranking with their tech coverage.
+    """
+    lines = [f"<b>🔎 Shortlist before ranking: {len(filtered_df)} candidates</b>"]
+    for index, (_, row) in enumerate(filtered_df.head(max_candidates).iterrows(), start=1):
+        coverage = row.get('Coverage')
+        coverage = f" — {int(coverage)}% stack" if coverage is not None and pd.notnull(coverage) else ""
+        lines.append(f"{index}. {escape(str(row['Full Name']))}{coverage}")
+    if len(filtered_df) > max_candidates:
+        lines.append(f"… and {len(filtered_df) - max_candidates} more")
+    return "\n".join(lines)
+
+
+def format_ranking_progress_message(selected_df, assessed_count: int, total_count: int, max_candidates: int = 30):
+    """
+    Progress message shown while the ranking shards return: the candidates selected so far by score.
+    """
+    lines = [f"<b>⏳ Ranking: {assessed_count} of {total_count} candidates assessed</b>",
+             f"<b>🎯 Best-fit so far:</b>"]
+    if selected_df.empty:
+        lines.append("_")
+    selected_df = selected_df.sort_values(by='Suitability Score', ascending=False)
+    for index, (_, row) in enumerate(selected_df.head(max_candidates).iterrows(), start=1):
+        lines.append(f"{index}. {escape(str(row['Full Name']))} {int(float(row['Suitability Score']) * 100)}%")
+    return "\n".join(lines)
+
+
 def format_tech_sting(extracted_technologies: List, nice_to_have_technologies: List, sep: str=" • "):
     extracted_technologies = sep.join(extracted_technologies)
     nice_to_have_technologies = sep.join(nice_to_have_technologies)
@@ -1,15 +1,20 @@
 import re
-from datetime import datetime
-from typing import Iterable, Set
+import threading
+import time
+from datetime import date, datetime
 
 import numpy as np
 import pandas as pd
 
-from src.data_processing.date_parser import is_available_soon
-from src.data_processing.nlp.emoji_processing import extract_emoji
-from src.google_services.sheets import read_specific_columns, write_specific_columns
+from src.candidate_matching.candidates_processing.candidate_features import get_candidate_features, \
+    build_engagement_features, ENGAGEMENT_FEATURE_COLUMNS, ENGAGEMENT_RED, ENGAGEMENT_YELLOW, ENGAGEMENT_GREEN
+from src.google_services.candidates_snapshot import candidates_snapshot
+from src.google_services.sheets import write_specific_columns
 from src.logger import logger
 
+# Filter features are parsed as soon as a new snapshot is loaded, not by the first search
+candidates_snapshot.add_load_listener(get_candidate_features)
+
 # Function to extract currency symbol from string
 def extract_currency(value):
     if pd.isna(value) or value == '':
@@ -31,77 +36,25 @@ def extract_numeric_value(value):
     except ValueError:
         return np.nan
 
-def filter_candidates_by_engagement(df: pd.DataFrame, keyword=None, col: str = "LVL of engagement") -> pd.DataFrame:
+def filter_candidates_by_engagement(df: pd.DataFrame, keyword=None, col: str = "LVL of engagement",
+                                    days_threshold: int = 30) -> pd.DataFrame:
     """
     Filters the DataFrame to include only rows where 'LVL of engagement' has specific values.
+    Uses the '_Engagement Class' and '_Available From' columns parsed once per snapshot,
+    they are built here if df does not have them.
     Args:
     - df (pd.DataFrame): The DataFrame containing candidate data.
     Returns:
     - pd.DataFrame: A filtered DataFrame with only the relevant rows.
     """
-    # Define the valid engagement levels
-    red_engagement_levels = {
-        # "➕Added",
-        # "📡Pending Connection",
-        # "🔗 In Connections",
-        # "🚀 Actively Applying",
-        # "⏳Pending Responsе",
-        # "💬In Talks",
-        # "🔓Ready to work with",
-        # "🙋Eager Applicant",
-        # "🤝Interviewed",
-        # "✅English checked",
-        # "📄Proposed",
-        # "🔄WorkING",
-        # "🏁WorkED",
-        "💔 Refused Further Work",
-        "🚧On hold",
-        "📵 Candidate unreachable",
-        "❌ Checked: fake detected",
-        "🚨 Suspected fake",
-        "💸Too expensive"
-    }
-    green_engagement_levels = {
-        "🚀 Actively Applying",
-        "🔓Ready to work with",
-        "🙋Eager Applicant",
-        "🤝Interviewed",
-        "✅English checked",
-        "📄Proposed",
-        "🔄WorkING",
-        "🏁WorkED"
-    }
-    yellow_engagement_levels = {
-        "➕Added",
-        "📡Pending Connection",
-        "🔗 In Connections",
-        "⏳Pending Responsе",
-        "💬In Talks"
-    }
-
-    def build_emoji_set(levels: Iterable[str]) -> Set[str]:
-        out = set()
-        for lvl in levels:
-            ems = extract_emoji(str(lvl))
-            if ems:
-                out.update(ems)  # ems — строка из эмодзи; добавляем по символам
-        return out
-
-    red_emojis = build_emoji_set(red_engagement_levels)
-    yellow_emojis = build_emoji_set(yellow_engagement_levels)
-    green_emojis = build_emoji_set(green_engagement_levels)
-    df2 = df.copy()
-    emoji_col = df2[col].astype(str).map(lambda s: extract_emoji(s) or "")
-
-    def has_any(target_emojis: Set[str]) -> pd.Series:
-        if not target_emojis:
-            return pd.Series(False, index=df2.index)
-        pattern = "|".join(map(re.escape, sorted(target_emojis)))
-        return emoji_col.str.contains(pattern, regex=True, na=False)
-
-    has_red = has_any(red_emojis)
-    has_yellow = has_any(yellow_emojis)
-    has_green = has_any(green_emojis)
+    if all(column in df.columns for column in ENGAGEMENT_FEATURE_COLUMNS):
+        features = df
+    else:
+        features = build_engagement_features(df.rename(columns={col: 'LVL of engagement'}))
+    classes = features['_Engagement Class'].to_numpy()
+    has_red = (classes & ENGAGEMENT_RED) != 0
+    has_yellow = (classes & ENGAGEMENT_YELLOW) != 0
+    has_green = (classes & ENGAGEMENT_GREEN) != 0
     # Filtering logic based on keyword
     if keyword == "ALL":
         # Keep all those without red emojis
@@ -109,12 +62,13 @@ def filter_candidates_by_engagement(df: pd.DataFrame, keyword=None, col: str = "
     else:
         # Current logic: exclude red emojis and those with only yellow emojis
         keep_mask = (~has_red) & (~(has_yellow & ~has_green))
-        available_from_condition = df2.apply(
-            lambda row: is_available_soon(row, column_name='Available From', days_threshold=30),
-            axis=1
-        )
+        # Available now: no date at all, or a date at most days_threshold days ago or in the future
+        available_from = df['Available From']
+        no_date = (available_from.isna() | (available_from == '')).to_numpy()
+        earliest_date = pd.Timestamp(date.today()) - pd.Timedelta(days=days_threshold)
+        available_from_condition = no_date | (features['_Available From'] >= earliest_date).to_numpy()
         keep_mask = keep_mask & available_from_condition
-    return df2.loc[keep_mask]
+    return df.loc[keep_mask].copy()
 
 
 
@@ -123,55 +77,146 @@ def clean_and_extract_first_word(name):
     first_word = cleaned_name.split()[0] if cleaned_name else ''
     return first_word
 
-def get_df_for_vacancy_search(keyword=None):
+# Columns to extract to find candidates for vacancy
+VACANCY_SEARCH_COLUMNS = [
+    'First Name', 'Last Name', 'LVL of engagement', 'Available From',
+    'Seniority',  'Main Roles', 'Additional Roles',
+    'From', 'LinkedIn', 'Telegram', 'Phone', 'Email', 'WhatsApp',
+    'Stack', 'Industries', 'Expertise', 'Languages',
+    'Work hrs/mnth', 'Location', 'CV (original)', 'CV White Label',
+    'Entry wage rate (EWR)', 'Sell rate', 'NDA'
+]
+
+
+def on_unique_values(values: pd.Series, function) -> pd.Series:
+    """
+    Applies a vectorized string function to the distinct values of a column only:
+    names, rates and currencies repeat a lot across candidates.
+    """
+    codes, uniques = pd.factorize(values.fillna('').astype(str))
+    result = function(pd.Series(uniques, dtype=object))
+    return pd.Series(result.to_numpy()[codes], index=values.index)
+
+
+def first_words(names: pd.Series) -> pd.Series:
+    """
+    Vectorized clean_and_extract_first_word.
+    """
+    return on_unique_values(names, lambda text: text.str.replace(r'[^a-zA-Z\s]', '', regex=True)
+                            .str.split().str[0].fillna(''))
+
+
+def numeric_values(values: pd.Series) -> pd.Series:
+    """
+    Vectorized extract_numeric_value.
+    """
+    return on_unique_values(values, lambda text: pd.to_numeric(
+        text.str.replace(r'[^\d.,]', '', regex=True).str.replace(',', '.'), errors='coerce'))
 
-    # Define the columns to extract to find candidates for vacancy
-    columns_to_extract = [
-        'First Name', 'Last Name', 'LVL of engagement', 'Available From',
-        'Seniority',  'Main Roles', 'Additional Roles',
-        'From', 'LinkedIn', 'Telegram', 'Phone', 'Email', 'WhatsApp',
-        'Stack', 'Industries', 'Expertise', 'Languages',
-        'Work hrs/mnth', 'Location', 'CV (original)', 'CV White Label',
-        'Entry wage rate (EWR)', 'Sell rate', 'NDA'
-    ]
 
-    # Get specific columns with hyperlinks
-    df = read_specific_columns(columns_to_extract)
-    logger.info(f"number of candidates after reading {len(df)}" )
-    df = filter_candidates_by_engagement(df, keyword)
+def currencies(values: pd.Series) -> pd.Series:
+    """
+    Vectorized extract_currency.
+    """
+    return on_unique_values(values, lambda text: text.str.extract(r'^([^\d\s]+)', expand=False)
+                            .fillna('$').where(text != ''))
 
 
-    df['Full Name'] = df.apply(lambda row: f"{clean_and_extract_first_word(row['First Name'])} {clean_and_extract_first_word(row['Last Name'])}", axis=1)
+def prepare_candidates_for_vacancy_search(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Builds the vacancy search columns from the sheet columns: 'Full Name', 'Role', 'margin',
+    'Stack' without ratings, '' -> '_' and '\n' -> ', ' in all text cells.
+    Rows without a name or without both role and stack are dropped.
+    """
+    df = df.copy()
+    df['Full Name'] = first_words(df['First Name']) + " " + first_words(df['Last Name'])
     df['Role'] = df['Main Roles'] # + ", " + df['Additional Roles']
     df.drop(columns=['Main Roles', 'Additional Roles'], inplace=True)
 
     # Calculate 'margin' as the difference between 'Sell rate' and 'Entry wage rate (EWR)'
-    df['sell_rate_numeric'] = df['Sell rate'].apply(extract_numeric_value)
-    df['ewr_numeric'] = df['Entry wage rate (EWR)'].apply(extract_numeric_value)
-    df['ewr_currency'] = df['Entry wage rate (EWR)'].apply(extract_currency)
-    df['margin_numeric'] = (df['sell_rate_numeric'] - df['ewr_numeric']).round(2)
+    margin_numeric = (numeric_values(df['Sell rate']) - numeric_values(df['Entry wage rate (EWR)'])).round(2)
+    ewr_currency = currencies(df['Entry wage rate (EWR)'])
     # Format margin column with currency from EWR
-    df['margin'] = df.apply(
-        lambda row: f"≈{row['ewr_currency']}{row['margin_numeric']:.2f}/hr"
-        if pd.notnull(row['margin_numeric']) and pd.notnull(row['ewr_currency']) else "_",
-        axis=1
-    )
-    df = df.drop(['sell_rate_numeric', 'ewr_numeric', 'ewr_currency', 'margin_numeric'], axis=1)
-
-    initial_count = len(df)
+    has_margin = margin_numeric.notna() & ewr_currency.notna()
+    margin = pd.Series("_", index=df.index, dtype=object)
+    margin[has_margin] = ("≈" + ewr_currency[has_margin] +
+                          np.char.mod('%.2f', margin_numeric[has_margin].to_numpy()) + "/hr")
+    df['margin'] = margin
+
     df = df[~((df['Role'] == '') & (df['Stack'] == ''))]
     df = df[~((df['First Name'] == '') | (df['Last Name'] == ''))]
 
     # Remove ratings (numbers after dash) from Stack column
-    df['Stack'] = df['Stack'].apply(
-        lambda x: re.sub(r'\s*-\s*\d+', '', str(x)) if pd.notnull(x) else x
-    )
+    df['Stack'] = df['Stack'].str.replace(r'\s*-\s*\d+', '', regex=True)
+
+    # Replace '' -> '_' and '\n' -> ', ' in all text cells
+    for column in df.columns[df.dtypes == object]:
+        values = df[column]
+        replaced = values.where(values != '', '_')
+        if _may_contain(values, '\n'):
+            replaced = replaced.str.replace('\n', ', ', regex=False)
+            # Cells that are not strings are kept as they are
+            replaced = replaced.where(replaced.notna(), values)
+        df[column] = replaced
+    return df
 
-    # Replace '' -> '_' and '\n' -> ', '  in the entire DataFrame
-    df = df.applymap(lambda x: '_' if isinstance(x, str) and x == '' else x)
-    df = df.applymap(lambda x: x.replace('\n', ', ') if isinstance(x, str) else x)
-    logger.info(f"number of candidates after filtering {len(df)}")
 
+def _may_contain(values: pd.Series, substring: str) -> bool:
+    """
+    Quick check over a whole column in one string join, most columns never have line breaks.
+    """
+    try:
+        return substring in "\x00".join(values.to_numpy())
+    except TypeError:
+        return True
+
+
+_prepared_lock = threading.Lock()
+_prepared_cache = {}
+
+
+def get_prepared_candidates(snapshot) -> pd.DataFrame:
+    """
+    Returns the prepared candidates of a snapshot joined with their features, built once per snapshot version.
+    The DataFrame is shared and must not be modified.
+    """
+    prepared = _prepared_cache.get(snapshot.version)
+    if prepared is not None:
+        return prepared
+    with _prepared_lock:
+        prepared = _prepared_cache.get(snapshot.version)
+        if prepared is None:
+            start_time = time.time()
+            prepared = prepare_candidates_for_vacancy_search(snapshot.df[VACANCY_SEARCH_COLUMNS + ['Row in Spreadsheets']])
+            prepared = prepared.join(get_candidate_features(snapshot))
+            # Only the latest snapshot is searched, older data is dropped
+            _prepared_cache.clear()
+            _prepared_cache[snapshot.version] = prepared
+            logger.info(f"Candidates for vacancy search prepared for snapshot v{snapshot.version} "
+                        f"in {time.time() - start_time:.2f} sec")
+    return prepared
+
+
+# The search data of a new snapshot is prepared as soon as it is loaded
+candidates_snapshot.add_load_listener(get_prepared_candidates)
+
+
+def get_df_for_vacancy_search(keyword=None, snapshot=None):
+    # Get the candidates from the in-memory snapshot of the sheet,
+    # vacancies of one post pass the same snapshot
+    if snapshot is None:
+        snapshot = candidates_snapshot.get_snapshot()
+    logger.info(f"number of candidates after reading {len(snapshot)}" )
+    # Engagement and availability are checked on the sheet values with the columns parsed once per snapshot
+    features = get_candidate_features(snapshot)
+    engaged_df = filter_candidates_by_engagement(
+        snapshot.df[['LVL of engagement', 'Available From']].join(features[ENGAGEMENT_FEATURE_COLUMNS]), keyword)
+
+    prepared = get_prepared_candidates(snapshot)
+    df = prepared[prepared.index.isin(engaged_df.index)].copy()
+    logger.info(f"number of candidates after filtering {len(df)}")
+    # Lets the filters use the inverted stack index of this snapshot
+    df.attrs['snapshot_version'] = snapshot.version
     return df
 
 
@@ -191,9 +236,13 @@ def check_and_update_past_available_dates():
             return False
 
     columns_to_extract = ['First Name', 'Last Name', 'LVL of engagement', 'Available From']
-    df = read_specific_columns(columns_to_extract)
+    # Rows are written by position, so the data must be read from the current state of the sheet
+    df = candidates_snapshot.refresh(force=True).get_df(columns_to_extract)
+    previous_df = df[['Available From']].copy()
     df['is_past'] = df['Available From'].apply(is_date_past)
     df.loc[df['is_past'], 'Available From'] = ''
     df.drop(columns=['is_past'], inplace=True)
-    write_specific_columns(df['Available From'])
+    # Only the cleared dates are sent
+    write_specific_columns(df[['Available From']], previous_df=previous_df)
+    candidates_snapshot.invalidate()
 
@@ -1,19 +1,30 @@
+import asyncio
+import os
 import time
+import traceback
+from html import escape
 
 from telegram import Update
 
-from src.bot.utils import send_answer_message
-from src.candidate_matching.candidates_processing.candidate_llm_processor import process_candidates_with_llm
+from src.bot.utils import send_answer_message, ProgressMessage
+from src.candidate_matching.candidates_processing.candidate_llm_processor import process_candidates_with_llm, \
+    collect_assessments
 from src.candidate_matching.candidates_processing.filtering import primary_filtering_by_vacancy
 from src.candidate_matching.candidates_processing.format_candidates import generate_candidates_summary, \
-    generate_final_response
+    generate_final_response, format_shortlist_message, format_ranking_progress_message
 from src.candidate_matching.candidates_processing.input_candidates import get_df_for_vacancy_search
+from src.candidate_matching.search_result_cache import search_result_cache, without_costs
 from src.candidate_matching.vacancy_processing.save_vacancy_to_sales import save_vacancy_to_sales
-from src.candidate_matching.vacancy_processing.vacancy_llm_processor import extract_vacancy_info
+from src.candidate_matching.vacancy_processing.vacancy_llm_processor import extract_vacancy_info, \
+    extract_vacancy_info_async
 from src.candidate_matching.vacancy_processing.vacancy_googlesheet import check_existing_vacancy, save_vacancy_description
 from src.candidate_matching.vacancy_processing.vacancy_splitter import split_vacancies
+from src.google_services.candidates_snapshot import candidates_snapshot
 from src.logger import logger
-from src.data_processing.nlp.llm_handler import LLMHandler
+from src.data_processing.nlp.llm_handler import LLMHandler, AsyncLLMHandler, get_sync_handler
+
+# Vacancies of one post searched at the same time, their LLM calls are throttled by the global rate limiter
+MAX_PARALLEL_VACANCIES = int(os.getenv("MAX_PARALLEL_VACANCIES", 5))
 
 # def get_roles(df):
 #     # Split the roles and explode them into separate rows
@@ -32,42 +43,90 @@ def extract_keyword(text: str) -> str:
     return None
 
 
-async def find_candidates_for_vacancy(vacancy, llm_handler, user, keyword=None):
+async def find_candidates_for_vacancy(vacancy, llm_handler, user, keyword=None, snapshot=None, progress=None):
+    """
+    Runs the candidates search for one vacancy and returns (tg_answer, selected candidates).
+    With a ProgressMessage the shortlist after filtering and the ranking as it goes are shown to the user,
+    the caller finishes the message with the answer.
+    """
     start_time = time.time()
     vacancy_dict = {}  # Initialize vacancy_dict to store all necessary information
+    # Blocking steps run in worker threads so the event loop keeps serving other updates
+    sync_handler = get_sync_handler(llm_handler)
 
     # Step 0: Check if a similar vacancy exists
     step0_start_time = time.time()
-    prev_call = check_existing_vacancy(vacancy)
+    prev_call = await asyncio.to_thread(check_existing_vacancy, vacancy)
     vacancy_dict['step0_time'] = time.time() - step0_start_time
 
-    # if (prev_call is not None) and \
-    #    ('tg_answer' in prev_call) and \
-    #    int(prev_call['step1 num number of initial candidates']) == len(get_df_for_vacancy_search()):
-    #     return prev_call['tg_answer']
+    # The same vacancy searched on the same candidates gets the memoized answer
+    cached_search = search_result_cache.get(vacancy, keyword)
+    if cached_search is not None:
+        if snapshot is None:
+            snapshot = await asyncio.to_thread(candidates_snapshot.get_snapshot)
+        snapshot_version = snapshot.version
+        if cached_search['snapshot_version'] == snapshot_version:
+            logger.info(f"Vacancy already searched on candidates snapshot v{snapshot_version}, "
+                        f"sending the memoized answer")
+            vacancy_dict = without_costs(cached_search['vacancy_dict'])
+            vacancy_dict['Cached Answer'] = True
+            vacancy_dict['step0_time'] = time.time() - step0_start_time
+            for step in range(1, 6):
+                vacancy_dict[f'step{step}_time'] = 0
+            vacancy_dict['total_time'] = time.time() - start_time
+            await asyncio.to_thread(save_vacancy_description, vacancy, prev_call, vacancy_dict, user)
+            return vacancy_dict['tg_answer'], vacancy_dict["Selected Candidates"]
+
+    # An exact duplicate of a recently searched vacancy gets the saved answer, steps 1-5 are skipped
+    if cached_search is None and prev_call is not None and prev_call.get('tg_answer') and keyword is None:
+        logger.info(f"Exact duplicate of the cached vacancy from {prev_call['Date']}, sending the saved answer")
+        vacancy_dict['tg_answer'] = prev_call['tg_answer']
+        vacancy_dict['Cached Answer'] = True
+        vacancy_dict['step1_candidates_number'] = prev_call['step1 num number of initial candidates']
+        vacancy_dict['total_time'] = time.time() - start_time
+        await asyncio.to_thread(save_vacancy_description, vacancy, prev_call, vacancy_dict, user)
+        return vacancy_dict['tg_answer'], vacancy_dict.get("Selected Candidates", "")
 
     # Step 1: Initialize list of candidates
     step1_start_time = time.time()
-    initial_candidates_df = get_df_for_vacancy_search(keyword)
+    initial_candidates_df = await asyncio.to_thread(get_df_for_vacancy_search, keyword, snapshot)
     vacancy_dict['step1_candidates_number'] = len(initial_candidates_df)
     vacancy_dict['step1_time'] = time.time() - step1_start_time
 
-    # Step 2: Extract key information from the vacancy
+    # Step 2: Extract key information from the vacancy (reused if only the candidates changed)
     step2_start_time = time.time()
-    vacancy_dict.update(extract_vacancy_info(vacancy, llm_handler))
+    if cached_search is not None:
+        vacancy_info = without_costs(cached_search['vacancy_info'])
+    elif isinstance(llm_handler, AsyncLLMHandler):
+        vacancy_info = await extract_vacancy_info_async(vacancy, llm_handler)
+    else:
+        vacancy_info = await asyncio.to_thread(extract_vacancy_info, vacancy, llm_handler)
+    vacancy_dict.update(vacancy_info)
     vacancy_dict['step2_time'] = time.time() - step2_start_time
 
     # Step 3: Filter candidates by vacancy information
     step3_start_time = time.time()
-    filtered_candidates_df, vacancy_dict['filtering_history'] = primary_filtering_by_vacancy(vacancy_dict, initial_candidates_df)
+    filtered_candidates_df, vacancy_dict['filtering_history'] = await asyncio.to_thread(
+        primary_filtering_by_vacancy, vacancy_dict, initial_candidates_df)
     vacancy_dict['list_of_filtered_candidates'] = ", ".join(filtered_candidates_df['Full Name'])
     vacancy_dict['step3_candidates_number'] = len(filtered_candidates_df)
     vacancy_dict['step3_time'] = time.time() - step3_start_time
     logger.info(f"number of candidates after consign_similarity_threshold() {vacancy_dict['step3_candidates_number']}")
+    on_progress = None
+    if progress is not None:
+        await progress.show(format_shortlist_message(filtered_candidates_df))
+        loop = asyncio.get_running_loop()
+
+        def on_progress(selected_df, assessed_count, total_count):
+            progress.show_threadsafe(format_ranking_progress_message(selected_df, assessed_count, total_count), loop)
 
     # Step 4: Process candidates with LLM
     step4_start_time = time.time()
-    better_fit_df, lesser_fit_df, vacancy_dict = process_candidates_with_llm(vacancy, filtered_candidates_df, vacancy_dict, llm_handler)
+    better_fit_df, lesser_fit_df, vacancy_dict = await asyncio.to_thread(
+        process_candidates_with_llm, vacancy, filtered_candidates_df, vacancy_dict, sync_handler,
+        cached_assessments=cached_search['assessments'] if cached_search is not None else None,
+        on_progress=on_progress)
+    assessments = collect_assessments(better_fit_df, lesser_fit_df)
     vacancy_dict['step4_candidates_number'] = len(better_fit_df)
     vacancy_dict['step4_time'] = time.time() - step4_start_time
     logger.info(vacancy_dict)
@@ -83,7 +142,9 @@ async def find_candidates_for_vacancy(vacancy, llm_handler, user, keyword=None):
 
     # Step 6: Save results to Google Sheets
     vacancy_dict['total_time'] = time.time() - start_time
-    save_vacancy_description(vacancy, prev_call, vacancy_dict, user)
+    search_result_cache.put(vacancy, keyword, initial_candidates_df.attrs.get('snapshot_version'), vacancy_info,
+                            vacancy_dict, assessments)
+    await asyncio.to_thread(save_vacancy_description, vacancy, prev_call, vacancy_dict, user)
 
     return vacancy_dict['tg_answer'], vacancy_dict["Selected Candidates"]
 
@@ -91,12 +152,12 @@ async def find_candidates_for_vacancy(vacancy, llm_handler, user, keyword=None):
 
 async def match_candidats(update: Update,  text, user_name, llm_handler=None) -> None:
     if llm_handler is None:
-        llm_handler = LLMHandler()
+        llm_handler = AsyncLLMHandler()
 
     keyword = extract_keyword(text)
     if keyword:
         text = text[len(keyword):].strip()
-    vacancies = split_vacancies(text, llm_handler)
+    vacancies = await asyncio.to_thread(split_vacancies, text, get_sync_handler(llm_handler))
 
     message = f"Found {len(vacancies)} vacancies"
     logger.info(message)
@@ -104,18 +165,38 @@ async def match_candidats(update: Update,  text, user_name, llm_handler=None) ->
           vacancy = vacancies[0]
           if len(vacancy) > len(text):
               vacancy = text
-          result, candidates = await find_candidates_for_vacancy(vacancy, llm_handler, user_name, keyword)
+          progress = ProgressMessage(update)
+          result, candidates = await find_candidates_for_vacancy(vacancy, llm_handler, user_name, keyword,
+                                                                 progress=progress)
           logger.info("ready_to_send_message")
-          save_vacancy_to_sales(update, text, result, keyword)
-          await send_answer_message(update, result)
+          await progress.finish(result)
+          await asyncio.to_thread(save_vacancy_to_sales, update, text, result, keyword)
     else:
-          results = []
-          for vacancy in vacancies:
-              result, candidates  = await find_candidates_for_vacancy(vacancy, llm_handler, user_name, keyword)
-              save_vacancy_to_sales(update, text, result, keyword)
-              result = f"{vacancy}\n{result}\n"
-              await send_answer_message(update, result)
-              # update.message.reply_text(result)
+          await match_vacancies_concurrently(update, text, vacancies, user_name, llm_handler, keyword)
+
+
+async def match_vacancies_concurrently(update: Update, text, vacancies, user_name, llm_handler, keyword=None):
+    """
+    Searches candidates for several vacancies of one post at the same time, all on the same candidates snapshot.
+    LLM calls of all vacancies share the global rate limiter; each answer is sent as soon as its vacancy is done.
+    """
+    snapshot = await asyncio.to_thread(candidates_snapshot.get_snapshot)
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_VACANCIES)
+
+    async def match_vacancy(vacancy):
+        async with semaphore:
+            title = (vacancy.strip().splitlines() or [''])[0][:100]
+            progress = ProgressMessage(update, header=f"<b>{escape(title)}</b>")
+            try:
+                result, candidates = await find_candidates_for_vacancy(vacancy, llm_handler, user_name, keyword,
+                                                                       snapshot, progress)
+                await progress.finish(f"{vacancy}\n{result}\n")
+                await asyncio.to_thread(save_vacancy_to_sales, update, text, result, keyword)
+            except Exception as e:
+                logger.error(f"Candidates search failed for vacancy: {e}\n{traceback.format_exc()}")
+                await progress.finish(f"{vacancy}\nFailed to find candidates for this vacancy.\n")
+
+    await asyncio.gather(*(match_vacancy(vacancy) for vacancy in vacancies))
 
 async def process_vacancy(update: Update, text: str,  user_name: str, llm_handler):
     await send_answer_message(update, "Searching for candidates....")
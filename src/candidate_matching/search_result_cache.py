@@ -0,0 +1,93 @@
+import copy
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from src.logger import logger
+
+load_dotenv()
+
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", 200))
+SEARCH_RESULT_CACHE_TTL = int(os.getenv("SEARCH_RESULT_CACHE_TTL", 24 * 60 * 60))  # seconds
+
+
+def normalize_vacancy(vacancy: str) -> str:
+    return re.sub(r'\s+', ' ', vacancy).strip().lower()
+
+
+def vacancy_key(vacancy: str, keyword: Optional[str]) -> tuple:
+    return hashlib.sha256(normalize_vacancy(vacancy).encode("utf-8")).hexdigest(), keyword
+
+
+def without_costs(vacancy_dict: dict) -> dict:
+    """
+    Copy of vacancy_dict with the LLM costs set to 0, for results reused without new LLM calls.
+    """
+    return {key: (0 if key.startswith('Cost ') else value) for key, value in vacancy_dict.items()}
+
+
+class SearchResultCache:
+    """
+    In-memory memo of find_candidates_for_vacancy, keyed by the normalized vacancy text and the keyword.
+    An entry remembers the candidates snapshot version it was computed on:
+    - same version: the saved answer is returned as it is;
+    - newer version: the extracted vacancy information and the LLM assessments of unchanged candidates
+      are reused, only the filtering and the assessment of new or changed candidates run again.
+    Snapshot versions are per process, so the memo is not persisted.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_RESULT_CACHE_SIZE, ttl: int = SEARCH_RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, vacancy: str, keyword: Optional[str] = None) -> Optional[dict]:
+        """
+        Returns a copy of the entry ('snapshot_version', 'vacancy_info', 'vacancy_dict', 'assessments') or None.
+        """
+        key = vacancy_key(vacancy, keyword)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['created_at'] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(entry)
+
+    def put(self, vacancy: str, keyword: Optional[str], snapshot_version: int, vacancy_info: dict,
+            vacancy_dict: dict, assessments: dict):
+        """
+        Saves a finished search: vacancy_info is the output of the vacancy extraction (step 2),
+        vacancy_dict the final one, assessments come from collect_assessments.
+        """
+        entry = copy.deepcopy({
+            'snapshot_version': snapshot_version,
+            'vacancy_info': vacancy_info,
+            'vacancy_dict': vacancy_dict,
+            'assessments': assessments,
+        })
+        entry['created_at'] = time.time()
+        key = vacancy_key(vacancy, keyword)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"Search result cached for snapshot v{snapshot_version}: "
+                    f"{len(assessments)} candidate assessments")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+search_result_cache = SearchResultCache()
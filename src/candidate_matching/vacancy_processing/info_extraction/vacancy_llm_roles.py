@@ -326,6 +326,7 @@ def extract_vacancy_role(
         model=model,
         max_tokens=max_tokens,
         response_format=VacancyExtraction,
+        hedge="extract_vacancy_role"  # one slow nano call among the parallel extractors sets the latency of extract_vacancy_info
     )
 
     # Parse the response
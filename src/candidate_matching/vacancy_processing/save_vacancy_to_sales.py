@@ -1,7 +1,7 @@
 from telegram import Update
 import re
 
-from src.google_services.sheets import write_dict_to_sheet
+from src.google_services.write_queue import sheet_write_queue
 
 
 def find_telegram_username_link(text):
@@ -79,4 +79,5 @@ def save_vacancy_to_sales(update: Update, vacancy_text: str, answer: str, keywor
             sales_cells_dict['Запыт'] = vacancy_text
             sales_cells_dict['Магчымыя кандыдаты на гэту заяўку падабраныя БОТАМ'] = parse_candidates_from_answer(answer)
 
-            write_dict_to_sheet(data_dict=sales_cells_dict, spreadsheet_env_name="SALES_SPREADSHEET_ID", sheet_name="Запыты")
+            sheet_write_queue.insert_row(sheet_name="Запыты", values=sales_cells_dict,
+                                         spreadsheet_env_name="SALES_SPREADSHEET_ID")
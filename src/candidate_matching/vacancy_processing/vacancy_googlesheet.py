@@ -1,70 +1,30 @@
 
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import List
 
-from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
 from tzlocal import get_localzone
 
-from src.data_processing.nlp.jaccard_similarity import calculate_jaccard_similarity
-from src.google_services.sheets import read_specific_columns, initialize_google_sheets_api
+from src.candidate_matching.vacancy_processing.vacancy_index import get_vacancy_index
+from src.google_services.write_queue import sheet_write_queue
 from src.logger import logger
-from src.data_processing.nlp.tokenization import get_tokens
 
 load_dotenv()
 
-def parse_date(date_str):
-    if ' ' in date_str:
-        date_part = date_str.split()[0]
-    else:
-        date_part = date_str
-    return datetime.strptime(date_part, '%Y-%m-%d')
-
 def check_existing_vacancy(vacancy_description):
     """
     Checks if a similar vacancy has been saved in the last VACANCY_CACHE_TIME days.
+    The lookup goes to the local near-duplicate index of the search cache sheet, not to the sheet itself.
 
     Args:
     - vacancy_description (str): The vacancy description.
 
     Returns:
-    - tuple or None: A tuple containing the row index and the user who added the vacancy if found, otherwise None.
+    - dict or None: The cache row of the most similar vacancy if its similarity is at least 0.8, otherwise None.
+      'tg_answer' is only there for an exact duplicate.
     """
-    some_days_ago = datetime.now() - timedelta(days=int(os.getenv("VACANCY_CACHE_TIME")))
-
-    # Define columns to extract
-    columns_to_extract = ["Date", "vacancy description", "tg_answer",
-                          "step1 num number of initial candidates"]
-
-    # Read specific columns from the vacancies sheet
-    vacancies_df = read_specific_columns(columns_to_extract, os.getenv("SEARCH_CACHE_SHEET_NAME"))
-
-    # Convert the input vacancy description to a set of words
-    input_word_set = get_tokens(vacancy_description)
-
-    # Check each row for a similar vacancy
-    for index, row in vacancies_df.iterrows():
-        saved_date_str = row['Date']
-        saved_date = parse_date(saved_date_str)
-
-        # Check if the date is within the last VACANCY_CACHE_TIME days
-        if saved_date < some_days_ago:
-            break
-
-        saved_description = row['vacancy description']
-
-        # Convert the saved vacancy description to a set of words
-        saved_word_set = get_tokens(saved_description)
-        jaccard_similarity = calculate_jaccard_similarity(input_word_set, saved_word_set)
-        # Check if the descriptions are similar
-        if jaccard_similarity >= 1:
-            return row
-        if jaccard_similarity >= 0.8:
-            del row['tg_answer']
-            return row  # Return the row index and the user
-
-    return None
+    return get_vacancy_index().find_similar(vacancy_description)
 
 def format_tech_sting(extracted_technologies: List, nice_to_have_technologies: List, sep: str="\n "):
     extracted_technologies = sep.join(extracted_technologies)
@@ -147,67 +107,32 @@ def prepare_cache_data(vacancy_description, vacancy_dict, current_date):
 
     return cache_results
 
-def save_to_sheet(service, spreadsheet_id, sheet_name, range_name, data):
-    value_input_option = "RAW"
-    value_range_body = {
-        "majorDimension": "ROWS",
-        "values": [data],
-    }
-
-    service.spreadsheets().values().update(
-        spreadsheetId=spreadsheet_id,
-        range=range_name,
-        valueInputOption=value_input_option,
-        body=value_range_body
-    ).execute()
-
-def insert_new_row(service, spreadsheet_id, sheet_name, sheet_index):
-    insert_request = {
-        "requests": [
-            {
-                "insertDimension": {
-                    "range": {
-                        "sheetId": sheet_index,
-                        "dimension": "ROWS",
-                        "startIndex": 1,
-                        "endIndex": 2
-                    }
-                }
-            }
-        ]
-    }
-    service.spreadsheets().batchUpdate(spreadsheetId=spreadsheet_id, body=insert_request).execute()
-
-def save_vacancy_description(vacancy_description, existing_vacancy, vacancy_dict, user, service=None):
-    if service is None:
-        service = initialize_google_sheets_api()
-
-    try:
-        STAFF_SPREADSHEET_ID = os.getenv("STAFF_SPREADSHEET_ID")
-        SEARCH_LOGS_SHEET_NAME = os.getenv("SEARCH_LOGS_SHEET_NAME")
-        SEARCH_CACHE_SHEET_NAME = os.getenv("SEARCH_CACHE_SHEET_NAME")
-        LOGS_SHEET_ID = os.getenv("LOGS_SHEET_ID")
-        CACHE_SHEET_ID = os.getenv("CACHE_SHEET_ID")
-
-        local_timezone = get_localzone()
-        current_date = datetime.now(local_timezone).strftime('%Y-%m-%d %H:%M:%S %Z')
-
-        insert_new_row(service, STAFF_SPREADSHEET_ID, SEARCH_LOGS_SHEET_NAME, LOGS_SHEET_ID)
-        range_logs = f"{SEARCH_LOGS_SHEET_NAME}!A2:AW2"
-        if existing_vacancy is not None:
-            row_index = existing_vacancy['Row in Spreadsheets']
-            range_cache = f"{SEARCH_CACHE_SHEET_NAME}!A{row_index}:D{row_index}"
-        else:
-            insert_new_row(service, STAFF_SPREADSHEET_ID, SEARCH_CACHE_SHEET_NAME, CACHE_SHEET_ID)
-            range_cache =  f"{SEARCH_CACHE_SHEET_NAME}!A2:D2"
-
-        logs_data =  prepare_logs_data(vacancy_description, vacancy_dict, user, current_date)
-        cache_data = prepare_cache_data(vacancy_description, vacancy_dict, current_date)
-
-        save_to_sheet(service, STAFF_SPREADSHEET_ID, SEARCH_LOGS_SHEET_NAME, range_logs, logs_data)
-        save_to_sheet(service, STAFF_SPREADSHEET_ID, SEARCH_CACHE_SHEET_NAME, range_cache, cache_data)
-
-        logger.info("Results saved to Google Sheets.")
-
-    except HttpError as err:
-        logger.error(f"An error occurred: {err}")
+def save_vacancy_description(vacancy_description, existing_vacancy, vacancy_dict, user):
+    """
+    Queues the search log row and the search cache row, they are written to Google Sheets in the background.
+    """
+    SEARCH_LOGS_SHEET_NAME = os.getenv("SEARCH_LOGS_SHEET_NAME")
+    SEARCH_CACHE_SHEET_NAME = os.getenv("SEARCH_CACHE_SHEET_NAME")
+
+    local_timezone = get_localzone()
+    current_date = datetime.now(local_timezone).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+    logs_data = prepare_logs_data(vacancy_description, vacancy_dict, user, current_date)
+    cache_data = prepare_cache_data(vacancy_description, vacancy_dict, current_date)
+
+    sheet_write_queue.insert_row(SEARCH_LOGS_SHEET_NAME, logs_data)
+    vacancy_index = get_vacancy_index()
+    if vacancy_dict.get('Cached Answer'):
+        # The answer was taken from the cache row as it is, the row keeps its date
+        pass
+    elif existing_vacancy is not None:
+        row_number = int(existing_vacancy['Row in Spreadsheets'])
+        inserted_before = existing_vacancy['Inserted Rows Count']
+        sheet_write_queue.update_row(SEARCH_CACHE_SHEET_NAME, row_number, cache_data, inserted_before=inserted_before)
+        vacancy_index.add(cache_data, inserted_before, entry_id=existing_vacancy.get('Index Id'),
+                          row_number=row_number)
+    else:
+        inserted_before = sheet_write_queue.insert_row(SEARCH_CACHE_SHEET_NAME, cache_data)
+        vacancy_index.add(cache_data, inserted_before)
+
+    logger.info("Results queued for Google Sheets.")
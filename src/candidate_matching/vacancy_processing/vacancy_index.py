@@ -0,0 +1,241 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.data_processing.nlp.jaccard_similarity import calculate_jaccard_similarity
+from src.data_processing.nlp.minhash import MinHasher, MinHashLSH
+from src.data_processing.nlp.tokenization import get_tokens
+from src.google_services.sheets import read_specific_columns
+from src.google_services.write_queue import sheet_write_queue
+from src.logger import logger
+
+load_dotenv()
+
+VACANCY_INDEX_PATH = os.getenv("VACANCY_INDEX_PATH", "cache/vacancy_index.sqlite")
+# The index is rebuilt from the search cache sheet in the background when its last sync is older than this
+VACANCY_INDEX_SYNC_INTERVAL = int(os.getenv("VACANCY_INDEX_SYNC_INTERVAL", 6 * 60 * 60))
+VACANCY_SIMILARITY_THRESHOLD = 0.8
+
+CACHE_SHEET_COLUMNS = ["Date", "vacancy description", "tg_answer", "step1 num number of initial candidates"]
+
+
+def parse_date(date_str):
+    if ' ' in date_str:
+        date_part = date_str.split()[0]
+    else:
+        date_part = date_str
+    return datetime.strptime(date_part, '%Y-%m-%d')
+
+
+def _cache_time_cutoff() -> datetime:
+    return datetime.now() - timedelta(days=int(os.getenv("VACANCY_CACHE_TIME")))
+
+
+class VacancyIndex:
+    """
+    Near-duplicate index of the search cache sheet: MinHash signatures of the vacancy token sets in an LSH
+    table, kept in memory and persisted in a local SQLite file. A lookup verifies the LSH candidates with
+    the exact Jaccard similarity, so it never returns a vacancy below the threshold, but it can miss one:
+    with 16 bands of 8 rows a cached vacancy at exactly 0.8 Jaccard is not a candidate with probability
+    (1 - 0.8^8)^16, about 5%, at 0.85 about 0.6%, above 0.9 below 0.02%.
+
+    Rows are located in the sheet like the write queue does it: a row is at
+    row_number + inserted_rows_count() - inserted_before.
+    """
+
+    def __init__(self, path: str = VACANCY_INDEX_PATH, sheet_name: Optional[str] = None):
+        self.sheet_name = sheet_name or os.getenv("SEARCH_CACHE_SHEET_NAME")
+        self.hasher = MinHasher()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS vacancies ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " date TEXT NOT NULL,"
+            " description TEXT NOT NULL,"
+            " tokens TEXT NOT NULL,"
+            " signature BLOB NOT NULL,"
+            " tg_answer TEXT,"
+            " initial_candidates TEXT,"
+            " row_number INTEGER NOT NULL,"
+            " inserted_before INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._lock = threading.RLock()
+        self._sync_thread = None
+        self._entries = {}
+        self._lsh = MinHashLSH(self.hasher.num_perm)
+        self._load()
+
+    def _load(self):
+        for row in self._connection.execute(
+                "SELECT id, date, description, tokens, signature, tg_answer, initial_candidates,"
+                " row_number, inserted_before FROM vacancies"):
+            self._add_to_memory(row[0], {
+                'Date': row[1], 'vacancy description': row[2], 'tokens': set(json.loads(row[3])),
+                'signature': np.frombuffer(row[4], dtype=np.uint64), 'tg_answer': row[5],
+                'step1 num number of initial candidates': row[6],
+                'row_number': row[7], 'inserted_before': row[8],
+            })
+
+    def _add_to_memory(self, entry_id: int, entry: dict):
+        entry['saved_date'] = parse_date(entry['Date'])
+        self._entries[entry_id] = entry
+        self._lsh.add(entry_id, entry['signature'])
+
+    def _remove_from_memory(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            self._lsh.remove(entry_id, entry['signature'])
+
+    def _last_sync(self) -> float:
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'last_sync'").fetchone()
+        return float(row[0]) if row else 0
+
+    # Lookup
+
+    def find_similar(self, vacancy_description: str) -> Optional[dict]:
+        """
+        Finds the most similar vacancy cached in the last VACANCY_CACHE_TIME days.
+
+        Returns:
+        - dict or None: The cache row ('Date', 'vacancy description', 'tg_answer',
+          'step1 num number of initial candidates', 'Row in Spreadsheets', 'Inserted Rows Count')
+          if its similarity is at least 0.8; 'tg_answer' is only kept for an exact duplicate.
+        """
+        self._sync_if_needed()
+        tokens = get_tokens(vacancy_description)
+        signature = self.hasher.signature(tokens)
+        cutoff = _cache_time_cutoff()
+        with self._lock:
+            best_id, best_similarity = None, 0
+            for entry_id in self._lsh.query(signature):
+                entry = self._entries[entry_id]
+                if entry['saved_date'] < cutoff:
+                    continue
+                similarity = calculate_jaccard_similarity(tokens, entry['tokens'])
+                # The newest entry wins a tie, as the top-down scan of the sheet did
+                if similarity > best_similarity or (similarity == best_similarity and entry_id > (best_id or 0)):
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None or best_similarity < VACANCY_SIMILARITY_THRESHOLD:
+                return None
+            entry = self._entries[best_id]
+            row = {key: entry[key] for key in CACHE_SHEET_COLUMNS}
+            row['Index Id'] = best_id
+            row['Row in Spreadsheets'] = entry['row_number']
+            row['Inserted Rows Count'] = entry['inserted_before']
+        if best_similarity < 1:
+            del row['tg_answer']
+        return row
+
+    # Updates
+
+    def add(self, cache_data: list, inserted_before: int, entry_id: Optional[int] = None,
+            row_number: int = 2):
+        """
+        Adds a search cache row queued with sheet_write_queue (or replaces entry_id after its row was updated).
+        cache_data is the row as written: date, vacancy description, tg_answer, initial candidates number.
+        """
+        date, description, tg_answer, initial_candidates = cache_data
+        tokens = get_tokens(description)
+        signature = self.hasher.signature(tokens)
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            if entry_id is not None:
+                self._connection.execute("DELETE FROM vacancies WHERE id = ?", (entry_id,))
+            cursor = self._connection.execute(
+                "INSERT INTO vacancies (date, description, tokens, signature, tg_answer, initial_candidates,"
+                " row_number, inserted_before) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (date, description, json.dumps(sorted(tokens), ensure_ascii=False), signature.tobytes(),
+                 tg_answer, str(initial_candidates), row_number, inserted_before)
+            )
+            if entry_id is not None:
+                self._remove_from_memory(entry_id)
+            self._add_to_memory(cursor.lastrowid, {
+                'Date': date, 'vacancy description': description, 'tokens': tokens, 'signature': signature,
+                'tg_answer': tg_answer, 'step1 num number of initial candidates': str(initial_candidates),
+                'row_number': row_number, 'inserted_before': inserted_before,
+            })
+
+    def sync(self):
+        """
+        Rebuilds the index from the search cache sheet, keeping the queued rows that are not in the sheet yet.
+        """
+        start_time = time.time()
+        inserted_rows_count, vacancies_df = sheet_write_queue.read_with_counter(
+            self.sheet_name, lambda: read_specific_columns(CACHE_SHEET_COLUMNS, self.sheet_name))
+        cutoff = _cache_time_cutoff()
+        rows = []
+        for _, row in vacancies_df.iterrows():
+            try:
+                if parse_date(row['Date']) < cutoff:
+                    continue
+            except ValueError:
+                continue
+            tokens = get_tokens(row['vacancy description'])
+            rows.append((row['Date'], row['vacancy description'], tokens, self.hasher.signature(tokens),
+                         row['tg_answer'], str(row['step1 num number of initial candidates']),
+                         int(row['Row in Spreadsheets'])))
+        # The sheet has the newest rows on top, ids grow with the date as for the rows added later
+        rows.reverse()
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.execute("DELETE FROM vacancies WHERE inserted_before <= ?", (inserted_rows_count,))
+            self._connection.executemany(
+                "INSERT INTO vacancies (date, description, tokens, signature, tg_answer, initial_candidates,"
+                " row_number, inserted_before) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(date, description, json.dumps(sorted(tokens), ensure_ascii=False), signature.tobytes(),
+                  tg_answer, initial_candidates, row_number, inserted_rows_count)
+                 for date, description, tokens, signature, tg_answer, initial_candidates, row_number in rows]
+            )
+            self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_sync', ?)",
+                                     (str(time.time()),))
+            self._entries = {}
+            self._lsh = MinHashLSH(self.hasher.num_perm)
+            self._load()
+        logger.info(f"Vacancy index: {len(rows)} cached vacancies synced in {time.time() - start_time:.1f} sec")
+
+    def _sync_if_needed(self):
+        last_sync = self._last_sync()
+        if not last_sync:
+            # Nothing to search in yet, the first lookup waits for the sheet like before
+            with self._lock:
+                if not self._last_sync():
+                    self.sync()
+        elif time.time() - last_sync > VACANCY_INDEX_SYNC_INTERVAL:
+            self._start_background_sync()
+
+    def _start_background_sync(self):
+        with self._lock:
+            if self._sync_thread is not None and self._sync_thread.is_alive():
+                return
+            self._sync_thread = threading.Thread(target=self._background_sync, name="vacancy-index-sync",
+                                                 daemon=True)
+            self._sync_thread.start()
+
+    def _background_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logger.error(f"Vacancy index sync failed: {e}")
+
+
+_vacancy_index = None
+_vacancy_index_lock = threading.Lock()
+
+
+def get_vacancy_index() -> VacancyIndex:
+    global _vacancy_index
+    with _vacancy_index_lock:
+        if _vacancy_index is None:
+            _vacancy_index = VacancyIndex()
+    return _vacancy_index
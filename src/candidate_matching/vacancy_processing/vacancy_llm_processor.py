@@ -7,37 +7,52 @@ from src.candidate_matching.vacancy_processing.info_extraction.vacancy_llm_techn
     extract_vacancy_technologies
 
 from src.logger import logger
-from src.data_processing.nlp.llm_handler import LLMHandler
+from src.data_processing.nlp.llm_handler import LLMHandler, AsyncLLMHandler
 
+import asyncio
 import concurrent.futures
 
+# Extraction functions and the models they run on
+VACANCY_EXTRACTION_TASKS = [
+    (extract_vacancy_technologies, "gpt-4.1-mini"),
+    (extract_vacancy_role, "gpt-4.1-nano"),  # SGR
+    (extract_vacancy_industries, "gpt-4.1-nano"),
+    (extract_vacancy_location, "gpt-4.1-mini"),
+    (extract_vacancy_rate, "gpt-4.1-mini"),  # SGR
+    (extract_vacancy_languages, "gpt-4.1-nano"),
+]
+
+
+def combine_extracted_data(extracted_data_list):
+    # Combine the rest of the fields
+    return {k: v for d in extracted_data_list for k, v in d.items()}
+
+
 def extract_vacancy_info(vacancy: str, llm_handler: LLMHandler):
     # Use ThreadPoolExecutor to run the functions concurrently
     with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Submit both tasks to the executor
-        future1 = executor.submit(extract_vacancy_technologies, vacancy,  llm_handler, model="gpt-4.1-mini")
-        future2 = executor.submit(extract_vacancy_role, vacancy,  llm_handler, model="gpt-4.1-nano") # SGR
-        future3 = executor.submit(extract_vacancy_industries, vacancy, llm_handler, model="gpt-4.1-nano")
-        future4 = executor.submit(extract_vacancy_location, vacancy, llm_handler, model="gpt-4.1-mini")
-        future5 = executor.submit(extract_vacancy_rate, vacancy, llm_handler, model="gpt-4.1-mini") # SGR
-        future6 = executor.submit(extract_vacancy_languages, vacancy,  llm_handler, model="gpt-4.1-nano")
-
+        futures = [
+            executor.submit(extract_function, vacancy, llm_handler, model=model)
+            for extract_function, model in VACANCY_EXTRACTION_TASKS
+        ]
         # Retrieve the results
-        extracted_data1 = future1.result()
-        extracted_data2 = future2.result()
-        extracted_data3 = future3.result()
-        extracted_data4 = future4.result()
-        extracted_data5 = future5.result()
-        extracted_data6 = future6.result()
-
+        extracted_data_list = [future.result() for future in futures]
 
-
-    # Combine the rest of the fields
-    extracted_data ={k: v for d in [extracted_data1, extracted_data2,
-                                     extracted_data3, extracted_data4,
-                                     extracted_data5, extracted_data6]
-                           for k, v in d.items()}
+    extracted_data = combine_extracted_data(extracted_data_list)
 
     # logger.info(f"extracted_data['Vacancy Reasoning']: {extracted_data.get('Vacancy Reasoning', 'No reasoning provided')}")
     return extracted_data
 
+
+async def extract_vacancy_info_async(vacancy: str, llm_handler: AsyncLLMHandler):
+    """
+    Awaitable version of extract_vacancy_info for the bot event loop.
+    The extractors run in the loop's default executor while their LLM calls are awaited
+    concurrently on the pooled async client of llm_handler.
+    """
+    sync_handler = llm_handler.as_sync()
+    extracted_data_list = await asyncio.gather(*(
+        asyncio.to_thread(extract_function, vacancy, sync_handler, model=model)
+        for extract_function, model in VACANCY_EXTRACTION_TASKS
+    ))
+    return combine_extracted_data(extracted_data_list)
@@ -0,0 +1,350 @@
+"""
+Offline re-extraction of the CV fields of the whole staff sheet through the OpenAI Batch API.
+
+    python -m src.cv_parsing.batch_reextraction [field name ...]
+
+The extractors of CV_EXTRACTION_TASKS (all of them, or the given fields, e.g. "Seniority" "Stack") run on
+the CV sections stored in the sheet with a BatchExtractionHandler: a call whose answer is not known yet is
+recorded as a batch request with exactly the prompt and response_format the extractor would send, a call
+whose answer came back from a batch gets it, so the extractors do their usual post-processing.
+Extractors whose later calls depend on earlier answers need another round, at most BATCH_MAX_ROUNDS.
+
+Batch requests cost half of the interactive price and do not go through the interactive rate limits.
+custom_id is a hash of the request, answers stay valid until the prompt or the CV changes, and the
+downloaded output files are kept, so a run that was stopped is resumed by starting it again.
+"""
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from openai.lib._parsing._completions import type_to_response_format_param
+from openai.types.chat import ChatCompletion
+
+from src.cv_parsing.cv_llm_processor import CV_EXTRACTION_TASKS, add_field_result, finalize_cv_info, \
+    format_field_error
+from src.data_processing.nlp.batch_handler import BatchCostTracker, BatchHandler
+from src.data_processing.nlp.llm_handler import LLMHandler
+from src.data_processing.nlp.rate_limiter import BACKGROUND
+from src.google_services.candidates_snapshot import candidates_snapshot
+from src.google_services.sheets import CANDIDATES_SHEET_NAME, get_sheet_dict, read_specific_columns, \
+    write_specific_columns, _prepare_cell_value
+from src.logger import logger
+
+load_dotenv()
+
+BATCH_REEXTRACTION_DIR = os.getenv("BATCH_REEXTRACTION_DIR", "cache/batch_reextraction")
+BATCH_POLL_INTERVAL = int(os.getenv("BATCH_POLL_INTERVAL", 60))  # seconds
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_MAX_REQUESTS = 50_000  # OpenAI limit of requests per batch file
+BATCH_MAX_ROUNDS = 3
+# Batch API requests are billed at half of the interactive price
+BATCH_PRICE_FACTOR = 0.5
+
+CV_SECTION_COLUMNS = ["Header", "Summary", "Skills", "Experience", "Education", "Projects"]
+ORIGINAL_CV_COLUMN = "Original CV text"
+# Parts of the finalize_cv_info result that describe the interactive run, they are not written back
+NOT_WRITTEN_FIELDS = ("Parsing Step3 Time (extract fields)", "Error Logs")
+
+
+class BatchRequestRecorded(Exception):
+    """Raised by BatchExtractionHandler for a call whose answer is not in the batch results yet."""
+
+
+class BatchExtractionHandler(LLMHandler):
+    """
+    LLMHandler for running an extractor in batch mode: get_answer returns the answer of the same request
+    from the batch results, or records the request and raises BatchRequestRecorded.
+    """
+
+    def __init__(self, field_name: str, results: Dict[str, dict], requests: Dict[str, dict]):
+        self.field_name = field_name
+        self.results = results
+        self.requests = requests
+        self.recorded = False
+        self.cache = None
+        self.priority = BACKGROUND
+
+    def build_request(self, prompt, model, max_tokens, temperature, seed, response_format) -> dict:
+        """
+        Returns the batch request line of a call, with the body chat.completions.parse would send.
+        """
+        body = self._build_completion_params(prompt, model, max_tokens, temperature, seed)
+        if response_format is not None:
+            body["response_format"] = type_to_response_format_param(response_format)
+        body_hash = hashlib.sha256(
+            json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+        custom_id = f"{self.field_name.replace(' ', '_')}/{body_hash}"
+        return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+    def calculate_cost(self, token_usage, model):
+        """
+        Interactive cost of the call at the batch price, used by both the text and the structured answers.
+        """
+        cost = super().calculate_cost(token_usage, model)
+        return {key: value * BATCH_PRICE_FACTOR for key, value in cost.items()}
+
+    def get_answer(self, prompt: List[Dict[str, str]], model="gpt-4.1-nano",
+                   max_tokens=1000, temperature=0, seed=42, response_format=None, hedge=False):
+        request = self.build_request(prompt, model, max_tokens, temperature, seed, response_format)
+        completion = self.results.get(request["custom_id"])
+        if completion is None:
+            self.requests[request["custom_id"]] = request
+            self.recorded = True
+            raise BatchRequestRecorded(request["custom_id"])
+        response = ChatCompletion.model_validate(completion)
+        if response_format is None:
+            return self._build_text_answer(response, model)
+        parsed = response_format.model_validate_json(response.choices[0].message.content)
+        return self._build_structured_answer(response, model, parsed=parsed)
+
+
+class BatchResultStore:
+    """
+    Batch answers by custom_id, read from the output files downloaded into directory.
+    Batches that were submitted but not downloaded are remembered, an interrupted run collects them first.
+    """
+
+    def __init__(self, directory: str = BATCH_REEXTRACTION_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.results = {}
+        for path in sorted(glob.glob(os.path.join(directory, "*_output.jsonl"))):
+            self.load_output_file(path)
+
+    @property
+    def _pending_path(self) -> str:
+        return os.path.join(self.directory, "pending_batches.json")
+
+    def pending_batches(self) -> List[str]:
+        if not os.path.exists(self._pending_path):
+            return []
+        with open(self._pending_path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def _save_pending(self, batch_ids: List[str]):
+        with open(self._pending_path, "w", encoding="utf-8") as file:
+            json.dump(batch_ids, file)
+
+    def load_output_file(self, path: str) -> int:
+        """
+        Adds the successful answers of an output file. Failed requests are left out and recorded again.
+        """
+        loaded = 0
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    self.results[record["custom_id"]] = response["body"]
+                    loaded += 1
+        return loaded
+
+    async def submit(self, batch_handler: BatchHandler, requests: List[dict],
+                     poll_interval: int = BATCH_POLL_INTERVAL):
+        """
+        Submits the requests in batches of at most BATCH_MAX_REQUESTS and waits for their answers.
+        """
+        batch_ids = []
+        for start in range(0, len(requests), BATCH_MAX_REQUESTS):
+            input_path = os.path.join(self.directory, f"{int(time.time())}_{start // BATCH_MAX_REQUESTS}_input.jsonl")
+            batch_id = await asyncio.to_thread(batch_handler.submit_requests,
+                                               requests[start:start + BATCH_MAX_REQUESTS], input_path, BATCH_ENDPOINT)
+            os.remove(input_path)
+            batch_ids.append(batch_id)
+            self._save_pending(self.pending_batches() + [batch_id])
+            logger.info(f"Batch {batch_id} submitted with {len(requests[start:start + BATCH_MAX_REQUESTS])} requests")
+        await self.collect(batch_handler, batch_ids, poll_interval)
+
+    async def collect(self, batch_handler: BatchHandler, batch_ids: List[str],
+                      poll_interval: int = BATCH_POLL_INTERVAL):
+        await asyncio.gather(*(self._collect_batch(batch_handler, batch_id, poll_interval) for batch_id in batch_ids))
+
+    async def _collect_batch(self, batch_handler: BatchHandler, batch_id: str, poll_interval: int):
+        try:
+            await batch_handler.wait_for_completion_async(batch_id, poll_interval)
+            output_path = os.path.join(self.directory, f"{batch_id}_output.jsonl")
+            loaded = await asyncio.to_thread(self._read_results, batch_handler, batch_id, output_path)
+            logger.info(f"Batch {batch_id}: {loaded} answers downloaded")
+        except (RuntimeError, ValueError) as e:
+            # The requests of a lost batch are recorded and submitted again in the next round
+            logger.error(f"Batch {batch_id} gave no results: {e}")
+        self._save_pending([pending_id for pending_id in self.pending_batches() if pending_id != batch_id])
+
+    def _read_results(self, batch_handler: BatchHandler, batch_id: str, output_path: str) -> int:
+        """
+        Streams the results of a batch into results, the raw lines are saved to output_path for the next runs.
+        """
+        loaded = 0
+        for custom_id, response, usage in batch_handler.iter_results(batch_id, output_path):
+            if usage is not None:
+                self.results[custom_id] = response
+                loaded += 1
+        return loaded
+
+
+def select_extraction_tasks(field_names: Optional[List[str]] = None) -> list:
+    if not field_names:
+        return CV_EXTRACTION_TASKS
+    known_fields = [field_name for _, _, field_name in CV_EXTRACTION_TASKS]
+    unknown_fields = [field_name for field_name in field_names if field_name not in known_fields]
+    if unknown_fields:
+        raise ValueError(f"Unknown CV fields {unknown_fields}, the fields are: {known_fields}")
+    return [task for task in CV_EXTRACTION_TASKS if task[2] in field_names]
+
+
+def cv_sections_from_row(row: dict) -> dict:
+    """
+    Rebuilds the cv_sections of identify_resume_sections from a staff sheet row.
+    Without stored sections the whole CV text is the only section, get_section_for_field falls back to it.
+    """
+    cv_sections = {column: row[column] for column in CV_SECTION_COLUMNS
+                   if column != "Projects" and row.get(column)}
+    if row.get("Projects"):
+        # Projects are written as a list joined with blank lines
+        cv_sections["Projects"] = [project.strip() for project in row["Projects"].split("\n\n") if project.strip()]
+    if not cv_sections and row.get(ORIGINAL_CV_COLUMN):
+        cv_sections = {"CV": row[ORIGINAL_CV_COLUMN]}
+    return cv_sections
+
+
+def cv_key(cv_sections: dict) -> str:
+    return hashlib.sha1(json.dumps(cv_sections, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def cv_source_columns(sheet_name: str) -> List[str]:
+    sheet_dict = get_sheet_dict(sheet_name)
+    columns = [column for column in CV_SECTION_COLUMNS + [ORIGINAL_CV_COLUMN] if column in sheet_dict]
+    if not columns:
+        raise ValueError(f"The {sheet_name} sheet has neither CV section columns nor '{ORIGINAL_CV_COLUMN}'")
+    return columns
+
+
+def read_staff_cvs(sheet_name: str = CANDIDATES_SHEET_NAME) -> Dict[str, dict]:
+    """
+    Returns the cv_sections of every CV in the sheet by cv_key, identical CVs are extracted once.
+    """
+    df = read_specific_columns(cv_source_columns(sheet_name), sheet_name)
+    cvs = {}
+    for row in df.to_dict('records'):
+        cv_sections = cv_sections_from_row(row)
+        if cv_sections:
+            cvs[cv_key(cv_sections)] = cv_sections
+    return cvs
+
+
+def extract_cv_fields(cv_sections: dict, tasks: list, results: Dict[str, dict], requests: Dict[str, dict]):
+    """
+    Runs the extractors of tasks on one CV with the answers known so far.
+    Returns (fields, complete): the fields of the finished extractors in the finalize_cv_info format and
+    whether all extractors finished. The requests of the missing answers are added to requests.
+    """
+    fields, field_times, error_logs = {}, {}, []
+    complete = True
+    for extraction_function, model, field_name in tasks:
+        llm_handler = BatchExtractionHandler(field_name, results, requests)
+        try:
+            extracted_data = extraction_function(cv_sections, llm_handler, model=model)
+        except BatchRequestRecorded:
+            complete = False
+            continue
+        except Exception:
+            error_logs.append(format_field_error(len(error_logs) + 1, field_name, traceback.format_exc()))
+            continue
+        if llm_handler.recorded:
+            # The extractor caught BatchRequestRecorded as a failed call, its result is not final
+            complete = False
+            continue
+        add_field_result(fields, field_times, field_name, extracted_data)
+    if error_logs:
+        logger.error("CV re-extraction errors:\n" + "".join(error_logs))
+    if complete and tasks is CV_EXTRACTION_TASKS:
+        # WhatsApp links derived from phones need all fields
+        fields = finalize_cv_info(fields, field_times, error_logs, 0)
+    for field in NOT_WRITTEN_FIELDS:
+        fields.pop(field, None)
+    return fields, complete
+
+
+def run_extraction_pass(cvs: Dict[str, dict], tasks: list, results: Dict[str, dict], requests: Dict[str, dict]):
+    extracted, incomplete = {}, 0
+    for key, cv_sections in cvs.items():
+        fields, complete = extract_cv_fields(cv_sections, tasks, results, requests)
+        extracted[key] = fields
+        incomplete += not complete
+    return extracted, incomplete
+
+
+def write_extracted_fields(extracted: Dict[str, dict], sheet_name: str = CANDIDATES_SHEET_NAME) -> int:
+    """
+    Writes the extracted fields into the rows of their CVs with one batch of the changed cells.
+    Rows are matched by their CV sections again, rows inserted during the run do not shift the result.
+    Returns the number of updated rows.
+    """
+    sheet_dict = get_sheet_dict(sheet_name)
+    output_columns = sorted({column for fields in extracted.values() for column in fields if column in sheet_dict})
+    if not output_columns:
+        return 0
+    source_columns = cv_source_columns(sheet_name)
+    current_df = read_specific_columns(source_columns + [column for column in output_columns
+                                                         if column not in source_columns], sheet_name)
+    previous_df = current_df[output_columns].copy()
+    updated_df = previous_df.copy()
+    updated_rows = 0
+    for index, row in zip(current_df.index, current_df.to_dict('records')):
+        fields = extracted.get(cv_key(cv_sections_from_row(row)))
+        if not fields:
+            continue
+        for column in output_columns:
+            if column in fields:
+                updated_df.at[index, column] = _prepare_cell_value(fields[column])
+        updated_rows += 1
+    write_specific_columns(updated_df, sheet_name, previous_df=previous_df)
+    candidates_snapshot.invalidate()
+    return updated_rows
+
+
+async def reextract_cvs(field_names: Optional[List[str]] = None, batch_handler: Optional[BatchHandler] = None,
+                        poll_interval: int = BATCH_POLL_INTERVAL, sheet_name: str = CANDIDATES_SHEET_NAME) -> str:
+    """
+    Re-extracts the fields (all CV_EXTRACTION_TASKS by default) of every CV in the sheet through batches
+    and writes them back. Returns the summary message.
+    """
+    start_time = time.time()
+    tasks = select_extraction_tasks(field_names)
+    batch_handler = batch_handler or BatchHandler()
+    store = BatchResultStore()
+    if store.pending_batches():
+        logger.info(f"Collecting the batches of the previous run: {store.pending_batches()}")
+        await store.collect(batch_handler, store.pending_batches(), poll_interval)
+    cvs = await asyncio.to_thread(read_staff_cvs, sheet_name)
+    submitted = 0
+    for round_number in range(BATCH_MAX_ROUNDS + 1):
+        requests = {}
+        extracted, incomplete = await asyncio.to_thread(run_extraction_pass, cvs, tasks, store.results, requests)
+        if not requests or round_number == BATCH_MAX_ROUNDS:
+            break
+        logger.info(f"CV re-extraction round {round_number + 1}: {len(requests)} requests for {incomplete} CVs")
+        submitted += len(requests)
+        await store.submit(batch_handler, list(requests.values()), poll_interval)
+    updated_rows = await asyncio.to_thread(write_extracted_fields, extracted, sheet_name)
+    message = (f"CV re-extraction of {', '.join(task[2] for task in tasks)}: {len(cvs)} CVs, "
+               f"{submitted} batch requests, {updated_rows} rows updated in {time.time() - start_time:.0f} sec")
+    if incomplete:
+        message += f"\n{incomplete} CVs are missing some answers, run again to retry them"
+    if submitted:
+        message += "\n" + BatchCostTracker.format_summary(batch_handler.cost_tracker.summary())
+    logger.info(message)
+    return message
+
+
+if __name__ == "__main__":
+    print(asyncio.run(reextract_cvs(sys.argv[1:] or None)))
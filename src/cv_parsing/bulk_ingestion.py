@@ -0,0 +1,274 @@
+"""
+Bulk CV ingestion: parses every CV of a local directory or a Google Drive folder and adds them to the staff sheet.
+
+    python -m src.cv_parsing.bulk_ingestion <directory or Drive folder link> [concurrency]
+
+Files are parsed by a bounded number of concurrent workers whose LLM calls go through the process-wide
+rate limiter with the BACKGROUND priority, so bot requests keep going first. Every parsed file is saved
+in a local checkpoint: a run that stopped is resumed by starting it again with the same source,
+finished files are not parsed again. The staff rows of a run are appended with one batch at the end,
+they stay in the checkpoint until that write succeeds.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from src.bot.utils import ProgressMessage
+from src.cv_parsing.cv_parser import parse_cv
+from src.cv_parsing.save_cv import prepare_cv_info
+from src.data_processing.nlp.llm_handler import AsyncLLMHandler, close_async_openai_clients
+from src.data_processing.nlp.rate_limiter import BACKGROUND
+from src.google_services.candidates_snapshot import candidates_snapshot
+from src.google_services.drive import extract_text_from_docx, extract_text_from_pdf, extract_text_from_google_file, \
+    extract_folder_id, list_files_in_folder
+from src.google_services.sheets import write_dicts_to_sheet
+from src.google_services.write_queue import sheet_write_queue
+from src.logger import logger
+
+load_dotenv()
+
+BULK_CV_CONCURRENCY = int(os.getenv("BULK_CV_CONCURRENCY", 4))
+BULK_CV_CHECKPOINT_PATH = os.getenv("BULK_CV_CHECKPOINT_PATH", "cache/bulk_cv_ingestion.sqlite")
+
+CV_FILE_EXTENSIONS = ('.pdf', '.docx')
+DRIVE_CV_MIME_TYPES = ['application/pdf', 'application/vnd.google-apps.document']
+
+PARSED, FAILED, SAVED = "parsed", "failed", "saved"
+
+
+class IngestionCheckpoint:
+    """
+    Local SQLite record of the files of bulk runs: the prepared staff row of every parsed file
+    and the error of every failed one. A run is identified by its source.
+    """
+
+    def __init__(self, path: str = BULK_CV_CHECKPOINT_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cv_files ("
+            " run_id TEXT NOT NULL,"
+            " file_key TEXT NOT NULL,"
+            " file_name TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " extracted_data TEXT,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (run_id, file_key))"
+        )
+        self._lock = threading.Lock()
+
+    def _execute(self, query: str, params=()) -> list:
+        with self._lock:
+            return self._connection.execute(query, params).fetchall()
+
+    def statuses(self, run_id: str) -> dict:
+        return dict(self._execute("SELECT file_key, status FROM cv_files WHERE run_id = ?", (run_id,)))
+
+    def save_parsed(self, run_id: str, cv_file: dict, extracted_data: dict):
+        self._execute(
+            "INSERT OR REPLACE INTO cv_files (run_id, file_key, file_name, status, extracted_data, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, cv_file['key'], cv_file['name'], PARSED, json.dumps(extracted_data, ensure_ascii=False, default=str),
+             time.time())
+        )
+
+    def save_failed(self, run_id: str, cv_file: dict, error: str):
+        self._execute(
+            "INSERT OR REPLACE INTO cv_files (run_id, file_key, file_name, status, error, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, cv_file['key'], cv_file['name'], FAILED, error, time.time())
+        )
+
+    def parsed_rows(self, run_id: str) -> list:
+        """
+        Returns (file_key, extracted_data) of the parsed files whose rows are not appended yet, in parsing order.
+        """
+        rows = self._execute(
+            "SELECT file_key, extracted_data FROM cv_files WHERE run_id = ? AND status = ? ORDER BY updated_at",
+            (run_id, PARSED)
+        )
+        return [(file_key, json.loads(extracted_data)) for file_key, extracted_data in rows]
+
+    def mark_saved(self, run_id: str, file_keys: list):
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "UPDATE cv_files SET status = ?, extracted_data = NULL, updated_at = ? WHERE run_id = ? AND file_key = ?",
+                [(SAVED, time.time(), run_id, file_key) for file_key in file_keys]
+            )
+
+    def summary(self, run_id: str) -> dict:
+        """
+        Returns the number of files per status and the errors of the failed files by file name.
+        """
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM cv_files WHERE run_id = ? GROUP BY status",
+                                    (run_id,)))
+        errors = dict(self._execute("SELECT file_name, error FROM cv_files WHERE run_id = ? AND status = ?",
+                                    (run_id, FAILED)))
+        return {'counts': counts, 'errors': errors}
+
+
+def run_id_for_source(source: str) -> str:
+    if os.path.isdir(source):
+        return os.path.abspath(source)
+    return f"drive:{extract_folder_id(source)}"
+
+
+def list_cv_files(source: str) -> list:
+    """
+    Lists the CV files of a local directory (with subdirectories) or of a Google Drive folder.
+    Returns dicts with 'key' (stable between runs), 'name' and either 'path' or 'url'.
+    """
+    if os.path.isdir(source):
+        cv_files = []
+        for directory, _, file_names in sorted(os.walk(source)):
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith(CV_FILE_EXTENSIONS):
+                    path = os.path.join(directory, file_name)
+                    cv_files.append({'key': os.path.abspath(path), 'name': file_name, 'path': path})
+        return cv_files
+    if "/folders/" in source:
+        drive_files = list_files_in_folder(extract_folder_id(source), mime_types=DRIVE_CV_MIME_TYPES)
+        return [{'key': f"drive:{drive_file['id']}", 'name': drive_file['name'],
+                 'url': f"https://drive.google.com/file/d/{drive_file['id']}/view"}
+                for drive_file in sorted(drive_files, key=lambda drive_file: drive_file['name'])]
+    raise ValueError(f"'{source}' is neither a directory nor a Google Drive folder link")
+
+
+def read_cv_file(cv_file: dict):
+    """
+    Returns (text, file_path, original_file) as process_cv gets them for a sent document or Drive link.
+    """
+    if 'url' in cv_file:
+        text, file_name = extract_text_from_google_file(cv_file['url'])
+        return text, file_name, cv_file['url']
+    path = cv_file['path']
+    if path.lower().endswith('.docx'):
+        text = extract_text_from_docx(path)
+    else:
+        text = extract_text_from_pdf(path)
+    return text, path, path
+
+
+def append_parsed_cvs(checkpoint: IngestionCheckpoint, run_id: str) -> int:
+    """
+    Writes the staff rows of all parsed files of the run at once (one insert and one values batch),
+    the parse logs go through the write queue. Returns the number of appended rows.
+    """
+    rows = checkpoint.parsed_rows(run_id)
+    if not rows:
+        return 0
+    file_keys = [file_key for file_key, _ in rows]
+    staff_rows = [extracted_data for _, extracted_data in rows]
+    # Written synchronously: staff rows are also inserted by save_cv_info and recruiters, which the queue
+    # does not count, and a failed write has to keep the rows in the checkpoint for the next run
+    write_dicts_to_sheet(staff_rows, sheet_name="staff")
+    checkpoint.mark_saved(run_id, file_keys)
+    candidates_snapshot.invalidate()
+    sheet_write_queue.insert_rows(sheet_name=os.getenv("PARSE_LOGS_SHEET_NAME"), rows=staff_rows)
+    return len(rows)
+
+
+def format_ingestion_progress(done: int, total: int, failed: int, skipped: int) -> str:
+    message = f"<b>Bulk CV parsing:</b> {done}/{total} files"
+    if failed:
+        message += f", {failed} failed"
+    if skipped:
+        message += f"\n{skipped} files were parsed by a previous run"
+    return message
+
+
+def format_ingestion_summary(summary: dict, appended: int) -> str:
+    counts = summary['counts']
+    message = (f"<b>Bulk CV parsing finished:</b> {appended} CVs added to the staff sheet, "
+               f"{counts.get(SAVED, 0)} in total for this source")
+    if summary['errors']:
+        message += f"\n{len(summary['errors'])} files failed, they are parsed again on the next run:"
+        for file_name, error in summary['errors'].items():
+            message += f"\n- {file_name}: {error}"
+    return message
+
+
+async def ingest_cvs(source: str, concurrency: int = BULK_CV_CONCURRENCY, llm_handler: AsyncLLMHandler = None,
+                     progress: Optional[ProgressMessage] = None,
+                     checkpoint: Optional[IngestionCheckpoint] = None) -> str:
+    """
+    Parses all CV files of source that no previous run of the same source has parsed,
+    then appends their staff rows. Returns the summary message.
+    """
+    start_time = time.time()
+    checkpoint = checkpoint or IngestionCheckpoint()
+    if llm_handler is None:
+        llm_handler = AsyncLLMHandler(priority=BACKGROUND)
+    run_id = run_id_for_source(source)
+    cv_files = await asyncio.to_thread(list_cv_files, source)
+    statuses = checkpoint.statuses(run_id)
+    pending_files = [cv_file for cv_file in cv_files if statuses.get(cv_file['key']) not in (PARSED, SAVED)]
+    skipped = len(cv_files) - len(pending_files)
+    logger.info(f"Bulk CV parsing of {source}: {len(pending_files)} files to parse, {skipped} already parsed")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    done, failed = 0, 0
+
+    async def ingest_file(cv_file: dict):
+        nonlocal done, failed
+        async with semaphore:
+            try:
+                text, file_path, original_file = await asyncio.to_thread(read_cv_file, cv_file)
+                extracted_data = await parse_cv(text, llm_handler)
+                # A failed reading, translation or sections step fails the file; errors of single
+                # field extractors are saved with the row, as the interactive parsing does
+                if extracted_data.get("Error Logs", "").startswith("Error in Step"):
+                    raise ValueError(extracted_data["Error Logs"].splitlines()[0])
+                extracted_data['Original file'] = original_file
+                extracted_data, _ = await asyncio.to_thread(prepare_cv_info, extracted_data, file_path)
+                checkpoint.save_parsed(run_id, cv_file, extracted_data)
+            except Exception as e:
+                failed += 1
+                logger.error(f"Bulk CV parsing of {cv_file['name']} failed: {e}\n{traceback.format_exc()}")
+                checkpoint.save_failed(run_id, cv_file, str(e))
+            done += 1
+        if progress is not None:
+            await progress.show(format_ingestion_progress(done, len(pending_files), failed, skipped))
+
+    if progress is not None:
+        await progress.show(format_ingestion_progress(0, len(pending_files), 0, skipped), force=True)
+    await asyncio.gather(*(ingest_file(cv_file) for cv_file in pending_files))
+    appended = await asyncio.to_thread(append_parsed_cvs, checkpoint, run_id)
+    logger.info(f"Bulk CV parsing of {source}: {appended} rows appended, {failed} files failed, "
+                f"{time.time() - start_time:.1f} sec")
+    return format_ingestion_summary(checkpoint.summary(run_id), appended)
+
+
+async def process_bulk_cvs(update, source: str):
+    """
+    Bot entry point: runs ingest_cvs with its progress in one edited message.
+    """
+    progress = ProgressMessage(update)
+    summary_message = await ingest_cvs(source, progress=progress)
+    await progress.finish(summary_message, note="<b>✅ Bulk CV parsing finished, the summary is below</b>")
+
+
+async def _main(source: str, concurrency: int):
+    try:
+        print(await ingest_cvs(source, concurrency))
+    finally:
+        await close_async_openai_clients()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(_main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else BULK_CV_CONCURRENCY))
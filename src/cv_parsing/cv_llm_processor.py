@@ -1,5 +1,5 @@
 import re
-from typing import Dict
+from typing import Dict, Optional
 
 from src.cv_parsing.info_extraction.cv_llm_email import extract_cv_email
 from src.cv_parsing.info_extraction.cv_llm_certificates import extract_cv_certificates_and_awards
@@ -16,11 +16,9 @@ from src.cv_parsing.info_extraction.cv_llm_stack import extract_cv_stack
 from src.cv_parsing.info_extraction.cv_llm_summary import extract_cv_cleaned_summary
 from src.cv_parsing.info_extraction.cv_llm_telegram import extract_cv_telegram
 from src.cv_parsing.info_extraction.cv_llm_whatsapp import extract_cv_whatsapp
+from src.cv_parsing.cv_stage_cache import CVStageCache
 from src.data_processing.nlp.llm_handler import LLMHandler
 
-import time
-import traceback
-from concurrent.futures import ThreadPoolExecutor
 
 def turn_phones_to_whatsapp_links(phone_numbers_str: str) -> str:
     """
@@ -44,88 +42,68 @@ def turn_phones_to_whatsapp_links(phone_numbers_str: str) -> str:
     return ", ".join(whatsapp_links)
 
 
-def extract_cv_info(cv: Dict, llm_handler: LLMHandler):
+# Extraction tasks as a list of tuples: (function, model, field_name)
+CV_EXTRACTION_TASKS = [
+    (extract_cv_name, "gpt-4.1-nano", "Name"),
+    (extract_cv_seniority, "gpt-4.1-nano", "Seniority"),
+    (extract_cv_roles, "gpt-4.1-mini", "Roles"),
+    (extract_cv_expertise, "gpt-4.1-nano", "Expertise"),
+    (extract_cv_stack, "gpt-4.1", "Stack"),
+    (extract_cv_domains_and_industries, "gpt-4.1-mini", "IT Domains and Industries"),
+    (extract_cv_linkedin, "gpt-4.1-nano", "LinkedIn"),
+    (extract_cv_telegram, "gpt-4.1-nano", "Telegram"),
+    (extract_cv_whatsapp, "gpt-4.1-nano", "WhatsApp"),
+    (extract_cv_phone, "gpt-4.1-nano", "Phone"),
+    (extract_cv_email, "gpt-4.1-nano", "Email"),
+    (extract_cv_github, "gpt-4.1-nano", "GitHub"),
+    (extract_cv_location, "gpt-4.1-nano", "Location"),
+    (extract_cv_certificates_and_awards, "gpt-4.1-nano", "Certificates and Awards"),
+    (extract_cv_cleaned_summary, "gpt-4.1-nano", "Cleaned Summary")
+
+]
+
+
+def add_field_result(results: Dict, field_times: Dict, field_name: str, extracted_data):
     """
-    Extracts all CV data in parallel using ThreadPoolExecutor.
-    Combines results from all extraction functions into a single dictionary.
-    Tracks execution time for each field extraction.
+    Adds the result of one field extractor to results and moves its Time field to field_times.
+    """
+    # Extract and save Time field if it exists
+    if isinstance(extracted_data, dict):
+        if "Time" in extracted_data:
+            field_times[field_name] = extracted_data["Time"]
+            # Remove Time field from the extracted data
+            del extracted_data["Time"]
+
+        # Add the extracted data to the results dictionary
+        for key, value in extracted_data.items():
+            # Use the field_name prefix if the key might collide with other extractions
+            new_key = f"{field_name}_{key}" if key in results else key
+            results[new_key] = value
+    else:
+        results[field_name] = extracted_data
 
-    Args:
-        cv (str): The CV text to analyze.
-        llm_handler (LLMHandler): Instance of LLMHandler for API calls.
 
-    Returns:
-        dict: Combined dictionary with all extracted data and timing information.
-    """
-    # Start timing the entire parallel extraction process
-    overall_start_time = time.time()
-
-    # Define the extraction tasks as a list of tuples: (function, model, field_name)
-    extraction_tasks = [
-        (extract_cv_name, "gpt-4.1-nano", "Name"),
-        (extract_cv_seniority, "gpt-4.1-nano", "Seniority"),
-        (extract_cv_roles, "gpt-4.1-mini", "Roles"),
-        (extract_cv_expertise, "gpt-4.1-nano", "Expertise"),
-        (extract_cv_stack, "gpt-4.1", "Stack"),
-        (extract_cv_domains_and_industries, "gpt-4.1-mini", "IT Domains and Industries"),
-        (extract_cv_linkedin, "gpt-4.1-nano", "LinkedIn"),
-        (extract_cv_telegram, "gpt-4.1-nano", "Telegram"),
-        (extract_cv_whatsapp, "gpt-4.1-nano", "WhatsApp"),
-        (extract_cv_phone, "gpt-4.1-nano", "Phone"),
-        (extract_cv_email, "gpt-4.1-nano", "Email"),
-        (extract_cv_github, "gpt-4.1-nano", "GitHub"),
-        (extract_cv_location, "gpt-4.1-nano", "Location"),
-        (extract_cv_certificates_and_awards, "gpt-4.1-nano", "Certificates and Awards"),
-        (extract_cv_cleaned_summary, "gpt-4.1-nano", "Cleaned Summary")
-
-    ]
-
-    field_times = {}
-    error_logs = []
-
-    # Create a ThreadPoolExecutor
-    with ThreadPoolExecutor() as executor:
-        # Submit all tasks and store futures in a list
-        futures = [
-            executor.submit(task[0], cv, llm_handler, model=task[1])
-            for task in extraction_tasks
-        ]
-
-        # Retrieve results as they complete
-        results = {}
-        for i, future in enumerate(futures):
-            field_name = extraction_tasks[i][2]
-            try:
-                extracted_data = future.result()
-
-                # Extract and save Time field if it exists
-                if isinstance(extracted_data, dict):
-                    if "Time" in extracted_data:
-                        field_times[field_name] = extracted_data["Time"]
-                        # Remove Time field from the extracted data
-                        del extracted_data["Time"]
-
-                    # Add the extracted data to the results dictionary
-                    for key, value in extracted_data.items():
-                        # Use the field_name prefix if the key might collide with other extractions
-                        new_key = f"{field_name}_{key}" if key in results else key
-                        results[new_key] = value
-                else:
-                    results[field_name] = extracted_data
-
-            except Exception as e:
-                # Append error log with number, field name, and traceback
-                error_logs.append(
-                    f"Error #{len(error_logs) + 1} - Extracting Field: {field_name}\n"
-                    f"Traceback:\n{traceback.format_exc()}\n"
-                    f"{'=' * 50}\n"
-                )
-                print(f"Error extracting {field_name}: {e}")
-                continue
-
-    # Calculate actual total time (parallel execution time)
-    total_parallel_time = time.time() - overall_start_time
+def run_extraction_task(func, field_name: str, cv: Dict, llm_handler: LLMHandler, model: str,
+                        stage_cache: Optional[CVStageCache] = None):
+    if stage_cache is None:
+        return func(cv, llm_handler, model=model)
+    return stage_cache.run_extractor(func, field_name, cv, llm_handler, model)
 
+
+def format_field_error(error_number: int, field_name: str, traceback_text: str) -> str:
+    return (
+        f"Error #{error_number} - Extracting Field: {field_name}\n"
+        f"Traceback:\n{traceback_text}\n"
+        f"{'=' * 50}\n"
+    )
+
+
+def finalize_cv_info(results: Dict, field_times: Dict, error_logs: list, total_parallel_time: float,
+                     timing_report: Optional[str] = None) -> Dict:
+    """
+    Adds the timing summary, error logs and WhatsApp links derived from phones to the extracted fields.
+    timing_report (the critical-path report of the parsing pipeline) replaces the summary of field times.
+    """
     # Sort field times to find the longest running task
     sorted_times = sorted(field_times.items(), key=lambda x: x[1], reverse=True)
 
@@ -158,7 +136,7 @@ def extract_cv_info(cv: Dict, llm_handler: LLMHandler):
             results["WhatsApp"] = whatsapp_links
 
     # Add timing summary to results
-    results["Parsing Step3 Time (extract fields)"] = timing_summary
+    results["Parsing Step3 Time (extract fields)"] = timing_report or timing_summary
     results["Error Logs"] = "".join(error_logs) if error_logs else ""
 
     return results
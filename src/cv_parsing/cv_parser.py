@@ -1,15 +1,101 @@
+import asyncio
+import re
 import time
 import traceback
+from typing import Optional
 
 from telegram import Update
 
 from src.bot.utils import send_answer_message
-from src.cv_parsing.cv_llm_processor import extract_cv_info
-from src.cv_parsing.info_extraction.cv_llm_languages import cv_languages_processing
+from src.cv_parsing.cv_llm_processor import CV_EXTRACTION_TASKS, add_field_result, finalize_cv_info, \
+    format_field_error, run_extraction_task
+from src.cv_parsing.cv_stage_cache import CVStageCache, FIELD_SECTION_KEYS, get_default_cv_stage_cache, \
+    without_costs
+from src.cv_parsing.info_extraction.cv_llm_languages import extract_cv_languages
+from src.cv_parsing.pipeline_dag import PipelineDAG
 from src.cv_parsing.save_cv import save_cv_info
-from src.cv_parsing.sections.section_identifier import identify_resume_sections
+from src.cv_parsing.sections.section_identifier import identify_resume_sections, extract_resume_projects
+from src.data_processing.nlp.translator import translate_text_with_llm
 from src.logger import logger
-from src.data_processing.nlp.llm_handler import LLMHandler
+from src.data_processing.nlp.llm_handler import LLMHandler, AsyncLLMHandler, get_sync_handler
+
+# Contact fields whose extractors are not run when the raw CV text has no match of their pattern,
+# they finish at once instead of waiting for the sections. Phones are not checked, dates look the same
+CONTACT_PATTERNS = {
+    "Email": r'[\w.-]+@[\w.-]+\.\w+',
+    "LinkedIn": r'linkedin',
+    "GitHub": r'github',
+    "Telegram": r'telegram|телеграм|\bt\.me/|\btg\b|(?<![\w.])@\w{5,}',
+    "WhatsApp": r'whats\s?app|ватсап|вотсап|\bwa\.me/',
+}
+
+# Pipeline nodes of the parsing steps, their errors stop the parsing
+PIPELINE_STEPS = {
+    "Step 1: Process CV languages": ("translation", "languages"),
+    "Step 2: Identify CV sections": ("sections", "projects"),
+}
+
+
+def run_cached_stage(stage_cache: Optional[CVStageCache], stage: str, text: str, compute,
+                     time_key: Optional[str] = None) -> dict:
+    """
+    Returns the output of compute() for the stage input text, reused from stage_cache if the text was seen before.
+    A reused output has its costs set to 0 and the lookup time as its time_key.
+    """
+    if stage_cache is None:
+        return compute()
+    start_time = time.time()
+    output, hit = stage_cache.cached(stage, None, [text], compute)
+    if not hit:
+        return output
+    logger.info(f"CV stage cache: {stage} reused")
+    output = without_costs(output)
+    if time_key:
+        output[time_key] = time.time() - start_time
+    return output
+
+
+def skipped_contact_result(field_name: str) -> dict:
+    return {field_name: "", f"Reasoning about {field_name}": "No contact of this kind in the CV text, LLM call skipped"}
+
+
+def build_cv_pipeline(cv_text: str, llm_handler: LLMHandler, stage_cache: Optional[CVStageCache]) -> PipelineDAG:
+    """
+    Dependency graph of the CV parsing: translation and languages of the raw text, sections of the translated text,
+    projects of the Experience section and the field extractors, each after the sections it reads
+    (FIELD_SECTION_KEYS). Contact fields absent in the raw text do not wait for anything.
+    """
+    dag = PipelineDAG()
+    dag.add_node("translation", lambda _: run_cached_stage(
+        stage_cache, "translation", cv_text,
+        lambda: translate_text_with_llm(cv_text, llm_handler, model="gpt-4.1-nano")))
+    dag.add_node("languages", lambda _: run_cached_stage(
+        stage_cache, "languages", cv_text,
+        lambda: extract_cv_languages(cv_text, llm_handler, model="gpt-4.1-nano")))
+    dag.add_node("sections", lambda inputs: run_cached_stage(
+        stage_cache, "sections", inputs["translation"]["text"],
+        lambda: identify_resume_sections(inputs["translation"]["text"], llm_handler=llm_handler,
+                                         stage_cache=stage_cache, with_projects=False),
+        "Section Extraction Time"), dependencies=["translation"])
+    dag.add_node("projects", lambda inputs: extract_resume_projects(
+        inputs["sections"], llm_handler, stage_cache=stage_cache), dependencies=["sections"])
+
+    for func, model, field_name in CV_EXTRACTION_TASKS:
+        if field_name in CONTACT_PATTERNS and not re.search(CONTACT_PATTERNS[field_name], cv_text, re.IGNORECASE):
+            dag.add_node(field_name, lambda _, field_name=field_name: skipped_contact_result(field_name))
+        elif "Projects" in FIELD_SECTION_KEYS.get(field_name, []):
+            dag.add_node(field_name, lambda inputs, func=func, model=model, field_name=field_name: run_extraction_task(
+                func, field_name, {**inputs["sections"], **inputs["projects"]}, llm_handler, model, stage_cache
+            ), dependencies=["sections", "projects"])
+        else:
+            dag.add_node(field_name, lambda inputs, func=func, model=model, field_name=field_name: run_extraction_task(
+                func, field_name, inputs["sections"], llm_handler, model, stage_cache
+            ), dependencies=["sections"])
+    return dag
+
+
+def format_node_error(error: BaseException) -> str:
+    return "".join(traceback.format_exception(type(error), error, error.__traceback__))
 
 
 async def parse_cv(cv_text: str, llm_handler: LLMHandler = None) -> dict:
@@ -27,43 +113,45 @@ async def parse_cv(cv_text: str, llm_handler: LLMHandler = None) -> dict:
             raise
 
         if llm_handler is None:
-            llm_handler = LLMHandler()
+            llm_handler = AsyncLLMHandler()
+        # Pipeline nodes run in worker threads so the event loop keeps serving other updates
+        sync_handler = get_sync_handler(llm_handler)
+        # Stages whose input text was parsed before are reused without LLM calls
+        stage_cache = get_default_cv_stage_cache()
 
-        # Step 1: Process CV languages
-        try:
-            cv_text, languages_extracted_data = cv_languages_processing(cv_text, llm_handler=llm_handler)
-            extracted_data.update(languages_extracted_data)
-        except Exception as e:
-            logs.append(
-                f"Error in Step 1: Process CV languages\n"
-                f"Traceback:\n{traceback.format_exc()}\n"
-                f"{'=' * 50}\n"
-            )
-            raise  # Re-raise to stop execution or handle as needed
+        dag = build_cv_pipeline(cv_text, sync_handler, stage_cache)
+        outputs = await dag.run()
 
-        # Step 2: Identify CV sections
-        try:
-            cv_sections = identify_resume_sections(cv_text, llm_handler=llm_handler)
-            extracted_data.update(cv_sections)
-        except Exception as e:
-            logs.append(
-                f"Error in Step 2: Identify CV sections\n"
-                f"Traceback:\n{traceback.format_exc()}\n"
-                f"{'=' * 50}\n"
-            )
-            raise
+        for step, node_names in PIPELINE_STEPS.items():
+            for name in node_names:
+                if name in outputs:
+                    # Only the text of the translation is used, by the sections
+                    if name != "translation":
+                        extracted_data.update(outputs[name])
+                elif name in dag.timings:
+                    logs.append(
+                        f"Error in {step}\n"
+                        f"Traceback:\n{format_node_error(dag.errors[name])}\n"
+                        f"{'=' * 50}\n"
+                    )
+        if "translation" in dag.timings and "languages" in dag.timings:
+            extracted_data["Parsing Step1 Time (extract languages & translate)"] = max(
+                dag.timings["translation"][1], dag.timings["languages"][1])
+        if logs:
+            raise RuntimeError(logs[0])
 
-        # Step 3: Extract CV info
-        try:
-            cv_info = extract_cv_info(cv=cv_sections, llm_handler=llm_handler)
-            extracted_data.update(cv_info)
-        except Exception as e:
-            logs.append(
-                f"Error in Step 3: Extract CV info\n"
-                f"Traceback:\n{traceback.format_exc()}\n"
-                f"{'=' * 50}\n"
-            )
-            raise
+        # Step 3: Collect the extracted fields
+        results = {}
+        field_times = {}
+        error_logs = []
+        for _, _, field_name in CV_EXTRACTION_TASKS:
+            if field_name in dag.errors:
+                error_logs.append(format_field_error(len(error_logs) + 1, field_name,
+                                                     format_node_error(dag.errors[field_name])))
+                continue
+            add_field_result(results, field_times, field_name, outputs[field_name])
+        extracted_data.update(finalize_cv_info(results, field_times, error_logs, dag.total_time,
+                                               timing_report=dag.format_report()))
 
     except Exception as e:
         # Add accumulated logs to extracted_data
@@ -80,5 +168,5 @@ async def process_cv(message: str, update: Update, text: str,  file_path: str,
     await send_answer_message(update, f"Parsing CV")
     extracted_data = await parse_cv(text, llm_handler)
     extracted_data['Original file'] = message
-    message_to_user = save_cv_info(extracted_data, file_path)
+    message_to_user = await asyncio.to_thread(save_cv_info, extracted_data, file_path)
     await send_answer_message(update, message_to_user)
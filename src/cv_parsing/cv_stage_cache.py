@@ -0,0 +1,169 @@
+"""
+Stage-level cache of CV parsing: every stage of parse_cv is keyed by the hash of the normalized text it reads,
+so a CV parsed before skips all LLM calls and a CV edited in one section re-runs only the stages reading it.
+
+    translation  raw CV text                 -> translate_text_with_llm output
+    languages    raw CV text                 -> extract_cv_languages output
+    sections     translated text             -> identify_resume_sections output without projects
+    projects     Experience section          -> iterative_project_extraction output
+    field        sections of FIELD_MAPPING   -> output of one field extractor
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.cv_parsing.info_extraction.cv_llm_certificates import AWARD_CONTENT_KWS, CERT_CONTENT_KWS
+from src.cv_parsing.info_extraction.prepare_cv_sections import collect_sections_by_keywords, get_section_for_field
+from src.data_processing.nlp.llm_cache import SQLiteLLMCache, LLM_CACHE_TTL
+from src.logger import logger
+
+load_dotenv()
+
+CV_STAGE_CACHE_PATH = os.getenv("CV_STAGE_CACHE_PATH", "cache/cv_stages.sqlite")
+CV_STAGE_CACHE_TTL = int(os.getenv("CV_STAGE_CACHE_TTL", LLM_CACHE_TTL))  # seconds
+CV_STAGE_CACHE_MAX_MB = int(os.getenv("CV_STAGE_CACHE_MAX_MB", 128))
+# Bump when a prompt or an output format of a stage changes, so older entries are not reused
+CV_STAGE_CACHE_VERSION = 2
+
+# get_section_for_field keys (FIELD_MAPPING and "Projects") read by every field extractor of CV_EXTRACTION_TASKS
+FIELD_SECTION_KEYS = {
+    "Name": ["Name"],
+    "Seniority": ["Seniority"],
+    "Roles": ["Role", "Projects"],
+    "Expertise": ["Projects"],
+    "Stack": ["Stack"],
+    "IT Domains and Industries": ["Projects"],
+    "LinkedIn": ["Linkedin"],
+    "Telegram": ["Telegram"],
+    "WhatsApp": ["WhatsApp"],
+    "Phone": ["Phone"],
+    "Email": ["Email"],
+    "GitHub": ["Github"],
+    "Location": ["Location"],
+    "Cleaned Summary": ["Summary"],
+}
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def field_input_texts(cv_sections: Dict, field_name: str) -> List:
+    """
+    Returns the texts the extractor of field_name reads from cv_sections, with the fallbacks of get_section_for_field.
+    Fields missing in FIELD_SECTION_KEYS (certificates) read the sections mentioning their keywords.
+    """
+    if field_name not in FIELD_SECTION_KEYS:
+        return [collect_sections_by_keywords(cv_sections, name_keywords=[], content_keywords=keywords)
+                for keywords in (CERT_CONTENT_KWS, AWARD_CONTENT_KWS)]
+    return [get_section_for_field(cv_sections, key) for key in FIELD_SECTION_KEYS[field_name]]
+
+
+def is_failed_output(output) -> bool:
+    """
+    Whether a field extractor caught an error of its LLM call: the contact and location extractors
+    return an empty result with "Reasoning about <field>": "Extraction failed: <error>" instead of raising.
+    """
+    return isinstance(output, dict) and any(
+        key.startswith("Reasoning about") and isinstance(value, str) and value.startswith("Extraction failed:")
+        for key, value in output.items()
+    )
+
+
+def without_costs(data: dict) -> dict:
+    """
+    Copy of a stage output with the LLM costs set to 0, for outputs reused without new LLM calls.
+    """
+    return {key: (0 if key.startswith('Cost') or key.endswith(' cost') else value) for key, value in data.items()}
+
+
+class CVStageCache:
+    """
+    Outputs of the CV parsing stages in an SQLite store with TTL and LRU eviction (see SQLiteLLMCache).
+    A key is the sha256 of the stage name, the model and the normalized input texts.
+    """
+
+    def __init__(self, path: str = CV_STAGE_CACHE_PATH, ttl: int = CV_STAGE_CACHE_TTL,
+                 max_mb: int = CV_STAGE_CACHE_MAX_MB):
+        self._store = SQLiteLLMCache(path=path, ttl=ttl, max_mb=max_mb)
+
+    @staticmethod
+    def make_key(stage: str, model: Optional[str], texts: List) -> str:
+        payload = {
+            "version": CV_STAGE_CACHE_VERSION,
+            "stage": stage,
+            "model": model,
+            "texts": [normalize_text(text) if isinstance(text, str) else [normalize_text(item) for item in text]
+                      for text in texts],
+        }
+        canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, stage: str, model: Optional[str], texts: List):
+        value = self._store.get(self.make_key(stage, model, texts))
+        return json.loads(value) if value is not None else None
+
+    def set(self, stage: str, model: Optional[str], texts: List, output):
+        self._store.set(self.make_key(stage, model, texts), json.dumps(output, ensure_ascii=False, default=str))
+
+    def cached(self, stage: str, model: Optional[str], texts: List, compute: Callable):
+        """
+        Returns (output, hit): the saved output of the stage for texts, or the output of compute() saved for next time.
+        """
+        output = self.get(stage, model, texts)
+        if output is not None:
+            return output, True
+        output = compute()
+        self.set(stage, model, texts, output)
+        return output, False
+
+    def run_extractor(self, func: Callable, field_name: str, cv_sections: Dict, llm_handler, model: str):
+        """
+        Runs one field extractor of CV_EXTRACTION_TASKS unless the sections it reads were extracted before.
+        A reused output has its costs set to 0 and the lookup time as its Time.
+        Failed extractions are not saved, the next parsing of the CV tries them again.
+        """
+        start_time = time.time()
+        texts = field_input_texts(cv_sections, field_name)
+        output = self.get(f"field:{field_name}", model, texts)
+        if output is not None:
+            logger.info(f"CV stage cache: {field_name} reused")
+            if isinstance(output, dict):
+                output = without_costs(output)
+                output["Time"] = time.time() - start_time
+            return output
+        output = func(cv_sections, llm_handler, model=model)
+        if is_failed_output(output):
+            return output
+        stored = {key: value for key, value in output.items() if key != "Time"} if isinstance(output, dict) else output
+        self.set(f"field:{field_name}", model, texts, stored)
+        return output
+
+    def clear(self):
+        self._store.clear()
+
+    def stats(self) -> dict:
+        return self._store.stats()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cv_stage_cache() -> Optional[CVStageCache]:
+    """
+    Returns the process-wide stage cache, or None if it is disabled with CV_STAGE_CACHE_ENABLED=false.
+    """
+    global _default_cache
+    if os.getenv("CV_STAGE_CACHE_ENABLED", "true").lower() in ("false", "0", "no"):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = CVStageCache()
+    return _default_cache
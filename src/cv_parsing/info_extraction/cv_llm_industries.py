@@ -7,7 +7,7 @@ from src.cv_parsing.info_extraction.cv_llm_it_domains import format_it_domains_r
     analyze_single_project_it_domains
 # from src.cv_parsing.info_extraction.new_industy_analysis import process_proposed_industries
 from src.cv_parsing.info_extraction.prepare_cv_sections import get_section_for_field
-from src.google_services.sheets import read_specific_columns
+from src.google_services.sheets import read_allowed_values
 from src.data_processing.nlp.llm_handler import LLMHandler
 
 
@@ -233,7 +233,7 @@ def extract_cv_domains_and_industries(
     Extracts and analyzes industries from a resume using parallel processing.
     """
     start_time = time.time()
-    values_df = read_specific_columns(['Industries Values', 'IT Domains Values'], 'values')
+    values_df = read_allowed_values(['Industries Values', 'IT Domains Values'])
     predefined_industries = [val.strip() for val in values_df['Industries Values'].tolist() if val and pd.notna(val)]
     predefined_it_domains = [val.strip() for val in values_df['IT Domains Values'].tolist() if val and pd.notna(val)]
 
@@ -1,9 +1,4 @@
-import time
-
 from src.data_processing.nlp.languages_info import LanguageItem
-from src.data_processing.nlp.translator import translate_text_with_llm
-
-import concurrent.futures
 
 import json
 from pydantic import BaseModel, Field
@@ -141,22 +136,3 @@ def _validate_english_level(languages_analysis: CVLanguagesAnalysis, cv: str) ->
             languages_analysis.languages.append(languages_analysis.location_language)
 
     return languages_analysis
-
-
-
-def cv_languages_processing(cv_text: str, llm_handler: LLMHandler):
-    start_time = time.time()
-    # Use ThreadPoolExecutor to run the functions concurrently
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Submit both tasks to the executor
-        future1 = executor.submit(extract_cv_languages, cv_text, llm_handler, model="gpt-4.1-nano")
-        future2 = executor.submit(translate_text_with_llm, cv_text, llm_handler, model="gpt-4.1-nano")
-
-        # Retrieve the results
-        languages_extracted_data = future1.result()
-        translated_text_info = future2.result()
-
-    cv_text = translated_text_info['text']
-    languages_extracted_data["Parsing Step1 Time (extract languages & translate)"] = time.time() - start_time
-    return cv_text, languages_extracted_data
-
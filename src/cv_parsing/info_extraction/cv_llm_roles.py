@@ -7,7 +7,7 @@ from typing_extensions import Annotated
 from src.cv_parsing.info_extraction.new_role_analysis import process_proposed_roles, process_roles_list
 from src.cv_parsing.info_extraction.prepare_cv_sections import get_section_for_field
 from src.data_processing.allowed_values_matcher import match_values
-from src.google_services.sheets import read_specific_columns
+from src.google_services.sheets import read_allowed_values
 from src.data_processing.nlp.llm_handler import LLMHandler
 from src.logger import logger
 
@@ -163,7 +163,7 @@ def extract_cv_roles(
     """
     start_time = time.time()
     roles_list: List[str] = list(
-        read_specific_columns(['Role Values'], 'values')['Role Values']
+        read_allowed_values(['Role Values'])['Role Values']
     )
 
     # Extract projects from the resume
@@ -0,0 +1,109 @@
+"""
+Small dependency graph executor for the CV parsing pipeline.
+Every node starts as soon as all its dependencies are finished, its start and end times are recorded
+for the critical-path report.
+"""
+import asyncio
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.logger import logger
+
+
+class DependencyFailed(Exception):
+    """Set as the error of a node that was not run because one of its dependencies failed."""
+
+
+class PipelineDAG:
+    """
+    Nodes are sync functions of the outputs of their dependencies (a dict by dependency name),
+    they run in worker threads so that independent nodes overlap.
+    A failed node does not stop the others, its dependents are skipped with DependencyFailed.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, dict] = {}
+        self.outputs: Dict[str, object] = {}
+        self.errors: Dict[str, BaseException] = {}
+        self.timings: Dict[str, tuple] = {}  # name -> (start, end) in seconds from the start of run
+        self.total_time = 0.0
+
+    def add_node(self, name: str, func: Callable[[Dict[str, object]], object], dependencies: Iterable[str] = ()):
+        if name in self.nodes:
+            raise ValueError(f"Node '{name}' is already in the pipeline")
+        dependencies = list(dependencies)
+        unknown = [dependency for dependency in dependencies if dependency not in self.nodes]
+        if unknown:
+            # Dependencies are added first, so the graph has no cycles
+            raise ValueError(f"Node '{name}' depends on unknown nodes: {', '.join(unknown)}")
+        self.nodes[name] = {'func': func, 'dependencies': dependencies}
+
+    async def run(self) -> Dict[str, object]:
+        """
+        Runs all nodes and returns the outputs of the successful ones, errors are in self.errors.
+        """
+        start_time = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_node(name: str):
+            node = self.nodes[name]
+            await asyncio.gather(*(tasks[dependency] for dependency in node['dependencies']))
+            failed = [dependency for dependency in node['dependencies'] if dependency in self.errors]
+            if failed:
+                self.errors[name] = DependencyFailed(f"Dependencies failed: {', '.join(failed)}")
+                return
+            inputs = {dependency: self.outputs[dependency] for dependency in node['dependencies']}
+            node_start = time.perf_counter() - start_time
+            try:
+                self.outputs[name] = await asyncio.to_thread(node['func'], inputs)
+            except Exception as e:
+                logger.error(f"Pipeline node '{name}' failed: {e}")
+                self.errors[name] = e
+            self.timings[name] = (node_start, time.perf_counter() - start_time)
+
+        for name in self.nodes:
+            tasks[name] = asyncio.create_task(run_node(name))
+        await asyncio.gather(*tasks.values())
+        self.total_time = time.perf_counter() - start_time
+        return self.outputs
+
+    def duration(self, name: str) -> float:
+        start, end = self.timings.get(name, (0.0, 0.0))
+        return end - start
+
+    def critical_path(self, target: Optional[str] = None) -> List[str]:
+        """
+        Chain of nodes that decided the end time of target (by default the node that finished last):
+        from target back through the dependency that finished last.
+        """
+        if not self.timings:
+            return []
+        if target is None:
+            target = max(self.timings, key=lambda name: self.timings[name][1])
+        path = [target]
+        while True:
+            finished = [dependency for dependency in self.nodes[path[-1]]['dependencies'] if dependency in self.timings]
+            if not finished:
+                break
+            path.append(max(finished, key=lambda name: self.timings[name][1]))
+        return path[::-1]
+
+    def format_report(self) -> str:
+        """
+        Critical-path report: the total time, the critical path with node durations
+        and the start, end and duration of every node by end time.
+        """
+        path = self.critical_path()
+        lines = [f"Total time: {self.total_time:.1f} sec"]
+        if path:
+            lines.append("Critical path: " + " -> ".join(f"{name} ({self.duration(name):.1f} sec)" for name in path))
+        lines.append(f"{'=' * 35}")
+        lines.append("Node times (start - end, duration):")
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][1]):
+            marker = "*" if name in path else " "
+            status = ", failed" if name in self.errors else ""
+            lines.append(f"{marker} {name:<25}: {start:>5.1f} - {end:>5.1f} sec, {end - start:>5.1f} sec{status}")
+        for name, error in self.errors.items():
+            if name not in self.timings:
+                lines.append(f"  {name:<25}: skipped, {error}")
+        return "\n".join(lines)
@@ -11,10 +11,16 @@ from src.google_services.drive import initialize_google_drive_api, check_or_crea
 load_dotenv()
 
 from src.google_services.sheets import write_dict_to_sheet
+from src.google_services.candidates_snapshot import candidates_snapshot
+from src.google_services.write_queue import sheet_write_queue
 from googleapiclient.http import MediaFileUpload
 
 
-def save_cv_info(extracted_data, file_path):
+def prepare_cv_info(extracted_data, file_path):
+    """
+    Uploads the CV file to Google Drive and completes extracted_data to a staff sheet row.
+    Returns (extracted_data, message_to_user).
+    """
     if file_path is not None:
         extracted_data, full_name, drive_file_name = check_the_original_file_name(extracted_data, file_path)
         if os.path.exists(file_path):
@@ -33,18 +39,25 @@ def save_cv_info(extracted_data, file_path):
     if  "Phone" in extracted_data and extracted_data["Phone"]:
         extracted_data["Phone"] = f"'{extracted_data['Phone']}"
 
+    doc_id = os.getenv("STAFF_SPREADSHEET_ID")
+    page_id = os.getenv("CANDIDATES_SHEET_ID")
+    google_sheet_row_link = f"<a href='https://docs.google.com/spreadsheets/d/{doc_id}/edit#gid={page_id}&range=A2'>{full_name} {existence_cv}CV is parsed</a>"
+    return extracted_data, google_sheet_row_link
+
+
+def save_cv_info(extracted_data, file_path):
+    extracted_data, google_sheet_row_link = prepare_cv_info(extracted_data, file_path)
+
     write_dict_to_sheet(data_dict=extracted_data, sheet_name="staff")
+    candidates_snapshot.invalidate()
     keys = ""
     for key in extracted_data.keys():
         keys = f"{keys}\t{key}"
     print(keys)
 
 
-    write_dict_to_sheet(data_dict=extracted_data, sheet_name=os.getenv("PARSE_LOGS_SHEET_NAME"))
-
-    doc_id = os.getenv("STAFF_SPREADSHEET_ID")
-    page_id = os.getenv("CANDIDATES_SHEET_ID")
-    google_sheet_row_link = f"<a href='https://docs.google.com/spreadsheets/d/{doc_id}/edit#gid={page_id}&range=A2'>{full_name} {existence_cv}CV is parsed</a>"
+    # The parsing log is not read back, it is written in the background
+    sheet_write_queue.insert_row(sheet_name=os.getenv("PARSE_LOGS_SHEET_NAME"), values=extracted_data)
     return google_sheet_row_link
 
 
@@ -2,25 +2,28 @@
 Main section identification module.
 """
 import time
-from typing import Dict, Any, Literal
+from typing import Dict, Any, Literal, Optional
 from .full_extraction import extract_full_sections
 from src.logger import logger
 from .projects_extraction import iterative_project_extraction
 from .section_by_section import extract_section_by_section
 from ...data_processing.nlp.llm_handler import LLMHandler
 from src.cv_parsing.sections.section_by_section import MANDATORY_SECTIONS
+from src.cv_parsing.cv_stage_cache import CVStageCache
 
 
 def identify_resume_sections(
     cv_text: str,
     llm_handler: LLMHandler,
     model: str = "gpt-4.1-nano",
-    size_threshold: int = 1000
+    size_threshold: int = 1000,
+    stage_cache: Optional[CVStageCache] = None,
+    with_projects: bool = True
 ) -> Dict[str, Any]:
     """
     Identify and extract resume sections using the full extraction method.
     Falls back to section-by-section extraction for missing mandatory sections.
-    Also extracts projects from the Experience section.
+    Also extracts projects from the Experience section (see extract_resume_projects) unless with_projects is False.
     """
     start_time = time.time()
     path_steps = []
@@ -96,39 +99,72 @@ def identify_resume_sections(
             formatted_gaps += f"\n\nCoverage: {gaps_dict['coverage_percent']:.1f}%"
         final_result["Gaps"] = formatted_gaps
 
+    # Sections usage and cost, the projects extraction adds its own
+    total_prompt_tokens = result["token_usage"]["prompt_tokens"] + result["token_usage"]["completion_tokens"]
+    total_cost = result["cost"]["total_cost"]
+    if fallback_result:
+        total_prompt_tokens += fallback_result.get("token_usage", {}).get("prompt_tokens", 0)
+        total_prompt_tokens += fallback_result.get("token_usage", {}).get("completion_tokens", 0)
+        total_cost += fallback_result.get("cost", 0)
+    final_result["Total Section Extraction tokens"] = total_prompt_tokens
+    final_result["Total Section Extraction cost"] = total_cost
+
+    # Add metadata
+    final_result["Section Extraction Time"] = time.time() - start_time
+    final_result["Section Extraction Model"] = model
+    final_result["Section Extraction Path"] = "\n".join(path_steps)
+
     # Step 6: Extract projects from Experience section after handling gaps
-    experience_text = result["sections"].get("Experience", "")
+    if with_projects:
+        final_result.update(extract_resume_projects(final_result, llm_handler, model, stage_cache))
+
+    logger.info(f"Section identification completed in {final_result['Section Extraction Time']:.2f}s")
+
+    return final_result
+
+
+def extract_resume_projects(
+    cv_sections: Dict[str, Any],
+    llm_handler: LLMHandler,
+    model: str = "gpt-4.1-nano",
+    stage_cache: Optional[CVStageCache] = None
+) -> Dict[str, Any]:
+    """
+    Extracts projects from the Experience section of identify_resume_sections output (with_projects=False),
+    reusing the projects of stage_cache if the same Experience text was split before.
+    Returns the updated Projects, totals, time and path of the section extraction.
+    """
+    start_time = time.time()
+    path_steps = []
+    update = {}
+    experience_text = cv_sections.get("Experience", "")
     if experience_text:
-        projects_extraction_start = time.time()
-        projects_result = iterative_project_extraction(llm_handler, model, experience_text)
-        projects_extraction_time = time.time() - projects_extraction_start
+        if stage_cache is None:
+            projects_result = iterative_project_extraction(llm_handler, model, experience_text)
+        else:
+            projects_result, hit = stage_cache.cached(
+                "projects", model, [experience_text],
+                lambda: iterative_project_extraction(llm_handler, model, experience_text)
+            )
+            if hit:
+                projects_result["total_cost"] = 0
+                path_steps.append("Projects reused from the stage cache")
+        projects_extraction_time = time.time() - start_time
 
         path_steps.extend(projects_result["path_steps"])
         path_steps.append(f"Step 6: Projects extraction completed in {projects_extraction_time:.2f} sec")
         # Add projects information
-        final_result["Projects"] = projects_result["projects"]
+        update["Projects"] = projects_result["projects"]
 
         # Add projects extraction usage and cost to totals
-        total_prompt_tokens = result["token_usage"]["prompt_tokens"] + result["token_usage"]["completion_tokens"]
-        total_cost = result["cost"]["total_cost"]
-        total_prompt_tokens += projects_result["total_prompt_tokens"]
-        total_cost += projects_result["total_cost"]
-
-        if fallback_result:
-            total_prompt_tokens += fallback_result.get("token_usage", {}).get("prompt_tokens", 0)
-            total_prompt_tokens += fallback_result.get("token_usage", {}).get("completion_tokens", 0)
-            total_cost += fallback_result.get("cost", 0)
-
-        final_result["Total Section Extraction tokens"] = total_prompt_tokens
-        final_result["Total Section Extraction cost"] = total_cost
+        update["Total Section Extraction tokens"] = (cv_sections.get("Total Section Extraction tokens", 0) +
+                                                     projects_result["total_prompt_tokens"])
+        update["Total Section Extraction cost"] = (cv_sections.get("Total Section Extraction cost", 0) +
+                                                   projects_result["total_cost"])
     else:
         path_steps.append("Step 6: No Experience section found, skipping projects extraction")
 
-    # Add metadata
-    final_result["Section Extraction Time"] = time.time() - start_time
-    final_result["Section Extraction Model"] = model
-    final_result["Section Extraction Path"] = "\n".join(path_steps)
-
-    logger.info(f"Section identification completed in {final_result['Section Extraction Time']:.2f}s")
-
-    return final_result
+    update["Section Extraction Time"] = cv_sections.get("Section Extraction Time", 0) + time.time() - start_time
+    update["Section Extraction Path"] = "\n".join(
+        step for step in [cv_sections.get("Section Extraction Path", "")] + path_steps if step)
+    return update
@@ -1,21 +1,152 @@
 # https://platform.openai.com/docs/guides/batch
 
-from typing import Optional, Dict, List
+from collections import defaultdict
+from typing import Optional, Dict, Iterator, List, Tuple
 from openai import OpenAI
+import asyncio
 import os
 import json
+import threading
 import time
 from dotenv import load_dotenv
 
+from src.logger import logger
+
 load_dotenv()
 
+# Batch API prices per 1M tokens, 0 for cached input means there is no cached discount
+BATCH_PRICING = {
+    "gpt-5": {"input": 0.625, "cached_input": 0.0625, "output": 5.00},
+    "gpt-5-mini": {"input": 0.125, "cached_input": 0.0125, "output": 1.00},
+    "gpt-5-nano": {"input": 0.025, "cached_input": 0.0025, "output": 0.20},
+    "gpt-4.1": {"input": 1.00, "cached_input": 0, "output": 4.00},
+    "gpt-4.1-mini": {"input": 0.20, "cached_input": 0, "output": 0.80},
+    "gpt-4.1-nano": {"input": 0.05, "cached_input": 0, "output": 0.20},
+    "gpt-4o": {"input": 1.25, "cached_input": 0, "output": 5.00},
+    "gpt-4o-2024-05-13": {"input": 2.50, "cached_input": 0, "output": 7.50},
+    "gpt-4o-mini": {"input": 0.075, "cached_input": 0, "output": 0.30},
+    "o4-mini": {"input": 0.55, "cached_input": 0, "output": 2.20},
+}
+
+RESULT_CHUNK_SIZE = 1 << 20  # bytes
+
+
+def get_batch_pricing(model: str) -> Optional[Dict[str, float]]:
+    """
+    Prices of a model, dated snapshot names ("gpt-4.1-nano-2025-04-14") use the longest matching model name.
+    """
+    if model in BATCH_PRICING:
+        return BATCH_PRICING[model]
+    base_model = max((name for name in BATCH_PRICING if model.startswith(name)), key=len, default=None)
+    return BATCH_PRICING[base_model] if base_model else None
+
+
+def calculate_batch_cost(model: str, input_tokens: int, cached_input_tokens: int = 0, output_tokens: int = 0) -> float:
+    """
+    Cost in dollars of batch tokens, input_tokens include the cached ones as in the API usage.
+    """
+    model_pricing = get_batch_pricing(model)
+    if model_pricing is None:
+        raise ValueError(f"Model {model} not found in pricing table.")
+    cached_input_price = model_pricing["cached_input"] or model_pricing["input"]
+    input_cost = (input_tokens - cached_input_tokens) * model_pricing["input"] / 1_000_000
+    cached_input_cost = cached_input_tokens * cached_input_price / 1_000_000
+    output_cost = output_tokens * model_pricing["output"] / 1_000_000
+    return input_cost + cached_input_cost + output_cost
+
+
+def _empty_totals() -> Dict:
+    return {"requests": 0, "errors": 0, "input_tokens": 0, "cached_input_tokens": 0, "output_tokens": 0, "cost": 0.0}
+
+
+def _add_totals(totals: Dict, other: Dict):
+    for key, value in other.items():
+        totals[key] += value
+
+
+class BatchCostTracker:
+    """
+    Token and cost totals of batches, added up result by result while result files are read.
+    Several batches can be tracked at the same time from different threads, each under its id.
+    Totals are kept per model and per extractor, the part of custom_id before the first "/"
+    ("Stack/<hash>" -> "Stack").
+    """
+
+    def __init__(self):
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def _batch(self, batch_id: str) -> Dict:
+        if batch_id not in self._batches:
+            self._batches[batch_id] = {"by_model": defaultdict(_empty_totals),
+                                       "by_extractor": defaultdict(_empty_totals)}
+        return self._batches[batch_id]
+
+    def add(self, batch_id: str, custom_id: str, model: Optional[str], usage: Optional[Dict]):
+        """
+        Adds one result, usage None is a failed request.
+        """
+        extractor = custom_id.split("/", 1)[0] if "/" in custom_id else "other"
+        totals = _empty_totals()
+        totals["requests"] = 1
+        if usage is None:
+            totals["errors"] = 1
+        else:
+            totals["input_tokens"] = usage.get("prompt_tokens", 0)
+            totals["cached_input_tokens"] = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+            totals["output_tokens"] = usage.get("completion_tokens", 0)
+            try:
+                totals["cost"] = calculate_batch_cost(model, totals["input_tokens"], totals["cached_input_tokens"],
+                                                      totals["output_tokens"])
+            except ValueError as e:
+                logger.warning(f"Batch cost of {custom_id} is not counted: {e}")
+        with self._lock:
+            batch = self._batch(batch_id)
+            _add_totals(batch["by_model"][model or "unknown"], totals)
+            _add_totals(batch["by_extractor"][extractor], totals)
+
+    def summary(self, batch_ids: Optional[List[str]] = None) -> Dict:
+        """
+        Returns the totals of the given batches (all tracked batches by default):
+        {"total": {...}, "by_model": {model: {...}}, "by_extractor": {extractor: {...}}}
+        """
+        summary = {"total": _empty_totals(), "by_model": defaultdict(_empty_totals),
+                   "by_extractor": defaultdict(_empty_totals)}
+        with self._lock:
+            for batch_id in (batch_ids if batch_ids is not None else list(self._batches)):
+                batch = self._batches.get(batch_id)
+                if batch is None:
+                    continue
+                for model, totals in batch["by_model"].items():
+                    _add_totals(summary["by_model"][model], totals)
+                    _add_totals(summary["total"], totals)
+                for extractor, totals in batch["by_extractor"].items():
+                    _add_totals(summary["by_extractor"][extractor], totals)
+        summary["by_model"] = dict(summary["by_model"])
+        summary["by_extractor"] = dict(summary["by_extractor"])
+        return summary
+
+    @staticmethod
+    def format_summary(summary: Dict) -> str:
+        total = summary["total"]
+        lines = [f"Batch requests: {total['requests']} ({total['errors']} failed), "
+                 f"input tokens: {total['input_tokens']} ({total['cached_input_tokens']} cached), "
+                 f"output tokens: {total['output_tokens']}, cost: ${total['cost']:.4f}"]
+        for group in ("by_model", "by_extractor"):
+            for name, totals in sorted(summary[group].items(), key=lambda item: -item[1]["cost"]):
+                lines.append(f"  {name:<25}: {totals['requests']:>6} requests, ${totals['cost']:.4f}")
+        return "\n".join(lines)
+
+
 class BatchHandler:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, cost_tracker: Optional[BatchCostTracker] = None):
         """
         Initialize the OpenAI client.
         :param api_key: OpenAI API key. If not provided, it will be taken from the OPENAI_API_KEY environment variable.
+        :param cost_tracker: Tracker of the batch costs, results read with iter_results are added to it.
         """
         self.client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+        self.cost_tracker = cost_tracker or BatchCostTracker()
 
     def upload_batch_file(self, file_path: str) -> str:
         """
@@ -66,23 +197,114 @@ class BatchHandler:
             print(f"Current status: {status}. Waiting...")
             time.sleep(poll_interval)
 
-    def download_results(self, batch_id: str, output_file_path: str) -> None:
+    async def wait_for_completion_async(self, batch_id: str, poll_interval: int = 60) -> Dict:
         """
-        Download the batch results.
+        Awaitable wait_for_completion: the status is polled in a worker thread and the wait does not block the loop.
         :param batch_id: Batch ID.
-        :param output_file_path: Path to save the results.
+        :param poll_interval: Polling interval in seconds.
+        :return: Dictionary with the final batch status information.
+        """
+        while True:
+            batch = await asyncio.to_thread(self.get_batch_status, batch_id)
+            status = batch["status"]
+            if status == "completed":
+                logger.info(f"Batch {batch_id} completed")
+                return batch
+            elif status in ("failed", "expired", "cancelled"):
+                raise RuntimeError(f"Batch {batch_id} {status}.")
+            logger.info(f"Batch {batch_id} status: {status}. Waiting...")
+            await asyncio.sleep(poll_interval)
+
+    @staticmethod
+    def write_batch_file(requests: List[Dict], file_path: str) -> None:
+        """
+        Write batch requests ({"custom_id", "method", "url", "body"}) to a .jsonl input file.
+        :param requests: List of request dictionaries.
+        :param file_path: Path of the .jsonl file.
+        """
+        if os.path.dirname(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w", encoding="utf-8") as file:
+            for request in requests:
+                file.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    def submit_requests(self, requests: List[Dict], file_path: str, endpoint: str = "/v1/chat/completions") -> str:
+        """
+        Write the requests to file_path, upload the file and create a batch.
+        :return: Batch ID.
+        """
+        self.write_batch_file(requests, file_path)
+        input_file_id = self.upload_batch_file(file_path)
+        return self.create_batch(input_file_id, endpoint)
+
+    def _iter_file_lines(self, file_id: str, chunk_size: int = RESULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Streams a file in chunks and yields its lines, the file is never loaded whole.
+        """
+        with self.client.files.with_streaming_response.content(file_id) as response:
+            pending = b""
+            for chunk in response.iter_bytes(chunk_size):
+                lines = (pending + chunk).split(b"\n")
+                pending = lines.pop()
+                yield from lines
+            if pending:
+                yield pending
+
+    def iter_results(self, batch_id: str, output_file_path: Optional[str] = None,
+                     chunk_size: int = RESULT_CHUNK_SIZE) -> Iterator[Tuple[str, Dict, Optional[Dict]]]:
+        """
+        Reads the output and error files of a completed batch in one pass.
+        Yields (custom_id, parsed_response, usage): parsed_response is the response body (a chat completion)
+        or {"error": ...} for a failed request, whose usage is None. Every result is added to cost_tracker.
+        :param batch_id: Batch ID.
+        :param output_file_path: If given, the raw lines of both files are saved there while they are read.
+        :param chunk_size: Size of the downloaded chunks in bytes.
         """
         batch = self.get_batch_status(batch_id)
         if batch["status"] != "completed":
             raise ValueError(f"Batch {batch_id} is not completed.")
-
-        output_file_id = batch["output_file_id"]
-        if not output_file_id:
+        file_ids = [file_id for file_id in (batch.get("output_file_id"), batch.get("error_file_id")) if file_id]
+        if not file_ids:
             raise ValueError("No output file ID found.")
 
-        content = self.client.files.content(output_file_id).text
-        with open(output_file_path, "w", encoding="utf-8") as file:
-            file.write(content)
+        output_file = None
+        if output_file_path is not None:
+            if os.path.dirname(output_file_path):
+                os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+            output_file = open(output_file_path, "wb")
+        try:
+            for file_id in file_ids:
+                for line in self._iter_file_lines(file_id, chunk_size):
+                    if not line.strip():
+                        continue
+                    if output_file is not None:
+                        output_file.write(line + b"\n")
+                    yield self._parse_result_line(batch_id, line)
+        finally:
+            if output_file is not None:
+                output_file.close()
+
+    def _parse_result_line(self, batch_id: str, line: bytes) -> Tuple[str, Dict, Optional[Dict]]:
+        record = json.loads(line)
+        custom_id = record.get("custom_id", "")
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if response.get("status_code") == 200 and not record.get("error"):
+            usage = body.get("usage") or {}
+            self.cost_tracker.add(batch_id, custom_id, body.get("model"), usage)
+            return custom_id, body, usage
+        error = record.get("error") or body.get("error") or {"status_code": response.get("status_code")}
+        self.cost_tracker.add(batch_id, custom_id, body.get("model"), None)
+        return custom_id, {"error": error}, None
+
+    def download_results(self, batch_id: str, output_file_path: str) -> None:
+        """
+        Download the batch results (output and error files) in chunks.
+        :param batch_id: Batch ID.
+        :param output_file_path: Path to save the results.
+        """
+        for _ in self.iter_results(batch_id, output_file_path):
+            pass
         print(f"Results saved to {output_file_path}")
 
     def calculate_batch_cost(
@@ -95,43 +317,21 @@ class BatchHandler:
         """
         Calculate the cost of running a batch.
         :param model: Model name (e.g., "gpt-4.1-nano").
-        :param input_tokens: Number of input tokens.
+        :param input_tokens: Number of input tokens, cached ones included.
         :param cached_input_tokens: Number of cached input tokens (if supported).
         :param output_tokens: Number of output tokens.
         :return: Total cost in dollars.
         """
-        pricing = {
-            "gpt-5": {"input": 0.625, "cached_input": 0.0625, "output": 5.00},
-            "gpt-5-mini": {"input": 0.125, "cached_input": 0.0125, "output": 1.00},
-            "gpt-5-nano": {"input": 0.025, "cached_input": 0.0025, "output": 0.20},
-            "gpt-4.1": {"input": 1.00, "cached_input": 0, "output": 4.00},
-            "gpt-4.1-mini": {"input": 0.20, "cached_input": 0, "output": 0.80},
-            "gpt-4.1-nano": {"input": 0.05, "cached_input": 0, "output": 0.20},
-            "gpt-4o": {"input": 1.25, "cached_input": 0, "output": 5.00},
-            "gpt-4o-2024-05-13": {"input": 2.50, "cached_input": 0, "output": 7.50},
-            "gpt-4o-mini": {"input": 0.075, "cached_input": 0, "output": 0.30},
-            "o4-mini": {"input": 0.55, "cached_input": 0, "output": 2.20},
-        }
-
-        if model not in pricing:
-            raise ValueError(f"Model {model} not found in pricing table.")
-
-        model_pricing = pricing[model]
-
-        input_cost = (input_tokens * model_pricing["input"]) / 1_000_000
-        cached_input_cost = (cached_input_tokens * model_pricing["cached_input"]) / 1_000_000
-        output_cost = (output_tokens * model_pricing["output"]) / 1_000_000
-
-        total_cost = input_cost + cached_input_cost + output_cost
-        return total_cost
+        return calculate_batch_cost(model, input_tokens, cached_input_tokens, output_tokens)
 
     def calculate_total_tokens(self, results_file_path: str) -> Dict[str, int]:
         """
         Calculate the total number of tokens from the results file.
         :param results_file_path: Path to the results file.
-        :return: Dictionary with total input and output tokens.
+        :return: Dictionary with total input, cached input and output tokens.
         """
         total_input_tokens = 0
+        total_cached_input_tokens = 0
         total_output_tokens = 0
 
         with open(results_file_path, "r", encoding="utf-8") as file:
@@ -142,12 +342,15 @@ class BatchHandler:
                         body = data["response"]["body"]
                         if "usage" in body:
                             total_input_tokens += body["usage"]["prompt_tokens"]
+                            total_cached_input_tokens += (body["usage"].get("prompt_tokens_details") or {}).get(
+                                "cached_tokens", 0) or 0
                             total_output_tokens += body["usage"]["completion_tokens"]
                 except json.JSONDecodeError:
                     continue
 
         return {
             "input_tokens": total_input_tokens,
+            "cached_input_tokens": total_cached_input_tokens,
             "output_tokens": total_output_tokens
         }
 
@@ -160,10 +363,10 @@ class BatchHandler:
     ) -> None:
         """
         Full workflow: upload file, create batch, wait for completion,
-        download results, and calculate cost.
+        download results and calculate cost in one pass.
         :param input_file_path: Path to the input .jsonl file.
         :param output_file_path: Path to save the results.
-        :param model: Model name (e.g., "gpt-4.1-nano").
+        :param model: Model name (e.g., "gpt-4.1-nano"), the cost uses the model of every answer.
         :param endpoint: API endpoint.
         """
         print("Uploading batch file...")
@@ -175,17 +378,6 @@ class BatchHandler:
         print(f"Batch ID: {batch_id}. Waiting for completion...")
         self.wait_for_completion(batch_id)
 
-        print("Downloading results...")
+        print("Downloading results and calculating tokens and cost...")
         self.download_results(batch_id, output_file_path)
-
-        print("Calculating total tokens and cost...")
-        tokens = self.calculate_total_tokens(output_file_path)
-        total_cost = self.calculate_batch_cost(
-            model=model,
-            input_tokens=tokens["input_tokens"],
-            output_tokens=tokens["output_tokens"]
-        )
-
-        print(f"Total input tokens: {tokens['input_tokens']}")
-        print(f"Total output tokens: {tokens['output_tokens']}")
-        print(f"Total cost: ${total_cost:.4f}")
+        print(BatchCostTracker.format_summary(self.cost_tracker.summary([batch_id])))
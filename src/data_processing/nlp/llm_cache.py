@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from src.logger import logger
+
+load_dotenv()
+
+# Defaults can be overridden in .env
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_responses.sqlite")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 60 * 60))  # seconds
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", 256))
+
+
+def _response_format_key(response_format):
+    """
+    Returns a stable description of response_format for the cache key.
+    Pydantic models are described by their name and JSON schema, so changing a model invalidates its entries.
+    """
+    if response_format is None:
+        return None
+    if hasattr(response_format, "model_json_schema"):
+        return {"name": response_format.__name__, "schema": response_format.model_json_schema()}
+    return response_format
+
+
+def make_cache_key(prompt, model, max_tokens, temperature, seed, response_format=None) -> str:
+    """
+    Builds the content address of an LLM request: sha256 of the canonical JSON of all inputs
+    that define the answer.
+    """
+    payload = {
+        "model": model,
+        "messages": prompt,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "seed": seed,
+        "response_format": _response_format_key(response_format),
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMCache(ABC):
+    """
+    Interface of the LLMHandler response cache.
+    Values are the JSON dumps of chat completions, the handler rebuilds its answers from them.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._counters_lock = threading.Lock()
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    def _count(self, hit: bool):
+        with self._counters_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class SQLiteLLMCache(LLMCache):
+    """
+    On-disk response cache with TTL and size-based LRU eviction.
+    One connection is shared by all threads of the process and guarded by a lock.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl: int = LLM_CACHE_TTL, max_mb: int = LLM_CACHE_MAX_MB):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at, size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_size -= row[2]
+                row = None
+            if row is not None:
+                self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(row is not None)
+        return row[0] if row is not None else None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            previous = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._total_size += size - (previous[0] if previous else 0)
+            if self._total_size > self.max_bytes:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        # Expired entries go first, then the least recently used ones until the cache is 10% below the limit
+        self._connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self._total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target_size = self.max_bytes * 0.9
+        if self._total_size <= target_size:
+            return
+        freed = 0
+        keys_to_delete = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            keys_to_delete.append((key,))
+            freed += size
+            if self._total_size - freed <= target_size:
+                break
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", keys_to_delete)
+        self._total_size -= freed
+        logger.info(f"LLM cache: evicted {len(keys_to_delete)} least recently used responses")
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._total_size = 0
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats["entries"] = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            stats["size_bytes"] = self._total_size
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_llm_cache() -> Optional[LLMCache]:
+    """
+    Returns the process-wide response cache, or None if it is disabled with LLM_CACHE_ENABLED=false.
+    """
+    global _default_cache
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("false", "0", "no"):
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SQLiteLLMCache()
+    return _default_cache
@@ -1,10 +1,20 @@
+import asyncio
+import concurrent.futures
+import threading
 import time
+import weakref
 from typing import List, Dict
-from openai import OpenAI, AuthenticationError, OpenAIError
+
+import httpx
+from openai.types.chat import ChatCompletion
+from openai import OpenAI, AsyncOpenAI, AuthenticationError, OpenAIError, DefaultHttpxClient, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 import os
 
 from src.logger import logger
+from src.data_processing.nlp.llm_cache import LLMCache, get_default_llm_cache, make_cache_key
+from src.data_processing.nlp.llm_retry import get_retry_delay, is_retryable_error, latency_tracker
+from src.data_processing.nlp.rate_limiter import INTERACTIVE, estimate_prompt_tokens, get_rate_limiter
 
 load_dotenv()
 
@@ -94,24 +104,95 @@ import json
 
 T = TypeVar('T', bound=BaseModel)
 
-class LLMHandler:
+# One connection pool per process: keep-alive connections are reused across handlers and requests
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=120)
+
+_openai_clients = {}
+_openai_clients_lock = threading.Lock()
+# httpx async connections are bound to the event loop that opened them, so async clients are kept per loop
+_async_openai_clients = weakref.WeakKeyDictionary()
+# Threads for the duplicate requests of hedged sync calls
+_hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+def get_openai_client(api_key=None, url=None) -> OpenAI:
+    """
+    Returns the process-wide OpenAI client for the given api key and base url, creating it on first use.
+    """
+    if api_key is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+    client_key = (api_key, url)
+    with _openai_clients_lock:
+        client = _openai_clients.get(client_key)
+        if client is None:
+            # Retries are done by LLMHandler.get_answer (see llm_retry.py), so the client does not retry
+            client = OpenAI(api_key=api_key, base_url=url, max_retries=0,
+                            http_client=DefaultHttpxClient(limits=HTTP_POOL_LIMITS))
+            _openai_clients[client_key] = client
+    return client
+
+
+def get_async_openai_client(api_key=None, url=None) -> AsyncOpenAI:
+    """
+    Returns the pooled AsyncOpenAI client of the running event loop, creating it on first use.
+    Must be called from a coroutine.
+    """
+    if api_key is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+    loop = asyncio.get_running_loop()
+    loop_clients = _async_openai_clients.setdefault(loop, {})
+    client_key = (api_key, url)
+    client = loop_clients.get(client_key)
+    if client is None:
+        # No client retries either, AsyncLLMHandler.get_answer retries
+        client = AsyncOpenAI(api_key=api_key, base_url=url, max_retries=0,
+                             http_client=DefaultAsyncHttpxClient(limits=HTTP_POOL_LIMITS))
+        loop_clients[client_key] = client
+    return client
+
+
+async def close_async_openai_clients(*args):
+    """
+    Closes the pooled async clients of the running event loop.
+    Accepts and ignores positional arguments so it can be used as a PTB post_shutdown callback.
+    """
+    loop_clients = _async_openai_clients.pop(asyncio.get_running_loop(), {})
+    for client in loop_clients.values():
+        await client.close()
+
 
-    def __init__(self, api_key=None, url=None):
-            if api_key is None:
-                api_key = os.getenv("OPENAI_API_KEY")
-            if url is None:
-                self.openai_client = OpenAI(api_key=api_key)
-            else:
-                self.openai_client = OpenAI(api_key=api_key, base_url=url)
+class LLMHandler:
+    MAX_TOKENS_BY_MODEL = {
+        "gpt-4o-mini": 16384,
+        "gpt-4.1": 32768,
+        "gpt-4.1-mini": 32768,
+        "gpt-4.1-nano": 32768,
+        # "gpt-5-mini": 32768,
+        # "gpt-5-nano": 16384,
+    }
+
+    ZERO_COST = {
+        "input_cost": 0,
+        "cached_input_cost": 0,
+        "output_cost": 0,
+        "total_cost": 0
+    }
+
+    def __init__(self, api_key=None, url=None, cache: Optional[LLMCache] = None, use_cache=True,
+                 priority=INTERACTIVE):
+            # The client is shared by the whole process, so a handler per request costs no new connections
+            self.openai_client = get_openai_client(api_key, url)
+            self.cache = self._init_cache(cache, use_cache)
+            # Bot requests are INTERACTIVE, scheduler and batch jobs pass BACKGROUND
+            self.priority = priority
+            self.rate_limiter = get_rate_limiter()
             # self.GENERATIVE_MODEL = model
-            self.MAX_TOKENS_BY_MODEL = {
-                "gpt-4o-mini": 16384,
-                "gpt-4.1": 32768,
-                "gpt-4.1-mini": 32768,
-                "gpt-4.1-nano": 32768,
-                # "gpt-5-mini": 32768,
-                # "gpt-5-nano": 16384,
-            }
+
+    @staticmethod
+    def _init_cache(cache, use_cache):
+        if not use_cache:
+            return None
+        return cache if cache is not None else get_default_llm_cache()
 
     def calculate_cost(self, token_usage, model):
         # Define pricing for the models
@@ -183,84 +264,192 @@ class LLMHandler:
             "total_cost": total_cost
         }
 
+    def _build_completion_params(self, prompt, model, max_tokens, temperature, seed) -> dict:
+        completion_params = {
+            "model": model,
+            "messages": prompt,
+            "temperature": temperature,
+            "seed": seed,
+        }
+        if model in self.MAX_TOKENS_BY_MODEL:
+            max_tokens = min(max_tokens, self.MAX_TOKENS_BY_MODEL[model])
+        if model in ["gpt-4.1-mini", "gpt-4.1-nano", "gpt-4o-mini"]:
+            completion_params["max_tokens"] = max_tokens
+        else:
+            completion_params["max_completion_tokens"] = max_tokens
+        return completion_params
+
+    def _build_structured_answer(self, response, model, parsed=None, from_cache=False) -> dict:
+        token_usage = response.usage
+        cost = self.ZERO_COST.copy() if from_cache else self.calculate_cost(token_usage, model)
+        answer = {
+            'parsed': response.choices[0].message.parsed if parsed is None else parsed,
+            'usage': token_usage,
+            'cost': cost,
+            'model': model
+        }
+        if from_cache:
+            answer['from_cache'] = True
+        return answer
+
+    def _build_text_answer(self, response, model, from_cache=False) -> str:
+        answer = response.choices[0].message.content
+        token_usage = response.usage
+        cost = self.ZERO_COST.copy() if from_cache else self.calculate_cost(token_usage, model)
+        cached_tokens = getattr(getattr(token_usage, 'prompt_tokens_details', None), 'cached_tokens', 0)
+        token_info = (
+            f"\n\n## Token Usage and Cost:\n"
+            f" - Model Used: {model}\n"
+            f" - Completion Tokens: {token_usage.completion_tokens}\n"
+            f" - Prompt Tokens: {token_usage.prompt_tokens}\n"
+            f" - Cached Tokens: {cached_tokens}\n"
+            f" - Cost: ${cost['total_cost']:.6f}"
+        )
+        answer += token_info
+        return answer
+
+    def _cache_key(self, prompt, model, max_tokens, temperature, seed, response_format):
+        # Only deterministic requests are cached, sampled answers must stay fresh
+        if self.cache is None or temperature != 0:
+            return None
+        return make_cache_key(prompt, model, max_tokens, temperature, seed, response_format)
+
+    def _get_cached_answer(self, cache_key, model, response_format):
+        """
+        Returns the answer rebuilt from the cached completion, or None on a miss.
+        Pydantic 'parsed' objects are validated again from the stored message content.
+        """
+        if cache_key is None:
+            return None
+        stored = self.cache.get(cache_key)
+        if stored is None:
+            return None
+        try:
+            cached = json.loads(stored)
+            response = ChatCompletion.model_validate(cached["completion"])
+            if cached["kind"] == "structured":
+                parsed = response_format.model_validate_json(response.choices[0].message.content)
+                return self._build_structured_answer(response, model, parsed=parsed, from_cache=True)
+            return self._build_text_answer(response, model, from_cache=True)
+        except Exception as e:
+            # A stale entry (e.g. the response model changed) is treated as a miss and overwritten
+            logger.warning(f"Could not rebuild cached LLM answer: {e}")
+            return None
+
+    def _cache_response(self, cache_key, kind, response):
+        if cache_key is None:
+            return
+        try:
+            self.cache.set(cache_key, json.dumps({"kind": kind, "completion": response.model_dump(mode="json")}))
+        except Exception as e:
+            logger.warning(f"Could not cache LLM answer: {e}")
+
+    @staticmethod
+    def _estimate_tokens(completion_params) -> int:
+        max_tokens = completion_params.get("max_tokens", completion_params.get("max_completion_tokens", 0))
+        return estimate_prompt_tokens(completion_params["messages"]) + max_tokens
+
+    def _send(self, method, completion_params, call_site=None):
+        """
+        Sends one request through the process-wide rate limiter.
+        The latency of hedged calls (call_site set) is recorded without the time spent waiting for the permit.
+        """
+        permit = self.rate_limiter.acquire(completion_params["model"], self._estimate_tokens(completion_params),
+                                           self.priority)
+        response = None
+        try:
+            start_time = time.time()
+            response = method(**completion_params)
+            if call_site is not None:
+                latency_tracker.record(completion_params["model"], call_site, time.time() - start_time)
+            return response
+        finally:
+            self.rate_limiter.release(permit, getattr(response, "usage", None))
+
+    def cache_stats(self) -> dict:
+        """
+        Returns hit/miss counters of the response cache.
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    def _request(self, completion_params, model, response_format, cache_key, call_site=None):
+        """
+        Sends one request (structured or plain) and builds the answer from the response.
+        """
+        completion_params = dict(completion_params)
+        if response_format is not None:
+            try:
+                completion_params["response_format"] = response_format
+                response = self._send(self.openai_client.chat.completions.parse, completion_params, call_site)
+                self._cache_response(cache_key, "structured", response)
+                return self._build_structured_answer(response, model)
+            except AttributeError as e:
+                logger.warning(f"Structured outputs not available for {model}: {e}")
+                completion_params["response_format"] = {"type": "json_object"}
+        response = self._send(self.openai_client.chat.completions.create, completion_params, call_site)
+        self._cache_response(cache_key, "text", response)
+        return self._build_text_answer(response, model)
+
+    def _request_hedged(self, completion_params, model, response_format, cache_key, call_site):
+        """
+        Sends a duplicate request if the first one is slower than the p95 latency of the call site
+        and returns whichever answer comes first.
+        """
+        request_args = (completion_params, model, response_format, cache_key, call_site)
+        first = _hedge_executor.submit(self._request, *request_args)
+        done, _ = concurrent.futures.wait([first], timeout=latency_tracker.hedge_delay(model, call_site))
+        if done:
+            return first.result()
+        logger.info(f"Hedging slow {model} request")
+        second = _hedge_executor.submit(self._request, *request_args)
+        error = None
+        for future in concurrent.futures.as_completed([first, second]):
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+        raise error
+
     def get_answer(self, prompt: List[Dict[str, str]], model="gpt-4.1-nano",
-                   max_tokens=1000, temperature=0, seed=42, response_format=None):
+                   max_tokens=1000, temperature=0, seed=42, response_format=None, hedge=False):
         """
-        Enhanced get_answer method with optional structured output support and retry logic for APITimeoutError.
+        Enhanced get_answer method with optional structured output support and retry logic.
+        Rate limits, timeouts and 5xx errors are retried with jittered exponential backoff honouring Retry-After.
+        hedge="<call site name>" sends a duplicate request after the p95 latency of that call site on the model,
+        use it for small latency-critical calls.
         """
         max_retries = 4
-        retry_delay = 1  # seconds
 
+        cache_key = self._cache_key(prompt, model, max_tokens, temperature, seed, response_format)
+        cached_answer = self._get_cached_answer(cache_key, model, response_format)
+        if cached_answer is not None:
+            return cached_answer
+
+        completion_params = self._build_completion_params(prompt, model, max_tokens, temperature, seed)
         for attempt in range(max_retries):
-            # try:
-                completion_params = {
-                    "model": model,
-                    "messages": prompt,
-                    "temperature": temperature,
-                    "seed": seed,
-                }
-                if model in self.MAX_TOKENS_BY_MODEL:
-                    max_tokens = min(max_tokens, self.MAX_TOKENS_BY_MODEL[model])
-                if model in ["gpt-4.1-mini", "gpt-4.1-nano", "gpt-4o-mini"]:
-                    completion_params["max_tokens"] = max_tokens
-                else:
-                    completion_params["max_completion_tokens"] = max_tokens
-
-                if response_format is not None:
-                    try:
-                        completion_params["response_format"] = response_format
-                        response = self.openai_client.chat.completions.parse(**completion_params)
-                        token_usage = response.usage
-                        cost = self.calculate_cost(token_usage, model)
-                        return {
-                            'parsed': response.choices[0].message.parsed,
-                            'usage': token_usage,
-                            'cost': cost,
-                            'model': model
-                        }
-                    except AttributeError as e:
-                        logger.warning(f"Structured outputs not available for {model}: {e}")
-                        completion_params["response_format"] = {"type": "json_object"}
-                        response = self.openai_client.chat.completions.create(**completion_params)
-                        answer = response.choices[0].message.content
-                        token_usage = response.usage
-                        cost = self.calculate_cost(token_usage, model)
-                        cached_tokens = getattr(getattr(token_usage, 'prompt_tokens_details', None), 'cached_tokens', 0)
-                        token_info = (
-                            f"\n\n## Token Usage and Cost:\n"
-                            f" - Model Used: {model}\n"
-                            f" - Completion Tokens: {token_usage.completion_tokens}\n"
-                            f" - Prompt Tokens: {token_usage.prompt_tokens}\n"
-                            f" - Cached Tokens: {cached_tokens}\n"
-                            f" - Cost: ${cost['total_cost']:.6f}"
-                        )
-                        answer += token_info
-                        return answer
-                else:
-                    response = self.openai_client.chat.completions.create(**completion_params)
-                    answer = response.choices[0].message.content
-                    token_usage = response.usage
-                    cost = self.calculate_cost(token_usage, model)
-                    cached_tokens = getattr(getattr(token_usage, 'prompt_tokens_details', None), 'cached_tokens', 0)
-                    token_info = (
-                        f"\n\n## Token Usage and Cost:\n"
-                        f" - Model Used: {model}\n"
-                        f" - Completion Tokens: {token_usage.completion_tokens}\n"
-                        f" - Prompt Tokens: {token_usage.prompt_tokens}\n"
-                        f" - Cached Tokens: {cached_tokens}\n"
-                        f" - Cost: ${cost['total_cost']:.6f}"
-                    )
-                    answer += token_info
-                    return answer
-
-            # except Exception as e:
-            #     if isinstance(e, TimeoutError) or "timeout" in str(e).lower():
-            #         if attempt < max_retries - 1:
-            #             logger.warning(f"Timeout occurred, retrying... (attempt {attempt + 1}/{max_retries})")
-            #             time.sleep(retry_delay * (attempt + 1))
-            #             continue
-            #     logger.error(f"An error occurred while getting the answer from model {model}: {e}")
-            #     raise
+            try:
+                if hedge:
+                    return self._request_hedged(completion_params, model, response_format, cache_key, hedge)
+                return self._request(completion_params, model, response_format, cache_key)
+            except Exception as e:
+                if is_retryable_error(e) and attempt < max_retries - 1:
+                    retry_delay = get_retry_delay(e, attempt)
+                    logger.warning(f"{type(e).__name__} from model {model}, retrying in {retry_delay:.1f} sec "
+                                   f"(attempt {attempt + 1}/{max_retries})")
+                    time.sleep(retry_delay)
+                    continue
+                logger.error(f"An error occurred while getting the answer from model {model}: {e}")
+                raise
+
+    def get_structured(self, prompt: List[Dict[str, str]], response_format: Type[T], model="gpt-4.1-nano",
+                       max_tokens=1000, temperature=0, seed=42) -> dict:
+        """
+        Structured-output shortcut for get_answer.
+        Returns a dict with 'parsed' (instance of response_format), 'usage', 'cost' and 'model'.
+        """
+        if response_format is None:
+            raise ValueError("get_structured() requires a response_format model")
+        return self.get_answer(prompt, model=model, max_tokens=max_tokens, temperature=temperature,
+                               seed=seed, response_format=response_format)
 
     def _handle_structured_response(self, response, model):
         """Handle structured output response"""
@@ -322,3 +511,159 @@ class StructuredResponse:
             f" - Cost: ${self.cost['total_cost']:.6f}"
         )
 
+
+class AsyncLLMHandler(LLMHandler):
+    """
+    Awaitable counterpart of LLMHandler.
+    get_answer/get_structured keep the LLMHandler request and response contract, but run on the
+    pooled AsyncOpenAI client of the current event loop, so many calls can be awaited at once
+    without blocking the loop.
+    """
+
+    def __init__(self, api_key=None, url=None, cache: Optional[LLMCache] = None, use_cache=True,
+                 priority=INTERACTIVE):
+        self.api_key = api_key
+        self.url = url
+        self.cache = self._init_cache(cache, use_cache)
+        self.priority = priority
+        self.rate_limiter = get_rate_limiter()
+
+    @property
+    def openai_client(self) -> AsyncOpenAI:
+        return get_async_openai_client(self.api_key, self.url)
+
+    async def _send(self, method, completion_params, call_site=None):
+        permit = await self.rate_limiter.acquire_async(completion_params["model"],
+                                                       self._estimate_tokens(completion_params), self.priority)
+        response = None
+        try:
+            start_time = time.time()
+            response = await method(**completion_params)
+            if call_site is not None:
+                latency_tracker.record(completion_params["model"], call_site, time.time() - start_time)
+            return response
+        except asyncio.CancelledError:
+            if call_site is not None:
+                # A cancelled hedge loser ran at least this long, its time is kept as a lower bound
+                # so the slow requests that trigger hedging stay in the p95
+                latency_tracker.record(completion_params["model"], call_site, time.time() - start_time)
+            raise
+        finally:
+            self.rate_limiter.release(permit, getattr(response, "usage", None))
+
+    async def _request(self, completion_params, model, response_format, cache_key, call_site=None):
+        completion_params = dict(completion_params)
+        if response_format is not None:
+            try:
+                completion_params["response_format"] = response_format
+                response = await self._send(self.openai_client.chat.completions.parse, completion_params, call_site)
+                self._cache_response(cache_key, "structured", response)
+                return self._build_structured_answer(response, model)
+            except AttributeError as e:
+                logger.warning(f"Structured outputs not available for {model}: {e}")
+                completion_params["response_format"] = {"type": "json_object"}
+        response = await self._send(self.openai_client.chat.completions.create, completion_params, call_site)
+        self._cache_response(cache_key, "text", response)
+        return self._build_text_answer(response, model)
+
+    async def _request_hedged(self, completion_params, model, response_format, cache_key, call_site):
+        request_args = (completion_params, model, response_format, cache_key, call_site)
+        first = asyncio.ensure_future(self._request(*request_args))
+        try:
+            return await asyncio.wait_for(asyncio.shield(first), latency_tracker.hedge_delay(model, call_site))
+        except asyncio.TimeoutError:
+            logger.info(f"Hedging slow {model} request")
+        pending = {first, asyncio.ensure_future(self._request(*request_args))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The loser is cancelled, _send records its elapsed time and releases its rate limiter permit
+            for task in pending:
+                task.cancel()
+
+    async def get_answer(self, prompt: List[Dict[str, str]], model="gpt-4.1-nano",
+                         max_tokens=1000, temperature=0, seed=42, response_format=None, hedge=False):
+        max_retries = 4
+
+        # A cache lookup is a local SQLite read, cheap enough to run on the loop
+        cache_key = self._cache_key(prompt, model, max_tokens, temperature, seed, response_format)
+        cached_answer = self._get_cached_answer(cache_key, model, response_format)
+        if cached_answer is not None:
+            return cached_answer
+
+        completion_params = self._build_completion_params(prompt, model, max_tokens, temperature, seed)
+        for attempt in range(max_retries):
+            try:
+                if hedge:
+                    return await self._request_hedged(completion_params, model, response_format, cache_key, hedge)
+                return await self._request(completion_params, model, response_format, cache_key)
+            except Exception as e:
+                if is_retryable_error(e) and attempt < max_retries - 1:
+                    retry_delay = get_retry_delay(e, attempt)
+                    logger.warning(f"{type(e).__name__} from model {model}, retrying in {retry_delay:.1f} sec "
+                                   f"(attempt {attempt + 1}/{max_retries})")
+                    await asyncio.sleep(retry_delay)
+                    continue
+                logger.error(f"An error occurred while getting the answer from model {model}: {e}")
+                raise
+
+    async def get_structured(self, prompt: List[Dict[str, str]], response_format: Type[T], model="gpt-4.1-nano",
+                             max_tokens=1000, temperature=0, seed=42) -> dict:
+        if response_format is None:
+            raise ValueError("get_structured() requires a response_format model")
+        return await self.get_answer(prompt, model=model, max_tokens=max_tokens, temperature=temperature,
+                                     seed=seed, response_format=response_format)
+
+    def as_sync(self) -> "SyncLLMBridge":
+        """
+        Returns a blocking handler for the sync extractors, bound to the running event loop.
+        Must be called from a coroutine; the returned handler must be used from worker threads.
+        """
+        return SyncLLMBridge(self, asyncio.get_running_loop())
+
+
+class SyncLLMBridge(LLMHandler):
+    """
+    LLMHandler-compatible facade over an AsyncLLMHandler.
+    The sync extractors run in worker threads (asyncio.to_thread) and their get_answer calls are
+    scheduled on the owner event loop, so all requests go through its pooled async client.
+    """
+
+    def __init__(self, async_handler: AsyncLLMHandler, loop: asyncio.AbstractEventLoop):
+        self.async_handler = async_handler
+        self.loop = loop
+        self.cache = async_handler.cache
+        self.priority = async_handler.priority
+
+    def get_answer(self, prompt: List[Dict[str, str]], model="gpt-4.1-nano",
+                   max_tokens=1000, temperature=0, seed=42, response_format=None, hedge=False):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self.loop:
+            raise RuntimeError("SyncLLMBridge.get_answer() would block its own event loop, "
+                               "await AsyncLLMHandler.get_answer() instead")
+        future = asyncio.run_coroutine_threadsafe(
+            self.async_handler.get_answer(prompt, model=model, max_tokens=max_tokens, temperature=temperature,
+                                          seed=seed, response_format=response_format, hedge=hedge),
+            self.loop
+        )
+        return future.result()
+
+
+def get_sync_handler(llm_handler: LLMHandler) -> LLMHandler:
+    """
+    Returns a handler with a blocking get_answer for code that runs in worker threads.
+    AsyncLLMHandler is wrapped into a SyncLLMBridge (call from a coroutine), other handlers are returned as is.
+    """
+    if isinstance(llm_handler, AsyncLLMHandler):
+        return llm_handler.as_sync()
+    return llm_handler
@@ -0,0 +1,89 @@
+import random
+import threading
+from collections import deque
+from typing import Optional
+
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+
+RETRY_BASE_DELAY = 1.0  # seconds
+RETRY_MAX_DELAY = 30.0  # seconds
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+HEDGE_DEFAULT_DELAY = 2.0  # seconds, used until enough latencies are recorded for the call site
+HEDGE_MIN_SAMPLES = 20
+HEDGE_PERCENTILE = 0.95
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Rate limits, timeouts, connection errors and 5xx responses are worth another attempt.
+    """
+    if isinstance(error, (APITimeoutError, APIConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return "timeout" in str(error).lower()
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Returns the delay requested by the server in the retry-after-ms / retry-after headers, in seconds.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date values are not used by OpenAI, fall back to the exponential delay
+        return None
+    return None
+
+
+def get_retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Exponential backoff with full jitter; a Retry-After from the server is a lower bound.
+    """
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    retry_after = get_retry_after(error)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, RETRY_MAX_DELAY))
+    return delay
+
+
+class LatencyTracker:
+    """
+    Keeps recent request latencies per model and call site to derive the hedging delay.
+    Only hedged calls are recorded, from the moment the rate limiter gave a permit: large extractors
+    on the same model and the time spent in the limiter queue do not affect the delay of short calls.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._latencies = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, call_site: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault((model, call_site), deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, call_site: str, percentile: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies.get((model, call_site), ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(percentile * len(latencies)))]
+
+    def hedge_delay(self, model: str, call_site: str) -> float:
+        """
+        Delay after which a duplicate request is sent: the p95 latency of the call site on the model.
+        """
+        p95 = self.percentile(model, call_site, HEDGE_PERCENTILE)
+        return p95 if p95 is not None else HEDGE_DEFAULT_DELAY
+
+
+latency_tracker = LatencyTracker()
@@ -0,0 +1,234 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Requests and tokens per minute, keep them a bit below the limits of the OpenAI organization
+DEFAULT_MODEL_LIMITS = {
+    "gpt-4.1": {"rpm": 4500, "tpm": 800_000},
+    "gpt-4.1-mini": {"rpm": 4500, "tpm": 1_800_000},
+    "gpt-4.1-nano": {"rpm": 4500, "tpm": 1_800_000},
+    "gpt-4o-mini": {"rpm": 4500, "tpm": 1_800_000},
+}
+FALLBACK_MODEL_LIMITS = {"rpm": 450, "tpm": 180_000}
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", 32))
+# When both queues are waiting, every N-th free slot goes to a background caller so it is never starved
+BACKGROUND_SHARE = int(os.getenv("LLM_BACKGROUND_SHARE", 4))
+ASYNC_POLL_INTERVAL = 0.05  # seconds
+
+
+def estimate_prompt_tokens(prompt: List[Dict[str, str]]) -> int:
+    """
+    Rough token estimate of a chat prompt (about 4 characters per token), good enough for rate limiting.
+    """
+    return len(json.dumps(prompt, ensure_ascii=False)) // 4 + 4 * len(prompt)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously up to its one-minute capacity.
+    Not thread-safe by itself, the limiter calls it under its own lock.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until amount is available, 0 if it can be taken now.
+        Requests bigger than the capacity only wait for a full bucket.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def adjust(self, amount: float):
+        """Returns (positive) or takes (negative) tokens after the real usage is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMPermit:
+    def __init__(self, model: str, estimated_tokens: int, priority: str):
+        self.model = model
+        self.estimated_tokens = estimated_tokens
+        self.priority = priority
+        self.granted_at = time.monotonic()
+
+
+class LLMRateLimiter:
+    """
+    Process-wide governor for OpenAI requests.
+    Every request takes a slot of the bounded in-flight semaphore plus one request and the estimated tokens
+    from the buckets of its model; the estimate is reconciled with response.usage on release.
+    Waiting callers are served in FIFO order per priority and model, interactive (bot) callers first, with a share
+    of slots reserved for background (scheduler/batch) callers. A caller waits only behind earlier callers
+    of its own model: a model whose buckets are empty does not hold back the other models or the other priority.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, model_limits: Optional[dict] = None,
+                 background_share: int = BACKGROUND_SHARE):
+        self.max_in_flight = max_in_flight
+        self.model_limits = model_limits or DEFAULT_MODEL_LIMITS
+        self.background_share = background_share
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._queues = {INTERACTIVE: {}, BACKGROUND: {}}  # priority -> model -> deque of tickets
+        self._sequence = itertools.count()
+        self._grants_since_background = 0
+        self._request_buckets = {}
+        self._token_buckets = {}
+
+    def _buckets(self, model: str):
+        if model not in self._request_buckets:
+            base_model = next((key for key in sorted(self.model_limits, key=len, reverse=True)
+                               if model.startswith(key)), None)
+            limits = self.model_limits.get(base_model, FALLBACK_MODEL_LIMITS)
+            self._request_buckets[model] = TokenBucket(limits["rpm"])
+            self._token_buckets[model] = TokenBucket(limits["tpm"])
+        return self._request_buckets[model], self._token_buckets[model]
+
+    def _priority_order(self) -> List[str]:
+        if self._queues[INTERACTIVE] and self._queues[BACKGROUND] \
+                and self._grants_since_background >= self.background_share - 1:
+            return [BACKGROUND, INTERACTIVE]
+        return [INTERACTIVE, BACKGROUND]
+
+    def _bucket_wait(self, model: str, estimated_tokens: int) -> float:
+        request_bucket, token_bucket = self._buckets(model)
+        return max(request_bucket.wait_time(1), token_bucket.wait_time(estimated_tokens))
+
+    def _try_grant(self, ticket, model: str, estimated_tokens: int, priority: str):
+        """
+        Grants the permit if ticket is the first waiter of its model that can be served now: the heads of
+        the (priority, model) queues are tried in priority order, then in arrival order, and a head whose
+        buckets are empty is skipped.
+        Returns (permit, None) or (None, seconds to wait, None to wait for a release). Call under the lock.
+        """
+        if self.in_flight >= self.max_in_flight:
+            return None, None
+        own_wait = None
+        for queue_priority in self._priority_order():
+            heads = sorted(waiters[0] for waiters in self._queues[queue_priority].values())
+            for head in heads:
+                timeout = self._bucket_wait(head[1], head[2])
+                if head is ticket:
+                    own_wait = timeout
+                if timeout == 0:
+                    if head is not ticket:
+                        # A caller of higher priority or an earlier one is served first
+                        return None, None
+                    return self._grant(model, estimated_tokens, priority), None
+        return None, own_wait
+
+    def _grant(self, model: str, estimated_tokens: int, priority: str) -> LLMPermit:
+        request_bucket, token_bucket = self._buckets(model)
+        request_bucket.consume(1)
+        token_bucket.consume(estimated_tokens)
+        self.in_flight += 1
+        if priority == BACKGROUND:
+            self._grants_since_background = 0
+        else:
+            self._grants_since_background += 1
+        return LLMPermit(model, estimated_tokens, priority)
+
+    def _enqueue(self, model: str, estimated_tokens: int, priority: str):
+        ticket = (next(self._sequence), model, estimated_tokens)
+        self._queues[priority].setdefault(model, deque()).append(ticket)
+        return ticket
+
+    def _dequeue(self, ticket, priority: str):
+        waiters = self._queues[priority][ticket[1]]
+        waiters.remove(ticket)
+        if not waiters:
+            del self._queues[priority][ticket[1]]
+        self._condition.notify_all()
+
+    def acquire(self, model: str, estimated_tokens: int, priority: str = INTERACTIVE) -> LLMPermit:
+        """
+        Blocks until the request may be sent. Call release() with the permit when the response is received.
+        """
+        priority = priority if priority in self._queues else INTERACTIVE
+        with self._condition:
+            ticket = self._enqueue(model, estimated_tokens, priority)
+            try:
+                while True:
+                    permit, timeout = self._try_grant(ticket, model, estimated_tokens, priority)
+                    if permit is not None:
+                        return permit
+                    self._condition.wait(timeout)
+            finally:
+                self._dequeue(ticket, priority)
+
+    async def acquire_async(self, model: str, estimated_tokens: int, priority: str = INTERACTIVE) -> LLMPermit:
+        """
+        Awaitable acquire. The wait is a short sleep on the event loop rather than a worker thread:
+        worker threads may all be busy with sync code that is itself waiting for this loop.
+        """
+        priority = priority if priority in self._queues else INTERACTIVE
+        with self._condition:
+            ticket = self._enqueue(model, estimated_tokens, priority)
+        try:
+            while True:
+                with self._condition:
+                    permit, timeout = self._try_grant(ticket, model, estimated_tokens, priority)
+                if permit is not None:
+                    return permit
+                await asyncio.sleep(min(timeout or ASYNC_POLL_INTERVAL, ASYNC_POLL_INTERVAL))
+        finally:
+            with self._condition:
+                self._dequeue(ticket, priority)
+
+    def release(self, permit: LLMPermit, usage=None):
+        """
+        Frees the in-flight slot and corrects the token bucket with the real usage of the request.
+        Failed requests (usage is None) keep their estimate, since OpenAI counts them too.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            total_tokens = getattr(usage, "total_tokens", None)
+            if total_tokens is not None:
+                _, token_bucket = self._buckets(permit.model)
+                token_bucket.adjust(permit.estimated_tokens - total_tokens)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "in_flight": self.in_flight,
+                "waiting_interactive": sum(map(len, self._queues[INTERACTIVE].values())),
+                "waiting_background": sum(map(len, self._queues[BACKGROUND].values())),
+            }
+
+
+_rate_limiter = LLMRateLimiter()
+
+
+def get_rate_limiter() -> LLMRateLimiter:
+    return _rate_limiter
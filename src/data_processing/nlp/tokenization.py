@@ -1,4 +1,6 @@
 import re
+from functools import lru_cache
+
 from nltk import word_tokenize
 from nltk.data import path as nltk_path
 nltk_path.append("src/data_processing/nlp/nltk_data")
@@ -12,3 +14,25 @@ def get_tokens(text):
 def create_tokens_set(list_of_strings :list):
     concated_string = " ".join(list_of_strings)
     return get_tokens(concated_string)
+
+
+@lru_cache(maxsize=None)
+def _get_tiktoken_encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_llm_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """
+    Number of LLM tokens in text, by tiktoken if it is installed, otherwise about 4 characters per token.
+    """
+    encoding = _get_tiktoken_encoding(model)
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
@@ -6,7 +6,7 @@ from telegram import Update
 
 from src.bot.utils import send_answer_message
 from src.data_processing.nlp.jaccard_similarity import find_most_similar_row
-from src.google_services.sheets import read_specific_columns
+from src.google_services.candidates_snapshot import candidates_snapshot
 
 import pandas as pd
 
@@ -119,7 +119,7 @@ async def process_names(update,  names_list, user_name, llm_handler=None):
         'Entry wage rate (EWR)', 'Sell rate', 'NDA'
     ]
     # Get specific columns with hyperlinks
-    df = read_specific_columns(columns_to_extract)
+    df = candidates_snapshot.get_df(columns_to_extract)
     df["Full Name"] = df["First Name"]+' '+ df["Last Name"]
     for name in names_list:
         name_df = search_candidate_by_name(df, name)
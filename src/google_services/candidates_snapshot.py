@@ -0,0 +1,202 @@
+import hashlib
+import os
+import threading
+import time
+from typing import List, Optional
+
+import pandas as pd
+from dotenv import load_dotenv
+from google.oauth2 import service_account
+
+from src.google_services.service_registry import google_services
+from src.google_services.sheets import read_specific_columns, CANDIDATES_SHEET_NAME, SERVICE_ACCOUNT_JSON_PATH
+from src.logger import logger
+
+load_dotenv()
+
+# Seconds between the checks of the spreadsheet modifiedTime
+CANDIDATES_SNAPSHOT_CHECK_INTERVAL = int(os.getenv("CANDIDATES_SNAPSHOT_CHECK_INTERVAL", 30))
+# A snapshot older than this is reloaded even if modifiedTime is not available or did not change
+CANDIDATES_SNAPSHOT_MAX_AGE = int(os.getenv("CANDIDATES_SNAPSHOT_MAX_AGE", 10 * 60))
+
+# All candidate columns used by vacancy search, name search and the nightly jobs
+CANDIDATES_SNAPSHOT_COLUMNS = [
+    'First Name', 'Last Name', 'LVL of engagement', 'Available From',
+    'Seniority', 'Main Roles', 'Additional Roles',
+    'From', 'LinkedIn', 'Telegram', 'Phone', 'Email', 'WhatsApp',
+    'Stack', 'Industries', 'Expertise', 'Languages',
+    'Work hrs/mnth', 'Location', 'CV (original)', 'CV White Label',
+    'Entry wage rate (EWR)', 'Sell rate', 'NDA'
+]
+
+
+def _load_drive_metadata_credentials():
+    return service_account.Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_JSON_PATH,
+        scopes=['https://www.googleapis.com/auth/drive.metadata.readonly']
+    )
+
+
+class CandidatesSnapshot:
+    """
+    Immutable view of the candidates sheet at one moment.
+    df is shared between all readers and must not be modified, use get_df() to get a private copy.
+    """
+
+    def __init__(self, df: pd.DataFrame, version: int, modified_time: Optional[str], content_hash: str = None):
+        self.df = df
+        self.version = version
+        self.modified_time = modified_time
+        self.content_hash = content_hash
+        self.loaded_at = time.time()
+
+    def get_df(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        if columns is None:
+            return self.df.copy()
+        return self.df[list(columns) + ['Row in Spreadsheets']].copy()
+
+    def __len__(self):
+        return len(self.df)
+
+
+def dataframe_hash(df: pd.DataFrame) -> str:
+    """
+    Hash of the columns and cells of df, equal for two reads of an unchanged sheet.
+    """
+    row_hashes = pd.util.hash_pandas_object(df.astype(str), index=True).values
+    return hashlib.sha1("\t".join(map(str, df.columns)).encode("utf-8") + row_hashes.tobytes()).hexdigest()
+
+
+class CandidatesSnapshotService:
+    """
+    Keeps the parsed candidates sheet in memory.
+    The first reader loads it synchronously; afterwards a daemon thread polls the spreadsheet modifiedTime
+    (Drive API, metadata only) and reloads the sheet when it changes or the snapshot is too old.
+    A reload builds a new snapshot and swaps the reference, so readers never see a half-updated DataFrame.
+    The version goes up and the load listeners are called only when the loaded candidates differ.
+    """
+
+    def __init__(self, sheet_name=CANDIDATES_SHEET_NAME, columns=None, spreadsheet_env_name='STAFF_SPREADSHEET_ID'):
+        self.sheet_name = sheet_name
+        self.columns = columns or CANDIDATES_SNAPSHOT_COLUMNS
+        self.spreadsheet_env_name = spreadsheet_env_name
+        self._snapshot: Optional[CandidatesSnapshot] = None
+        self._version = 0
+        self._load_lock = threading.Lock()
+        self._refresh_thread = None
+        self._modified_time_available = True
+        self._load_listeners = []
+
+    def _get_modified_time(self) -> Optional[str]:
+        """
+        Returns modifiedTime of the spreadsheet, or None if the service account cannot read Drive metadata.
+        """
+        if not self._modified_time_available:
+            return None
+        try:
+            drive_service = google_services.get_service('drive_metadata', 'drive', 'v3',
+                                                        _load_drive_metadata_credentials)
+            file = drive_service.files().get(
+                fileId=os.getenv(self.spreadsheet_env_name),
+                fields='modifiedTime',
+                supportsAllDrives=True
+            ).execute()
+            return file.get('modifiedTime')
+        except Exception as e:
+            # Without Drive metadata access the snapshot is refreshed by age only
+            logger.warning(f"Cannot read modifiedTime of the candidates spreadsheet, refreshing by age only: {e}")
+            self._modified_time_available = False
+            return None
+
+    def _load(self, modified_time: Optional[str] = None) -> CandidatesSnapshot:
+        start_time = time.time()
+        if modified_time is None:
+            modified_time = self._get_modified_time()
+        df = read_specific_columns(self.columns, self.sheet_name, spreadsheet_env_name=self.spreadsheet_env_name)
+        content_hash = dataframe_hash(df)
+        previous = self._snapshot
+        if previous is not None and previous.content_hash == content_hash:
+            # The bot's own log and cache rows change modifiedTime of the spreadsheet, not the candidates:
+            # the version and everything derived from it stay valid
+            self._snapshot = CandidatesSnapshot(previous.df, previous.version, modified_time, content_hash)
+            logger.info(f"Candidates snapshot v{previous.version}: sheet unchanged, reloaded "
+                        f"in {time.time() - start_time:.1f} sec")
+            return self._snapshot
+        self._version += 1
+        snapshot = CandidatesSnapshot(df, self._version, modified_time, content_hash)
+        self._snapshot = snapshot
+        logger.info(f"Candidates snapshot v{snapshot.version}: {len(df)} rows loaded "
+                    f"in {time.time() - start_time:.1f} sec")
+        for callback in self._load_listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logger.error(f"Candidates snapshot load listener failed: {e}")
+        return snapshot
+
+    def add_load_listener(self, callback):
+        """
+        Registers a callback called with every newly loaded snapshot, e.g. to precompute data derived from it.
+        """
+        self._load_listeners.append(callback)
+
+    def _is_stale(self, snapshot: CandidatesSnapshot) -> bool:
+        return time.time() - snapshot.loaded_at > CANDIDATES_SNAPSHOT_MAX_AGE
+
+    def get_snapshot(self) -> CandidatesSnapshot:
+        """
+        Returns the current snapshot, loading it if there is none yet or it is older than the max age.
+        """
+        snapshot = self._snapshot
+        if snapshot is None or self._is_stale(snapshot):
+            with self._load_lock:
+                # Another thread may have loaded it while we were waiting for the lock
+                snapshot = self._snapshot
+                if snapshot is None or self._is_stale(snapshot):
+                    snapshot = self._load()
+        self._start_refresh_thread()
+        return snapshot
+
+    def get_df(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return self.get_snapshot().get_df(columns)
+
+    def refresh(self, force=False) -> CandidatesSnapshot:
+        """
+        Reloads the sheet if its modifiedTime changed, the snapshot is too old or force is True.
+        """
+        with self._load_lock:
+            snapshot = self._snapshot
+            if snapshot is None or force or self._is_stale(snapshot):
+                return self._load()
+            modified_time = self._get_modified_time()
+            if modified_time is not None and modified_time != snapshot.modified_time:
+                return self._load(modified_time)
+            return snapshot
+
+    def invalidate(self):
+        """
+        Marks the snapshot as outdated after this process wrote to the sheet, the next reader reloads it.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            snapshot.loaded_at = 0
+
+    def _start_refresh_thread(self):
+        if self._refresh_thread is not None:
+            return
+        with self._load_lock:
+            if self._refresh_thread is None:
+                self._refresh_thread = threading.Thread(target=self._refresh_loop, name="candidates-snapshot",
+                                                        daemon=True)
+                self._refresh_thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(CANDIDATES_SNAPSHOT_CHECK_INTERVAL)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Candidates snapshot refresh failed: {e}")
+
+
+candidates_snapshot = CandidatesSnapshotService()
@@ -6,23 +6,23 @@ import re
 
 from docx import Document
 from googleapiclient.errors import HttpError
-from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 
 from src.google_services.drive_authorization import load_credentials
+from src.google_services.service_registry import google_services
 from src.logger import logger
 
 
-
-from googleapiclient.discovery import build
-
-
-def initialize_google_drive_api():
-    """Initializes Google Drive API service with OAuth."""
+def _load_drive_credentials():
     creds = load_credentials()
     if not creds or not creds.valid:
         raise ConnectionError("Please contact @AndrusKr to authorize disk")
-    return build('drive', 'v3', credentials=creds)
+    return creds
+
+
+def initialize_google_drive_api():
+    """Returns Google Drive API service with OAuth, it is built only once per thread."""
+    return google_services.get_service('drive_oauth', 'drive', 'v3', _load_drive_credentials)
 
 
 def extract_text_from_docx(file_path):
@@ -150,6 +150,40 @@ def _extract_doc_id(url: str) -> str:
         raise ValueError("Could not extract document ID from URL. Invalid URL format.")
     return doc_id_match.group(1)
 
+def extract_folder_id(url: str) -> str:
+    """Extract folder ID from Google Drive folder URL."""
+    folder_id_match = re.search(r'/folders/([a-zA-Z0-9_-]+)', url)
+    if not folder_id_match:
+        raise ValueError("Could not extract folder ID from URL. Invalid URL format.")
+    return folder_id_match.group(1)
+
+def list_files_in_folder(folder_id: str, mime_types=None, service=None) -> list:
+    """
+    Lists the files of a Google Drive folder (not recursive), optionally only the given MIME types.
+    Returns a list of dicts with 'id', 'name' and 'mimeType'.
+    """
+    if service is None:
+        service = initialize_google_drive_api()
+    query = f"'{folder_id}' in parents and trashed=false"
+    if mime_types:
+        query += " and (" + " or ".join(f"mimeType='{mime_type}'" for mime_type in mime_types) + ")"
+    files = []
+    page_token = None
+    while True:
+        response = service.files().list(
+            q=query,
+            corpora='allDrives',
+            includeItemsFromAllDrives=True,
+            supportsAllDrives=True,
+            fields='nextPageToken, files(id, name, mimeType)',
+            pageSize=1000,
+            pageToken=page_token
+        ).execute()
+        files.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return files
+
 def _extract_pdf_content(doc_id: str, service) -> str:
     """Extract text from PDF file."""
     request = service.files().get_media(fileId=doc_id)
@@ -158,7 +192,7 @@ def _extract_pdf_content(doc_id: str, service) -> str:
 
 def _extract_google_doc_with_links(doc_id: str, drive_service) -> str:
     """Extract text and tables from Google Doc with hyperlinks as separate paragraphs."""
-    docs_service = build('docs', 'v1', credentials=drive_service._http.credentials)
+    docs_service = google_services.get_service('drive_oauth', 'docs', 'v1', _load_drive_credentials)
     document = docs_service.documents().get(documentId=doc_id).execute()
     paragraphs = []
     doc_content = document.get('body', {}).get('content', [])
@@ -9,6 +9,7 @@ from telegram.ext import ContextTypes
 load_dotenv()
 
 from src.logger import logger
+from src.google_services.service_registry import google_services
 
 TOKEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'configs', os.getenv('GOOGLE_OAUTH_CURRENT_TOKEN_FILE'))
 SCOPES = ['https://www.googleapis.com/auth/drive']
@@ -80,6 +81,8 @@ async def handle_oauth_callback(update: Update, context: ContextTypes.DEFAULT_TY
         creds = flow.credentials
         # Save the token
         save_credentials(creds)
+        # Services built with the previous token are rebuilt on next use
+        google_services.invalidate('drive_oauth')
         # Remove the flow object from the context
         del context.user_data['oauth_flow']
         await update.message.reply_text("✅ Google Drive authorization was successful! Now you can upload files.")
@@ -0,0 +1,62 @@
+import threading
+from typing import Callable
+
+from googleapiclient.discovery import build
+
+from src.logger import logger
+
+
+class GoogleServiceRegistry:
+    """
+    Builds each Google API service once and reuses it.
+    Credentials are shared by the whole process; service objects are kept per thread because
+    their httplib2 transport is not thread-safe. Discovery documents are loaded from the copies
+    bundled with google-api-python-client (static_discovery), not fetched over the network.
+    """
+
+    def __init__(self):
+        self._credentials = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _get_credentials(self, name: str, credentials_factory: Callable):
+        with self._lock:
+            credentials = self._credentials.get(name)
+            # Expired credentials without a refresh token cannot renew themselves, ask the factory again
+            if credentials is None or (getattr(credentials, 'expired', False)
+                                       and not getattr(credentials, 'refresh_token', None)
+                                       and not hasattr(credentials, 'service_account_email')):
+                credentials = credentials_factory()
+                self._credentials[name] = credentials
+            return credentials
+
+    def get_service(self, name: str, api: str, version: str, credentials_factory: Callable):
+        """
+        Returns the service of the current thread for the given credentials name, building it on first use.
+        Args:
+            name (str): Key of the credentials, e.g. 'sheets' or 'drive_oauth'.
+            api (str), version (str): API name and version for googleapiclient.discovery.build.
+            credentials_factory (Callable): Creates the credentials when they are not cached yet.
+        """
+        credentials = self._get_credentials(name, credentials_factory)
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = {}
+        key = (name, api, version)
+        cached = services.get(key)
+        if cached is None or cached[0] is not credentials:
+            service = build(api, version, credentials=credentials, cache_discovery=False, static_discovery=True)
+            services[key] = (credentials, service)
+            logger.info(f"Built Google {api} {version} service ({name}) for thread {threading.current_thread().name}")
+            return service
+        return cached[1]
+
+    def invalidate(self, name: str):
+        """
+        Drops cached credentials (e.g. after a new OAuth authorization); services are rebuilt on next use.
+        """
+        with self._lock:
+            self._credentials.pop(name, None)
+
+
+google_services = GoogleServiceRegistry()
@@ -1,7 +1,11 @@
+import json
 import re
+import threading
+import time
+
 import pandas as pd
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from src.google_services.service_registry import google_services
 # from google_auth_oauthlib.flow import InstalledAppFlow
 # from google.auth.transport.requests import Request
 
@@ -30,6 +34,10 @@ sheets_columns_dict = {
     }
 }
 
+# sheetId (gid) by (spreadsheet env name, sheet name), sheets are not renamed while the bot runs
+sheet_ids_cache = {}
+
+
 def get_sheet_dict(sheet_name, sheet=None, spreadsheet_env_name='STAFF_SPREADSHEET_ID'):
     """
     Returns a dictionary mapping column names to their letter designations for the specified sheet.
@@ -95,15 +103,18 @@ def get_column_letters(columns, sheet_name, ignore_missing=False, sheet=None, sp
 
 
 # Authenticate with credentials.json
-def initialize_google_sheets_api():
-    """
-    Initializes and returns the Google Sheets API service.
-    """
-    credentials = service_account.Credentials.from_service_account_file(
+def _load_sheets_credentials():
+    return service_account.Credentials.from_service_account_file(
                 SERVICE_ACCOUNT_JSON_PATH,
                 scopes=['https://www.googleapis.com/auth/spreadsheets']
                 )
-    return build('sheets', 'v4', credentials=credentials)
+
+
+def initialize_google_sheets_api():
+    """
+    Returns the Google Sheets API service of the current thread, it is built only once per thread.
+    """
+    return google_services.get_service('sheets', 'sheets', 'v4', _load_sheets_credentials)
 
 def remove_extra_spaces_from_headers(service=None, spreadsheet_env_name='STAFF_SPREADSHEET_ID'):
     # Initialize Google Sheets API if service is not provided
@@ -155,10 +166,31 @@ def remove_invisible_chars(text, remove_emonji=False):
     visible_text = re.sub(pattern, '', text)
     return visible_text.strip()
 
-def read_specific_columns(columns_to_extract, sheet_name=CANDIDATES_SHEET_NAME, service=None, remove_emonji=False, spreadsheet_env_name='STAFF_SPREADSHEET_ID'):
+# Columns known to hold plain text, they are read as values. Any other column may contain hyperlinks
+# (rich links or =HYPERLINK) and is read with the grid data field mask, so its link URLs are kept.
+PLAIN_COLUMNS = {
+    'First Name', 'Last Name', 'LVL of engagement', 'Available From', 'Seniority', 'Main Roles', 'Additional Roles',
+    'Stack', 'Industries', 'Expertise', 'Languages', 'Work hrs/mnth', 'Location',
+    'Entry wage rate (EWR)', 'Sell rate',
+    'Header', 'Summary', 'Skills', 'Experience', 'Education', 'Projects', 'Original CV text',
+    'Role Values', 'Industries Values', 'IT Domains Values',
+    'Date', 'vacancy description', 'step1 num number of initial candidates',
+}
+
+
+def _prepare_cell_text(cell_text, remove_emonji=False):
+    cell_text = cell_text.strip()
+    return remove_invisible_chars(cell_text, remove_emonji)
+
+
+def read_specific_columns(columns_to_extract, sheet_name=CANDIDATES_SHEET_NAME, service=None, remove_emonji=False,
+                          spreadsheet_env_name='STAFF_SPREADSHEET_ID', plain_columns=None):
     """
     Fetches specific columns from the Google Sheet, handling hyperlinks.
-    Creates missing columns and fills them with empty strings.
+    Columns known to be plain (PLAIN_COLUMNS by default, or the plain_columns argument) are read with one
+    values.batchGet, all other columns with one spreadsheets.get limited to their ranges and to the
+    hyperlink/formattedValue fields, so their cells with a hyperlink give the URL.
+    The result is assembled column-wise and stops at the first row that is empty in all requested columns.
     Returns a DataFrame.
     """
 
@@ -171,57 +203,92 @@ def read_specific_columns(columns_to_extract, sheet_name=CANDIDATES_SHEET_NAME,
     sheet = service.spreadsheets()
     # Convert column names to letters
     columns_dict = get_column_letters(columns_to_extract, sheet_name, sheet=sheet, spreadsheet_env_name=spreadsheet_env_name)
+    known_plain = PLAIN_COLUMNS if plain_columns is None else set(plain_columns)
+    link_columns = [column for column in columns_dict if column not in known_plain]
+    plain_columns = [column for column in columns_dict if column in known_plain]
 
-    # Get the full sheet data with includeGridData
-    spreadsheet = sheet.get(spreadsheetId=spreadsheet_id, ranges=[sheet_name], includeGridData=True).execute()
-    sheet_data = spreadsheet['sheets'][0]['data'][0]
+    def column_range(column_name):
+        column_letter = columns_dict[column_name]
+        return f"{sheet_name}!{column_letter}:{column_letter}"
 
-    # Extract headers from the sheet
-    headers_row = sheet_data.get('rowData', [{}])[0].get('values', [])
-    headers = [cell.get('formattedValue', '').strip() for cell in headers_row]
+    columns_values = {}
+    if plain_columns:
+        response = sheet.values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=[column_range(column) for column in plain_columns],
+            majorDimension='COLUMNS',
+            valueRenderOption='FORMATTED_VALUE'
+        ).execute()
+        for column_name, value_range in zip(plain_columns, response.get('valueRanges', [])):
+            values = value_range.get('values', [[]])
+            columns_values[column_name] = [_prepare_cell_text(str(value), remove_emonji) for value in values[0]]
 
-    # Check if the headers match the expected column names
-    for column_name, column_letter in columns_dict.items():
-        i = letter_to_index(column_letter)
-        if i < len(headers) and headers[i] != column_name:
-            logger.error(f"Column name mismatch at column {column_letter}: Expected '{column_name}', found '{headers[i]}'")
-
-    # Extract values and hyperlinks for specific columns
-    data = []
-    rows = sheet_data.get('rowData', [])
-    for row in rows:
-        row_values = row.get('values', [])
-        row_data = []
-        for column_name, column_letter in columns_dict.items():
-            col_index = letter_to_index(column_letter)
-            if col_index is not None and col_index < len(row_values):
-                cell = row_values[col_index]
+    if link_columns:
+        response = sheet.get(
+            spreadsheetId=spreadsheet_id,
+            ranges=[column_range(column) for column in link_columns],
+            fields='sheets.data.rowData.values(hyperlink,formattedValue)'
+        ).execute()
+        grid_data = response['sheets'][0].get('data', [])
+        for column_name, column_data in zip(link_columns, grid_data):
+            column_cells = []
+            for row in column_data.get('rowData', []):
+                cell = (row.get('values') or [{}])[0]
                 if 'hyperlink' in cell:
                     # If there is a hyperlink, add the URL
-                    row_data.append(cell['hyperlink'])
+                    column_cells.append(cell['hyperlink'])
                 else:
                     # Otherwise, add the cell text
-                    cell_text = cell.get('formattedValue', '') if 'formattedValue' in cell else ''
-                    cell_text = cell_text.strip()
-                    cell_text = remove_invisible_chars(cell_text, remove_emonji)
-                    row_data.append(cell_text)
-            else:
-                # If the column index is out of range or None, add an empty value
-                row_data.append('')
-
-        # Check if the row contains only empty strings
-        if not all(value == '' for value in row_data):
-            data.append(row_data)
-        else:
-            break  # Exit the loop if the row is completely empty
+                    column_cells.append(_prepare_cell_text(cell.get('formattedValue', ''), remove_emonji))
+            columns_values[column_name] = column_cells
+
+    # Check if the headers match the expected column names
+    for column_name, column_letter in columns_dict.items():
+        column_cells = columns_values.get(column_name, [])
+        header = column_cells[0].strip() if column_cells else ''
+        if column_cells and header != column_name:
+            logger.error(f"Column name mismatch at column {column_letter}: Expected '{column_name}', found '{header}'")
+
+    # Pad the columns to the same length and cut the data at the first completely empty row
+    rows_number = max((len(column_cells) for column_cells in columns_values.values()), default=0)
+    columns_data = {}
+    for column_name in columns_dict:
+        column_cells = columns_values.get(column_name, [])
+        columns_data[column_name] = column_cells + [''] * (rows_number - len(column_cells))
+    last_row = rows_number
+    for row_index in range(rows_number):
+        if all(columns_data[column_name][row_index] == '' for column_name in columns_dict):
+            last_row = row_index
+            break
 
     # Create DataFrame with specific columns
-    df = pd.DataFrame(data[1:], columns=columns_to_extract)
+    df = pd.DataFrame({column_name: columns_data[column_name][1:last_row] for column_name in columns_dict},
+                      columns=columns_to_extract)
     df = df.reset_index(drop=True)
     df['Row in Spreadsheets'] = df.index + 2
     return df
 
 
+# The allowed values sheet changes rarely, extractors running for many CVs in a row share one read
+ALLOWED_VALUES_CACHE_TTL = int(os.getenv("ALLOWED_VALUES_CACHE_TTL", 10 * 60))  # seconds
+_allowed_values_cache = {}
+_allowed_values_lock = threading.Lock()
+
+
+def read_allowed_values(columns, sheet_name='values'):
+    """
+    read_specific_columns for the allowed values sheet, cached for ALLOWED_VALUES_CACHE_TTL seconds.
+    Returns a copy of the DataFrame.
+    """
+    key = (sheet_name, tuple(columns))
+    with _allowed_values_lock:
+        cached = _allowed_values_cache.get(key)
+        if cached is None or time.time() - cached[0] > ALLOWED_VALUES_CACHE_TTL:
+            cached = (time.time(), read_specific_columns(list(columns), sheet_name))
+            _allowed_values_cache[key] = cached
+    return cached[1].copy()
+
+
 def convert_formula_with_column_names(formula_with_names: str, sheet_dict: dict) -> str:
     """
     Converts a formula with column names to a formula with column letters.
@@ -243,22 +310,91 @@ def convert_formula_with_column_names(formula_with_names: str, sheet_dict: dict)
         )
     return formula_with_names
 
+# Keep every values.batchUpdate request well below the recommended 2 MB payload
+WRITE_BATCH_MAX_BYTES = 1_000_000
+
+
+def _split_column_values(sheet_name, column_letter, first_row, values, max_bytes=WRITE_BATCH_MAX_BYTES):
+    """
+    Splits consecutive cells of one column into value ranges of at most max_bytes of JSON each.
+    """
+    value_ranges = []
+    chunk_start = 0
+    chunk_size = 0
+    for i, value in enumerate(values):
+        value_size = len(json.dumps(value, ensure_ascii=False)) + 4
+        if chunk_size + value_size > max_bytes and i > chunk_start:
+            value_ranges.append(_column_value_range(sheet_name, column_letter, first_row + chunk_start,
+                                                    values[chunk_start:i]))
+            chunk_start, chunk_size = i, 0
+        chunk_size += value_size
+    if chunk_start < len(values):
+        value_ranges.append(_column_value_range(sheet_name, column_letter, first_row + chunk_start,
+                                                values[chunk_start:]))
+    return value_ranges
+
+
+def _column_value_range(sheet_name, column_letter, first_row, values):
+    last_row = first_row + len(values) - 1
+    return {
+        'range': f"{sheet_name}!{column_letter}{first_row}:{column_letter}{last_row}",
+        'values': [[value] for value in values]
+    }
+
+
+def _changed_blocks(values, previous_values):
+    """
+    Yields (start, end) of the blocks of consecutive positions where values differ from previous_values.
+    """
+    start = None
+    for i, value in enumerate(values):
+        changed = i >= len(previous_values) or value != previous_values[i]
+        if changed and start is None:
+            start = i
+        elif not changed and start is not None:
+            yield start, i
+            start = None
+    if start is not None:
+        yield start, len(values)
+
+
+def _chunk_value_ranges(value_ranges, max_bytes=WRITE_BATCH_MAX_BYTES):
+    """
+    Groups value ranges into batches of at most max_bytes of JSON each.
+    """
+    batches, batch, batch_size = [], [], 0
+    for value_range in value_ranges:
+        range_size = len(json.dumps(value_range, ensure_ascii=False))
+        if batch and batch_size + range_size > max_bytes:
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(value_range)
+        batch_size += range_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
 def write_specific_columns(
     df,
     sheet_name=CANDIDATES_SHEET_NAME,
     service=None,
     rows_to_highlight=None,
     highlight_color=None,
-        spreadsheet_env_name='STAFF_SPREADSHEET_ID'
+        spreadsheet_env_name='STAFF_SPREADSHEET_ID',
+    previous_df=None
 ):
     """
     Writes each column from a DataFrame back to the Google Sheet according to the specified column letters.
-    Optionally highlights specified rows with a background color.
+    All columns (headers included) are sent with values.batchUpdate, split into requests of at most
+    WRITE_BATCH_MAX_BYTES. Optionally highlights specified rows with a background color.
 
     Args:
-    - df (pd.DataFrame): DataFrame containing the data to write.
+    - df (pd.DataFrame): DataFrame containing the data to write, row i goes to sheet row i + 2.
     - rows_to_highlight (list): List of row indices (0-based) to highlight.
     - highlight_color (dict): Color in RGB format, e.g., {'red': 1.0, 'green': 0.9, 'blue': 0.9}.
+    - previous_df (pd.DataFrame): The same columns as they were last read (e.g. from a snapshot).
+      If given, only the cells that changed are written and headers are left as they are.
     """
     if service is None:
         service = initialize_google_sheets_api()
@@ -271,32 +407,33 @@ def write_specific_columns(
     if highlight_color is None:
         highlight_color = {'red': 1.0, 'green': 1.0, 'blue': 0.0}
 
-    columns_dict = get_column_letters(df.columns, sheet_name, sheet=sheet)
-    # Update each column
+    columns_dict = get_column_letters(list(df.columns), sheet_name, sheet=sheet, spreadsheet_env_name=spreadsheet_env_name)
+    value_ranges = []
     for column_name, column_letter in columns_dict.items():
         if column_letter is None:
             raise ValueError(f"Column name '{column_name}' is invalid or not mapped in column_dict.")
 
-        # Update header
-        header_range = f"{sheet_name}!{column_letter}1"
-        header_update_body = {'values': [[column_name]]}
-        sheet.values().update(
-            spreadsheetId=spreadsheet_id,
-            range=header_range,
-            valueInputOption='RAW',
-            body=header_update_body
-        ).execute()
-
-        # Update data
         values = df[column_name].fillna('').apply(lambda x: _prepare_cell_value(x, columns_dict)).tolist()
-        range_to_update = f"{sheet_name}!{column_letter}2:{column_letter}{len(df) + 1}"
-        update_body = {'values': [[value] for value in values]}
-        sheet.values().update(
+        if previous_df is None:
+            # Header and data of the column in one range
+            value_ranges.extend(_split_column_values(sheet_name, column_letter, 1, [column_name] + values))
+        else:
+            previous_values = previous_df[column_name].fillna('').apply(
+                lambda x: _prepare_cell_value(x, columns_dict)).tolist()
+            for start, end in _changed_blocks(values, previous_values):
+                value_ranges.extend(_split_column_values(sheet_name, column_letter, start + 2, values[start:end]))
+
+    if not value_ranges:
+        logger.info(f"No changed cells to write to {sheet_name}")
+        return
+    batches = _chunk_value_ranges(value_ranges)
+    for batch in batches:
+        sheet.values().batchUpdate(
             spreadsheetId=spreadsheet_id,
-            range=range_to_update,
-            valueInputOption='RAW',
-            body=update_body
+            body={'valueInputOption': 'RAW', 'data': batch}
         ).execute()
+    logger.info(f"Wrote {len(value_ranges)} ranges of {len(columns_dict)} columns to {sheet_name} "
+                f"in {len(batches)} requests")
 
 
 def get_spreadsheet_id(sheet_name, sheet=None, spreadsheet_env_name='STAFF_SPREADSHEET_ID'):
@@ -310,6 +447,9 @@ def get_spreadsheet_id(sheet_name, sheet=None, spreadsheet_env_name='STAFF_SPREA
     Raises:
         ValueError: If sheet_name not found in the spreadsheet
     """
+    cache_key = (spreadsheet_env_name, sheet_name)
+    if cache_key in sheet_ids_cache:
+        return sheet_ids_cache[cache_key]
     try:
         spreadsheet_id = os.getenv(spreadsheet_env_name)
             
@@ -324,7 +464,8 @@ def get_spreadsheet_id(sheet_name, sheet=None, spreadsheet_env_name='STAFF_SPREA
         target_sheet = next((s for s in sheets if s['properties']['title'] == sheet_name), None)
         if not target_sheet:
             raise ValueError(f"Sheet '{sheet_name}' not found in the spreadsheet.")
-        return target_sheet['properties']['sheetId']
+        sheet_ids_cache[cache_key] = target_sheet['properties']['sheetId']
+        return sheet_ids_cache[cache_key]
     except Exception as e:
         logger.error(f"Error getting sheetId for '{sheet_name}': {str(e)}")
         raise e
@@ -350,6 +491,15 @@ def _prepare_cell_value(value, sheet_dict: dict = None):
     return str(value)
 
 
+def _shift_formula_rows(value, offset: int):
+    """
+    Shifts the row numbers of [Column name]N references in a formula written for row 2 to another row.
+    """
+    if offset == 0 or not isinstance(value, str) or not value.startswith('='):
+        return value
+    return re.sub(r'(\[[^\]]+\])(\d+)', lambda m: f"{m.group(1)}{int(m.group(2)) + offset}", value)
+
+
 def write_dict_to_sheet(data_dict, sheet_name, service=None, row_number=None, spreadsheet_env_name='STAFF_SPREADSHEET_ID'):
     """
     Writes dictionary data to a Google Sheet row, matching keys to column names.
@@ -449,6 +599,52 @@ def write_dict_to_sheet(data_dict, sheet_name, service=None, row_number=None, sp
         raise e
 
 
+def write_dicts_to_sheet(data_dicts, sheet_name, service=None, spreadsheet_env_name='STAFF_SPREADSHEET_ID'):
+    """
+    Inserts several rows at once: one insertDimension for all rows after the headers and one values.batchUpdate
+    (split by WRITE_BATCH_MAX_BYTES), matching keys to column names as write_dict_to_sheet does.
+    As with write_dict_to_sheet one by one, the last dict ends up in row 2. Formulas are written for row 2
+    ([Column name]2 references) and shifted to their rows.
+
+    Returns:
+        int: The number of inserted rows.
+    """
+    if not data_dicts:
+        return 0
+    if service is None:
+        service = initialize_google_sheets_api()
+    spreadsheet_id = os.getenv(spreadsheet_env_name)
+    sheet = service.spreadsheets()
+    sheet_dict = get_sheet_dict(sheet_name, sheet, spreadsheet_env_name)
+
+    updates = []
+    for position, data_dict in enumerate(data_dicts):
+        row_number = 2 + len(data_dicts) - 1 - position
+        for column_name, value in data_dict.items():
+            if column_name not in sheet_dict:
+                continue
+            value = _shift_formula_rows(value, row_number - 2)
+            updates.append({
+                'range': f"{sheet_name}!{sheet_dict[column_name]}{row_number}",
+                'values': [[_prepare_cell_value(value, sheet_dict)]]
+            })
+
+    gid = get_spreadsheet_id(sheet_name, sheet, spreadsheet_env_name)
+    sheet.batchUpdate(spreadsheetId=spreadsheet_id, body={'requests': [{
+        'insertDimension': {
+            'range': {'sheetId': gid, 'dimension': 'ROWS', 'startIndex': 1, 'endIndex': 1 + len(data_dicts)},
+            'inheritFromBefore': False
+        }
+    }]}).execute()
+    for batch in _chunk_value_ranges(updates):
+        sheet.values().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'valueInputOption': 'USER_ENTERED', 'data': batch}
+        ).execute()
+    logger.info(f"Inserted {len(data_dicts)} rows into {sheet_name}")
+    return len(data_dicts)
+
+
 def write_value_to_cell(
     value,
     sheet_name: str,
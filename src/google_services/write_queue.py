@@ -0,0 +1,293 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Union
+
+from dotenv import load_dotenv
+from googleapiclient.errors import HttpError
+
+from src.google_services.sheets import initialize_google_sheets_api, get_sheet_dict, get_spreadsheet_id, \
+    _prepare_cell_value, _shift_formula_rows
+from src.logger import logger
+
+load_dotenv()
+
+SHEET_WRITE_QUEUE_PATH = os.getenv("SHEET_WRITE_QUEUE_PATH", "cache/sheet_write_queue.sqlite")
+# Seconds the flusher waits after a new row so that rows arriving together go in one batch
+WRITE_QUEUE_COALESCE_DELAY = float(os.getenv("WRITE_QUEUE_COALESCE_DELAY", 2))
+WRITE_QUEUE_FLUSH_INTERVAL = float(os.getenv("WRITE_QUEUE_FLUSH_INTERVAL", 30))
+WRITE_QUEUE_MAX_ATTEMPTS = 8
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class SheetWriteQueue:
+    """
+    Durable write-behind queue for log and cache rows.
+    Rows are stored in a local SQLite journal and written by a background thread: all new rows of a sheet
+    go in with one insertDimension and one values.batchUpdate. Quota and server errors are retried later,
+    rows survive a restart.
+
+    Row numbers of in-place updates are resolved at flush time: every row the queue inserts at the top of
+    a sheet increments a per-sheet counter, and an update remembers the counter value at the time its row
+    number was read (see read_with_counter).
+    """
+
+    def __init__(self, path: str = SHEET_WRITE_QUEUE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pending_rows ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " spreadsheet_env_name TEXT NOT NULL,"
+            " sheet_name TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " row_number INTEGER,"
+            " inserted_before INTEGER,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL DEFAULT 0)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS inserted_rows ("
+            " spreadsheet_env_name TEXT NOT NULL,"
+            " sheet_name TEXT NOT NULL,"
+            " counter INTEGER NOT NULL,"
+            " PRIMARY KEY (spreadsheet_env_name, sheet_name))"
+        )
+        # _db_lock serializes the journal, _flush_lock is held while rows are moved in the sheets
+        self._db_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._flusher = None
+
+    def _execute(self, query: str, params=()) -> list:
+        with self._db_lock:
+            return self._connection.execute(query, params).fetchall()
+
+    # Producer side
+
+    def insert_row(self, sheet_name: str, values: Union[list, dict],
+                   spreadsheet_env_name: str = 'STAFF_SPREADSHEET_ID', value_input_option: str = None):
+        """
+        Queues a new row to be inserted at row 2 (after the headers).
+        values is either a list written from column A (RAW by default) or a dict keyed by column names
+        (USER_ENTERED by default, formulas may use [Column name]2 references).
+
+        Returns:
+        - int: The inserted rows count right after this row is inserted, the row can be updated later
+          with update_row(sheet_name, 2, values, inserted_before=<this value>).
+        """
+        if value_input_option is None:
+            value_input_option = 'USER_ENTERED' if isinstance(values, dict) else 'RAW'
+        return self._enqueue(spreadsheet_env_name, sheet_name, values, value_input_option)
+
+    def insert_rows(self, sheet_name: str, rows: list, spreadsheet_env_name: str = 'STAFF_SPREADSHEET_ID',
+                    value_input_option: str = None):
+        """
+        Queues several new rows in one transaction, so the flusher inserts them all with one batch.
+        As with insert_row one by one, the last row ends up in row 2.
+
+        Returns:
+        - int: The inserted rows count right after the last row is inserted.
+        """
+        if not rows:
+            return self.inserted_rows_count(sheet_name, spreadsheet_env_name)
+        if value_input_option is None:
+            value_input_option = 'USER_ENTERED' if isinstance(rows[0], dict) else 'RAW'
+        return self._enqueue(spreadsheet_env_name, sheet_name, rows, value_input_option, many=True)
+
+    def update_row(self, sheet_name: str, row_number: int, values: list, inserted_before: int,
+                   spreadsheet_env_name: str = 'STAFF_SPREADSHEET_ID', value_input_option: str = 'RAW'):
+        """
+        Queues an update of an existing row, written from column A.
+        inserted_before is inserted_rows_count() taken before row_number was read from the sheet.
+        """
+        self._enqueue(spreadsheet_env_name, sheet_name, values, value_input_option, row_number, inserted_before)
+
+    def inserted_rows_count(self, sheet_name: str, spreadsheet_env_name: str = 'STAFF_SPREADSHEET_ID') -> int:
+        rows = self._execute(
+            "SELECT counter FROM inserted_rows WHERE spreadsheet_env_name = ? AND sheet_name = ?",
+            (spreadsheet_env_name, sheet_name)
+        )
+        return rows[0][0] if rows else 0
+
+    def read_with_counter(self, sheet_name: str, read_function: Callable,
+                          spreadsheet_env_name: str = 'STAFF_SPREADSHEET_ID'):
+        """
+        Calls read_function while no rows are inserted into the sheet.
+        Returns (inserted_rows_count, result) to pass to update_row for row numbers taken from the result.
+        """
+        with self._flush_lock:
+            return self.inserted_rows_count(sheet_name, spreadsheet_env_name), read_function()
+
+    def _enqueue(self, spreadsheet_env_name, sheet_name, values, value_input_option,
+                 row_number=None, inserted_before=None, many=False):
+        payloads = [json.dumps({"values": row_values, "value_input_option": value_input_option},
+                               ensure_ascii=False, default=str)
+                    for row_values in (values if many else [values])]
+        with self._db_lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT INTO pending_rows (spreadsheet_env_name, sheet_name, payload, row_number, inserted_before)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(spreadsheet_env_name, sheet_name, payload, row_number, inserted_before) for payload in payloads]
+            )
+            # Rows are inserted in queue order, so a new row is inserted after the counter and the new rows before it
+            inserted_after = self._connection.execute(
+                "SELECT COALESCE((SELECT counter FROM inserted_rows"
+                "  WHERE spreadsheet_env_name = ? AND sheet_name = ?), 0)"
+                " + (SELECT COUNT(*) FROM pending_rows"
+                "  WHERE spreadsheet_env_name = ? AND sheet_name = ? AND row_number IS NULL)",
+                (spreadsheet_env_name, sheet_name, spreadsheet_env_name, sheet_name)
+            ).fetchone()[0]
+        self.start()
+        self._wake_up.set()
+        return inserted_after
+
+    # Flusher side
+
+    def start(self):
+        if self._flusher is not None:
+            return
+        with self._db_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="sheet-write-queue", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake_up.wait(WRITE_QUEUE_FLUSH_INTERVAL)
+            if self._wake_up.is_set():
+                time.sleep(WRITE_QUEUE_COALESCE_DELAY)
+                self._wake_up.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Sheet write queue flush failed: {e}")
+
+    def pending_count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM pending_rows")[0][0]
+
+    def flush(self):
+        """
+        Writes all due rows, one group per spreadsheet and sheet.
+        """
+        with self._flush_lock:
+            groups = self._execute(
+                "SELECT DISTINCT spreadsheet_env_name, sheet_name FROM pending_rows WHERE next_attempt_at <= ?",
+                (time.time(),)
+            )
+            for spreadsheet_env_name, sheet_name in groups:
+                try:
+                    self._flush_sheet(spreadsheet_env_name, sheet_name)
+                except Exception as e:
+                    self._postpone(spreadsheet_env_name, sheet_name, e)
+
+    def _flush_sheet(self, spreadsheet_env_name: str, sheet_name: str) -> int:
+        # All rows of the sheet go together, so rows are always inserted in queue order
+        rows = self._execute(
+            "SELECT id, payload, row_number, inserted_before FROM pending_rows"
+            " WHERE spreadsheet_env_name = ? AND sheet_name = ? ORDER BY id",
+            (spreadsheet_env_name, sheet_name)
+        )
+        if not rows:
+            return 0
+        service = initialize_google_sheets_api()
+        sheet = service.spreadsheets()
+        spreadsheet_id = os.getenv(spreadsheet_env_name)
+
+        # 1. Insert all new rows at once, the newest one ends up in row 2 as with one-by-one inserts
+        new_rows = [row for row in rows if row[2] is None]
+        if new_rows:
+            gid = get_spreadsheet_id(sheet_name, sheet, spreadsheet_env_name)
+            sheet.batchUpdate(spreadsheetId=spreadsheet_id, body={'requests': [{
+                'insertDimension': {
+                    'range': {'sheetId': gid, 'dimension': 'ROWS', 'startIndex': 1, 'endIndex': 1 + len(new_rows)},
+                    'inheritFromBefore': False
+                }
+            }]}).execute()
+            counter = self.inserted_rows_count(sheet_name, spreadsheet_env_name) + len(new_rows)
+            # The rows are now placed, a failure of the values write below retries only the values
+            with self._db_lock, self._connection:
+                self._connection.execute("BEGIN")
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO inserted_rows (spreadsheet_env_name, sheet_name, counter)"
+                    " VALUES (?, ?, ?)",
+                    (spreadsheet_env_name, sheet_name, counter)
+                )
+                self._connection.executemany(
+                    "UPDATE pending_rows SET row_number = ?, inserted_before = ? WHERE id = ?",
+                    [(2 + len(new_rows) - 1 - position, counter, row[0]) for position, row in enumerate(new_rows)]
+                )
+            rows = self._execute(
+                "SELECT id, payload, row_number, inserted_before FROM pending_rows WHERE id IN (%s) ORDER BY id"
+                % ",".join("?" * len(rows)), [row[0] for row in rows]
+            )
+
+        # 2. Write the values of all placed rows, shifted by the rows inserted after they were placed
+        counter = self.inserted_rows_count(sheet_name, spreadsheet_env_name)
+        updates_by_option = defaultdict(list)
+        sheet_dict = None
+        for row_id, payload, row_number, inserted_before in rows:
+            payload = json.loads(payload)
+            actual_row = row_number + counter - inserted_before
+            values = payload["values"]
+            if isinstance(values, dict):
+                if sheet_dict is None:
+                    sheet_dict = get_sheet_dict(sheet_name, sheet, spreadsheet_env_name)
+                for column_name, value in values.items():
+                    if column_name not in sheet_dict:
+                        continue
+                    value = _shift_formula_rows(value, actual_row - 2)
+                    updates_by_option[payload["value_input_option"]].append({
+                        'range': f"{sheet_name}!{sheet_dict[column_name]}{actual_row}",
+                        'values': [[_prepare_cell_value(value, sheet_dict)]]
+                    })
+            else:
+                updates_by_option[payload["value_input_option"]].append({
+                    'range': f"{sheet_name}!A{actual_row}",
+                    'values': [values]
+                })
+        for value_input_option, updates in updates_by_option.items():
+            sheet.values().batchUpdate(
+                spreadsheetId=spreadsheet_id,
+                body={'valueInputOption': value_input_option, 'data': updates}
+            ).execute()
+
+        with self._db_lock:
+            self._connection.executemany("DELETE FROM pending_rows WHERE id = ?", [(row[0],) for row in rows])
+        logger.info(f"Sheet write queue: wrote {len(rows)} rows to {sheet_name} ({len(new_rows)} inserted)")
+        return len(rows)
+
+    def _postpone(self, spreadsheet_env_name: str, sheet_name: str, error: Exception):
+        status = getattr(getattr(error, 'resp', None), 'status', None)
+        retryable = not isinstance(error, HttpError) or int(status or 0) in RETRYABLE_STATUS_CODES
+        attempts = self._execute(
+            "SELECT MAX(attempts) FROM pending_rows WHERE spreadsheet_env_name = ? AND sheet_name = ?",
+            (spreadsheet_env_name, sheet_name)
+        )[0][0] + 1
+        if not retryable or attempts >= WRITE_QUEUE_MAX_ATTEMPTS:
+            logger.error(f"Sheet write queue: dropping rows for {sheet_name} after {attempts} attempts: {error}")
+            self._execute(
+                "DELETE FROM pending_rows WHERE spreadsheet_env_name = ? AND sheet_name = ?",
+                (spreadsheet_env_name, sheet_name)
+            )
+            return
+        delay = min(600, 5 * 2 ** attempts)
+        logger.warning(f"Sheet write queue: writing to {sheet_name} failed, retrying in {delay} sec: {error}")
+        self._execute(
+            "UPDATE pending_rows SET attempts = ?, next_attempt_at = ?"
+            " WHERE spreadsheet_env_name = ? AND sheet_name = ?",
+            (attempts, time.time() + delay, spreadsheet_env_name, sheet_name)
+        )
+
+
+sheet_write_queue = SheetWriteQueue()
+# Rows left from a previous run are written as soon as the module is loaded
+if sheet_write_queue.pending_count():
+    sheet_write_queue.start()
@@ -9,20 +9,14 @@ from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
 
 from src.candidate_matching.candidates_processing.input_candidates import check_and_update_past_available_dates
-from src.google_services.sheets import read_specific_columns, initialize_google_sheets_api
+from src.google_services.candidates_snapshot import candidates_snapshot
 from src.bot.authorization import  auth_manager
 from src.leadgen.leadgen_reminder import leadgen_reminder
 
 
 def prepare_google_sheets():
-    service = initialize_google_sheets_api()
-    # Define the columns to extract by name
-    columns_to_extract = [
-        'First Name', 'Last Name', 'LVL of engagement', 'Seniority', 'Main Roles', 'Additional Roles',
-        'Stack', 'Industries', 'Expertise', 'Location'
-    ]
-    # Get specific columns with hyperlinks
-    df = read_specific_columns(columns_to_extract, service=service)
+    # Load the candidates snapshot at startup so the first request does not wait for the sheet
+    candidates_snapshot.get_snapshot()
     # add_embeddings_column(df, write_columns=True)
 
 